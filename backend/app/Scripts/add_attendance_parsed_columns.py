@@ -0,0 +1,45 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.models.models import Base
+
+def main():
+    """振替・欠席テーブルにパース済みの日時・年度の列を追加し、集計テーブルを作成する"""
+    print("振替・欠席のパース済みカラム追加を開始します...")
+
+    try:
+        # attendance_counts テーブルが無ければ作成
+        Base.metadata.create_all(bind=engine)
+
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE transfer_requests ADD COLUMN IF NOT EXISTS timestamp_at TIMESTAMP WITH TIME ZONE;"))
+            conn.execute(text("ALTER TABLE transfer_requests ADD COLUMN IF NOT EXISTS original_date_at TIMESTAMP WITH TIME ZONE;"))
+            conn.execute(text("ALTER TABLE transfer_requests ADD COLUMN IF NOT EXISTS academic_year INTEGER;"))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_transfer_requests_pending
+                ON transfer_requests (is_completed, academic_year, timestamp_at);
+            """))
+            print("✅ transfer_requests に timestamp_at / original_date_at / academic_year を追加しました！")
+
+            conn.execute(text("ALTER TABLE absence_reports ADD COLUMN IF NOT EXISTS timestamp_at TIMESTAMP WITH TIME ZONE;"))
+            conn.execute(text("ALTER TABLE absence_reports ADD COLUMN IF NOT EXISTS academic_year INTEGER;"))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_absence_reports_year_timestamp
+                ON absence_reports (academic_year, timestamp_at);
+            """))
+            print("✅ absence_reports に timestamp_at / academic_year を追加しました！")
+
+            # 新しい列は次回の同期で全行に入る（行のハッシュが変わるため）。
+            # シート全体が前回と同じでもスキップされないよう、前回の同期状態を消しておく
+            conn.execute(text("DELETE FROM sync_states WHERE key = 'attendance_sheets';"))
+            print("✅ 次回の同期で全行を取り込み直すよう設定しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.models.models import Base
+
+def main():
+    """振替・欠席テーブルに差分同期用の content_hash 列と row_number のユニーク制約を追加する"""
+    print("差分同期用のカラム追加を開始します...")
+
+    try:
+        # sync_states テーブルが無ければ作成
+        Base.metadata.create_all(bind=engine)
+
+        with engine.begin() as conn:
+            for table in ["transfer_requests", "absence_reports"]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);"))
+                # 洗い替え時代の重複行を片付けてからユニーク制約（同じ行番号は新しい方を残す）
+                conn.execute(text(f"""
+                    DELETE FROM {table} a USING {table} b
+                    WHERE a.row_number = b.row_number AND a.id < b.id;
+                """))
+                conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_row_number ON {table} (row_number);"))
+                print(f"✅ {table} に content_hash 列と row_number のユニーク制約を追加しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
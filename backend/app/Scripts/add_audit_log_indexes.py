@@ -0,0 +1,30 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+
+# 監査ログ一覧のカーソルページング・絞り込み用
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_timestamp_id ON audit_logs (timestamp, id);",
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_user_timestamp_id ON audit_logs (user_id, timestamp, id);",
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_action_timestamp_id ON audit_logs (action, timestamp, id);",
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_branch_timestamp_id ON audit_logs (branch_id, timestamp, id);",
+]
+
+def main():
+    print("インデックスの作成を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            for sql in INDEXES:
+                conn.execute(text(sql))
+            print("✅ audit_logsテーブルにインデックスを作成しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
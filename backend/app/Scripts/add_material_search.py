@@ -0,0 +1,56 @@
+# backend/app/Scripts/add_material_search.py
+
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine, SessionLocal
+from app.models.models import TeachingMaterial
+from app.services.material_files import open_material_file
+from app.services.material_search import extract_pdf_text, refresh_search_vector
+
+def main():
+    """
+    教材の全文検索用に teaching_materials に content_text / search_vector 列と GIN インデックスを追加し、
+    既存の教材の PDF 本文を読み取って検索用データを作る（1件ごとに commit）。
+    何度実行しても問題ない（search_vector が空の教材だけを処理する）。
+    migrate_material_files_to_blob_store.py を先に実行しておくこと（教材の列の追加）。
+    """
+    print("教材の全文検索の準備を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS content_text TEXT;"))
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_teaching_materials_search_vector "
+                "ON teaching_materials USING gin (search_vector);"
+            ))
+        print("✅ teaching_materialsテーブルに content_text / search_vector 列とインデックスを追加しました")
+
+        db = SessionLocal()
+        try:
+            ids = [row[0] for row in db.query(TeachingMaterial.id).filter(TeachingMaterial.search_vector.is_(None)).order_by(TeachingMaterial.id)]
+            print(f"  登録する教材: {len(ids)}件")
+            for i, material_id in enumerate(ids, start=1):
+                material = db.query(TeachingMaterial).filter(TeachingMaterial.id == material_id).first()
+                try:
+                    with open_material_file(material) as f:
+                        material.content_text = extract_pdf_text(f)
+                except FileNotFoundError:
+                    print(f"  ⚠️ 教材 {material.id} のファイルが見つかりません（タイトル・タグ・メモだけ登録します）")
+                refresh_search_vector(material)
+                db.commit()
+                print(f"  {i} / {len(ids)} 件 完了")
+        finally:
+            db.close()
+
+        print(f"✅ 完了: {len(ids)}件の教材を検索できるようにしました。")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+
+def main():
+    """通知テーブルに再送防止用の idempotency_key 列と (user_id, idempotency_key) のユニーク制約を追加する"""
+    print("通知の idempotency_key 追加を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE notifications ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);"))
+            # 既存の通知はキーが NULL なので制約に引っかからない
+            conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_user_idempotency
+                ON notifications (user_id, idempotency_key);
+            """))
+            print("✅ notificationsテーブルに idempotency_key 列とユニーク制約を追加しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
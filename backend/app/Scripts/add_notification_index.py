@@ -0,0 +1,22 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+
+def main():
+    print("インデックスの作成を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            # 講師ごとの未読通知（SSE の追いつき・未読一覧）で使う
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notifications_user_unread ON notifications (user_id, is_read, id);"))
+            print("✅ notificationsテーブルに『ix_notifications_user_unread』インデックスを作成しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# backend/app/Scripts/add_report_job_heartbeat.py
+
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+
+def main():
+    """一括レポート作成ジョブに、止まったジョブを見つけて再開するための heartbeat_at 列を追加する"""
+    print("report_jobs の heartbeat_at 追加を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE report_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;"))
+            # 既存の実行中のジョブは heartbeat が NULL なので、次のスケジューラー実行で再開される
+            print("✅ report_jobsテーブルに heartbeat_at 列を追加しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+
+def main():
+    print("インデックスの作成を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            # 校舎単位の学習時間サマリー（管理画面）で使う
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_students_school_grade ON students (school, grade);"))
+            print("✅ studentsテーブルに『ix_students_school_grade』インデックスを作成しました！")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
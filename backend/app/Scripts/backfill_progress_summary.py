@@ -0,0 +1,53 @@
+# backend/app/Scripts/backfill_progress_summary.py
+
+import sys
+import os
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import SessionLocal, engine
+from app.models.models import Base, Student
+from app.services.progress_aggregation import ensure_student_summaries, refresh_student_summaries
+
+BATCH_SIZE = 500
+
+def backfill_progress_summary():
+    """全生徒の student_progress_summary を作り直す（導入時・不整合時に実行）"""
+    # テーブルが無ければ作成
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        student_ids = [row[0] for row in db.query(Student.id).order_by(Student.id).all()]
+        for i in range(0, len(student_ids), BATCH_SIZE):
+            batch = student_ids[i:i + BATCH_SIZE]
+            refresh_student_summaries(db, batch)
+            db.commit()
+            print(f"  {min(i + BATCH_SIZE, len(student_ids))} / {len(student_ids)} 名 完了")
+
+        print(f"✅ 完了: {len(student_ids)}名分の進捗集計を作成しました。")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ エラーが発生しました: {e}")
+    finally:
+        db.close()
+
+def backfill_missing_summaries():
+    """進捗があるのに集計が無い生徒（導入前のデータなど）の分だけ作る（既存の集計はそのまま）"""
+    db = SessionLocal()
+    try:
+        created = ensure_student_summaries(db)
+        db.commit()
+        print(f"✅ 完了: 集計が無かった{created}名分の進捗集計を作成しました。")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ エラーが発生しました: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--missing":
+        backfill_missing_summaries()
+    else:
+        backfill_progress_summary()
@@ -0,0 +1,38 @@
+# backend/app/Scripts/backfill_user_progress_activity.py
+
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.models.models import Base
+
+def backfill_user_progress_activity():
+    """既存の監査ログから、講師ごとの最終進捗操作日時（user_last_progress_activity）を作り直す"""
+    # テーブルが無ければ作成
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM user_last_progress_activity;"))
+            result = conn.execute(text("""
+                INSERT INTO user_last_progress_activity (user_id, last_progress_at, last_action)
+                SELECT l.user_id, l.timestamp, l.action
+                FROM audit_logs l
+                JOIN (
+                    SELECT user_id, MAX(id) AS last_id
+                    FROM audit_logs
+                    WHERE user_id IS NOT NULL AND action LIKE '%PROGRESS%' AND timestamp IS NOT NULL
+                    GROUP BY user_id
+                ) latest ON latest.last_id = l.id
+                JOIN users u ON u.id = l.user_id;
+            """))
+            print(f"✅ 完了: {result.rowcount}名分の最終進捗操作日時を作成しました。")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    backfill_user_progress_activity()
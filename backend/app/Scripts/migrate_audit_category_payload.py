@@ -0,0 +1,68 @@
+# backend/app/Scripts/migrate_audit_category_payload.py
+
+import sys
+import os
+from sqlalchemy import text, bindparam
+from sqlalchemy.dialects.postgresql import JSONB
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.models.models import AuditCategory
+from app.services.audit_writer import categorize_action, parse_details
+
+BATCH_SIZE = 1000
+
+def migrate_audit_category_payload():
+    """
+    audit_logs に category（enum）と payload（JSONB）を追加し、既存の行を埋める。
+    details が JSON 文字列ならそのまま payload に、category は action 名から決める。
+    """
+    category_values = ", ".join(f"'{c.value}'" for c in AuditCategory)
+
+    try:
+        # 1. 列とenum型を追加
+        with engine.begin() as conn:
+            conn.execute(text(f"""
+                DO $$ BEGIN
+                    CREATE TYPE audit_category AS ENUM ({category_values});
+                EXCEPTION WHEN duplicate_object THEN NULL;
+                END $$;
+            """))
+            conn.execute(text("ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS category audit_category;"))
+            conn.execute(text("ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS payload JSONB;"))
+        print("✅ category / payload 列を追加しました")
+
+        # 2. 既存の行を BATCH_SIZE 件ずつ埋める
+        update = text(
+            "UPDATE audit_logs SET category = CAST(:category AS audit_category), payload = :payload WHERE id = :id"
+        ).bindparams(bindparam("payload", type_=JSONB))
+        last_id = 0
+        total = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(text(
+                    "SELECT id, action, details FROM audit_logs WHERE id > :last_id AND category IS NULL ORDER BY id LIMIT :limit"
+                ), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+                if not rows:
+                    break
+                conn.execute(update, [
+                    {"id": row.id, "category": categorize_action(row.action).value, "payload": parse_details(row.details)}
+                    for row in rows
+                ])
+            last_id = rows[-1].id
+            total += len(rows)
+            print(f"  {total} 件 完了")
+
+        # 3. インデックス
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_category_timestamp_id ON audit_logs (category, timestamp, id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_payload_gin ON audit_logs USING gin (payload);"))
+
+        print(f"✅ 完了: {total}件の監査ログを移行しました。")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    migrate_audit_category_payload()
@@ -0,0 +1,62 @@
+# backend/app/Scripts/migrate_material_files_to_blob_store.py
+
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.services.blob_store import blob_store
+from app.services.material_files import build_material_preview, store_blob
+
+def main():
+    """
+    教材PDFを uploaded_materials/（元のファイル名で保存）から blob_store に移す。
+    1件ずつ blob_store に保存 → blob_sha256 / file_size / original_filename を入れて file_path を NULL にし（1件ごとに commit）、
+    ページ数とサムネイルを作る。途中で止めても、もう一度実行すれば残りの教材から続きを移す。
+    """
+    print("教材ファイルの移行を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS original_filename VARCHAR;"))
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS blob_sha256 VARCHAR(64);"))
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS file_size INTEGER;"))
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS page_count INTEGER;"))
+            conn.execute(text("ALTER TABLE teaching_materials ADD COLUMN IF NOT EXISTS thumbnail_sha256 VARCHAR(64);"))
+            conn.execute(text("ALTER TABLE teaching_materials ALTER COLUMN file_path DROP NOT NULL;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_teaching_materials_blob_sha256 ON teaching_materials (blob_sha256);"))
+        print("✅ teaching_materialsテーブルに blob_sha256 / file_size / page_count などの列を追加しました")
+
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, file_path FROM teaching_materials WHERE blob_sha256 IS NULL AND file_path IS NOT NULL ORDER BY id"
+            )).all()
+        print(f"  移行するファイル: {len(rows)}件")
+
+        moved = 0
+        for i, (material_id, file_path) in enumerate(rows, start=1):
+            if not os.path.exists(file_path):
+                print(f"  ⚠️ ファイルが見つかりません（教材 {material_id}）: {file_path}")
+                continue
+            with open(file_path, "rb") as f, engine.begin() as conn:
+                blob = store_blob(conn, f)
+                conn.execute(text("""
+                    UPDATE teaching_materials
+                    SET blob_sha256 = :sha256, file_size = :size, original_filename = :filename, file_path = NULL
+                    WHERE id = :id AND file_path = :file_path
+                """), {"sha256": blob.sha256, "size": blob.size, "filename": os.path.basename(file_path),
+                       "id": material_id, "file_path": file_path})
+            build_material_preview(material_id)
+            moved += 1
+            print(f"  {i} / {len(rows)} 件 完了")
+
+        print(f"✅ 完了: {moved}件の教材ファイルを blob_store（{blob_store.__class__.__name__}）に移しました。")
+        print("   移行が済んだら uploaded_materials/ ディレクトリは削除して構いません。")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# backend/app/Scripts/migrate_route_files_to_blob_store.py
+
+import io
+import sys
+import os
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.db.database import engine
+from app.services.blob_store import blob_store
+from app.services.material_files import store_blob
+
+def main():
+    """
+    ルート表の PDF を root_tables.file_content から blob_store に移す。
+    1行ずつ blob_store に保存 → blob_sha256 / file_size を入れて file_content を NULL にする（1行ごとに commit）。
+    途中で止めても、もう一度実行すれば残りの行から続きを移す。
+    """
+    print("ルート表のファイルの移行を開始します...")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE root_tables ADD COLUMN IF NOT EXISTS blob_sha256 VARCHAR(64);"))
+            conn.execute(text("ALTER TABLE root_tables ADD COLUMN IF NOT EXISTS file_size INTEGER;"))
+            conn.execute(text("ALTER TABLE root_tables ALTER COLUMN file_content DROP NOT NULL;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_root_tables_blob_sha256 ON root_tables (blob_sha256);"))
+        print("✅ root_tablesテーブルに blob_sha256 / file_size 列を追加しました")
+
+        with engine.connect() as conn:
+            ids = [row[0] for row in conn.execute(text(
+                "SELECT id FROM root_tables WHERE file_content IS NOT NULL ORDER BY id"
+            ))]
+        print(f"  移行するファイル: {len(ids)}件")
+
+        for i, file_id in enumerate(ids, start=1):
+            # 1件ずつ読む（全部のPDFを一度にメモリに載せない）
+            with engine.begin() as conn:
+                content = conn.execute(
+                    text("SELECT file_content FROM root_tables WHERE id = :id FOR UPDATE"), {"id": file_id}
+                ).scalar()
+                if content is None:
+                    continue
+                blob = store_blob(conn, io.BytesIO(bytes(content)))
+                conn.execute(text("""
+                    UPDATE root_tables SET blob_sha256 = :sha256, file_size = :size, file_content = NULL
+                    WHERE id = :id
+                """), {"sha256": blob.sha256, "size": blob.size, "id": file_id})
+            print(f"  {i} / {len(ids)} 件 完了")
+
+        print(f"✅ 完了: {len(ids)}件のファイルを blob_store（{blob_store.__class__.__name__}）に移しました。")
+        print("   テーブルの領域を OS に返すには、メンテナンス時に VACUUM FULL root_tables; を実行してください。")
+    except Exception as e:
+        print(f"❌ エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# backend/app/Scripts/partition_audit_logs.py
+
+import sys
+import os
+from datetime import datetime
+from sqlalchemy import text
+
+# appモジュールを読み込めるようにパスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import AuditLog, AuditLogArchive
+from app.services.audit_archive import _add_months, _is_partitioned, _month_start, create_month_partition
+
+COLUMNS = "id, user_id, action, category, branch_id, details, payload, timestamp"
+
+def partition_audit_logs():
+    """
+    既存の audit_logs（通常のテーブル）を、timestamp で月ごとに分割したパーティションテーブルに作り直す。
+    ※ 先に migrate_audit_category_payload.py を実行しておくこと
+    """
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            print("❌ パーティション分割は PostgreSQL のみ対応しています。")
+            return
+        if _is_partitioned(db):
+            print("✅ audit_logs はすでにパーティション分割されています。")
+            return
+
+        columns = {row[0] for row in db.execute(text(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'audit_logs'"
+        ))}
+        if not {"category", "payload"} <= columns:
+            print("❌ 先に migrate_audit_category_payload.py を実行してください。")
+            return
+
+        # 1. 既存テーブルを退避（インデックス名・シーケンス名がぶつからないよう外しておく）
+        db.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_legacy"))
+        db.execute(text("ALTER SEQUENCE IF EXISTS audit_logs_id_seq RENAME TO audit_logs_legacy_id_seq"))
+        db.execute(text("ALTER TABLE audit_logs_legacy DROP CONSTRAINT IF EXISTS audit_logs_pkey"))
+        index_names = [row[0] for row in db.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'audit_logs_legacy'"
+        ))]
+        for name in index_names:
+            db.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+        # 2. パーティションテーブルを作成し、データのある月〜先の月までのパーティションを用意
+        AuditLog.__table__.create(db.connection(), checkfirst=True)
+        AuditLogArchive.__table__.create(db.connection(), checkfirst=True)
+        db.execute(text("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+
+        # timestamp が空の行は主キーにできない。1970-01-01 などにすると一覧の並び（DB → アーカイブの順）が
+        # 崩れるので、直前のIDの日時（先頭なら直後のIDの日時）で埋める
+        filled = db.execute(text("""
+            UPDATE audit_logs_legacy l SET timestamp = f.ts
+            FROM (
+                SELECT id, COALESCE(
+                    MAX(timestamp) OVER (ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW),
+                    MIN(timestamp) OVER (ORDER BY id ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING),
+                    now() AT TIME ZONE 'UTC'
+                ) AS ts
+                FROM audit_logs_legacy
+            ) f
+            WHERE l.id = f.id AND l.timestamp IS NULL
+        """)).rowcount
+        if filled:
+            print(f"  timestamp が空の {filled}件を前後のIDの日時で埋めました")
+
+        oldest = db.execute(text("SELECT MIN(timestamp) FROM audit_logs_legacy")).scalar() or datetime.utcnow()
+        month = _month_start(oldest)
+        last_month = _add_months(_month_start(datetime.utcnow()), settings.AUDIT_PARTITION_MONTHS_AHEAD)
+        while month <= last_month:
+            create_month_partition(db, month)
+            month = _add_months(month, 1)
+
+        # 3. データを移し替え
+        result = db.execute(text(f"""
+            INSERT INTO audit_logs ({COLUMNS})
+            SELECT {COLUMNS} FROM audit_logs_legacy
+        """))
+        db.execute(text("SELECT setval('audit_logs_id_seq', COALESCE((SELECT MAX(id) FROM audit_logs), 0) + 1, false)"))
+        db.execute(text("DROP TABLE audit_logs_legacy"))
+        db.commit()
+
+        print(f"✅ 完了: {result.rowcount}件の監査ログを月別パーティションに移しました。")
+        print(f"   （{settings.AUDIT_ARCHIVE_AFTER_MONTHS}ヶ月より前の月は、次回のスケジューラー実行時にアーカイブされます）")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ エラーが発生しました: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    partition_audit_logs()
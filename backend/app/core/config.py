@@ -15,6 +15,45 @@ class Settings(BaseSettings):
     # External API Key
     FORM_API_KEY: str = os.getenv("FORM_API_KEY", "YOUR_SECRET_API_KEY")
 
+    # Audit log writer
+    # true にするとキューを使わずその場で書き込む（テスト用）
+    AUDIT_LOG_SYNC: bool = os.getenv("AUDIT_LOG_SYNC", "false").lower() == "true"
+    AUDIT_FLUSH_INTERVAL_MS: int = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "500"))
+    AUDIT_FLUSH_BATCH_SIZE: int = int(os.getenv("AUDIT_FLUSH_BATCH_SIZE", "200"))
+
+    # Audit log partitions / archive
+    # 何ヶ月先までパーティションを作っておくか
+    AUDIT_PARTITION_MONTHS_AHEAD: int = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "2"))
+    # 何ヶ月より前の月をファイルに退避するか
+    AUDIT_ARCHIVE_AFTER_MONTHS: int = int(os.getenv("AUDIT_ARCHIVE_AFTER_MONTHS", "12"))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+
+    # PDF rendering
+    # PDF作成専用のプロセス数と、それに加えて待たせておける件数（超えたら 503 を返す）
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "2"))
+    PDF_QUEUE_LIMIT: int = int(os.getenv("PDF_QUEUE_LIMIT", "8"))
+    PDF_RETRY_AFTER_SECONDS: int = int(os.getenv("PDF_RETRY_AFTER_SECONDS", "10"))
+    # 一括レポート作成ジョブの出力先と、1ジョブの最大人数、実行中のジョブが止まったとみなすまでの秒数
+    REPORT_JOB_DIR: str = os.getenv("REPORT_JOB_DIR", "report_jobs")
+    REPORT_JOB_MAX_STUDENTS: int = int(os.getenv("REPORT_JOB_MAX_STUDENTS", "1000"))
+    REPORT_JOB_STALE_SECONDS: int = int(os.getenv("REPORT_JOB_STALE_SECONDS", "120"))
+    # 作成済みレポートPDFのキャッシュ（0 で無効）
+    REPORT_CACHE_DIR: str = os.getenv("REPORT_CACHE_DIR", "report_cache")
+    REPORT_CACHE_MAX_MB: int = int(os.getenv("REPORT_CACHE_MAX_MB", "512"))
+
+    # CSV import jobs
+    # バックグラウンドのインポートのファイル置き場と、実行中のジョブが止まったとみなすまでの秒数
+    IMPORT_JOB_DIR: str = os.getenv("IMPORT_JOB_DIR", "import_jobs")
+    IMPORT_JOB_STALE_SECONDS: int = int(os.getenv("IMPORT_JOB_STALE_SECONDS", "120"))
+
+    # File storage
+    # ルート表などのファイル本体の置き場（SHA-256 で重複を除く）。今は local のみ
+    BLOB_STORE_BACKEND: str = os.getenv("BLOB_STORE_BACKEND", "local")
+    BLOB_STORE_DIR: str = os.getenv("BLOB_STORE_DIR", "blob_store")
+    # 教材PDFの1ファイルの上限と、一覧用サムネイル（1ページ目）の横幅
+    MATERIAL_UPLOAD_MAX_MB: int = int(os.getenv("MATERIAL_UPLOAD_MAX_MB", "50"))
+    MATERIAL_THUMBNAIL_WIDTH: int = int(os.getenv("MATERIAL_THUMBNAIL_WIDTH", "320"))
+
     # CORS
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = [
         "http://localhost:5173", 
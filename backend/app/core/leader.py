@@ -0,0 +1,109 @@
+# backend/app/core/leader.py
+"""
+複数ワーカー（uvicorn / gunicorn のプロセス）のうち1つだけが定期ジョブを実行するためのリーダー選出。
+
+PostgreSQL のセッション単位のアドバイザリーロックを専用の接続で取り続けたプロセスがリーダー。
+リーダーのプロセスが落ちると接続ごとロックが外れるので、次にロックを取りに来たワーカーが引き継ぐ。
+PostgreSQL 以外（ローカルの SQLite など）では常に自分がリーダー扱い。
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+# アプリ内で一意なロック番号（定期ジョブ用）
+SCHEDULER_LOCK_KEY = 72340001
+
+
+class LeaderElection:
+    def __init__(self, lock_key: int):
+        self.lock_key = lock_key
+        self._conn: Optional[Connection] = None
+        self._mutex = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None
+
+    def ensure_leader(self) -> bool:
+        """リーダーならロックを持った接続が生きているか確認し、そうでなければロックを取りに行く"""
+        if engine.dialect.name != "postgresql":
+            return True
+
+        with self._mutex:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(text("SELECT 1"))
+                    self._conn.commit()
+                    return True
+                except Exception as e:
+                    logger.warning(f"⚠️ リーダーの接続が切れました。リーダーを降ります: {e}")
+                    self._release()
+
+            conn = engine.connect()
+            try:
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+                ).scalar()
+                # ロックはセッションに付くので、トランザクションは閉じておく
+                conn.commit()
+            except Exception as e:
+                conn.close()
+                logger.error(f"❌ リーダー選出に失敗しました: {e}")
+                return False
+
+            if not acquired:
+                conn.close()
+                return False
+
+            self._conn = conn
+            logger.info("👑 このワーカーが定期ジョブのリーダーになりました")
+            return True
+
+    def release(self):
+        with self._mutex:
+            self._release()
+
+    def _release(self):
+        if self._conn is None:
+            return
+        try:
+            # 接続を閉じればロックも外れるが、プールに戻る場合に備えて明示的に外す
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            self._conn.commit()
+        except Exception:
+            pass
+        finally:
+            self._conn.close()
+            self._conn = None
+
+
+scheduler_leader = LeaderElection(SCHEDULER_LOCK_KEY)
+
+
+def leader_only(func):
+    """リーダーのワーカーでだけ実行するジョブにするデコレーター（async 関数にも使える）"""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            # ロックの確認はDBに問い合わせるので、イベントループを止めないようスレッドで
+            if not await asyncio.to_thread(scheduler_leader.ensure_leader):
+                return None
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not scheduler_leader.ensure_leader():
+            return None
+        return func(*args, **kwargs)
+    return wrapper
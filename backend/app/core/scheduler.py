@@ -1,16 +1,23 @@
 # backend/app/core/scheduler.py
 
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from app.db.database import SessionLocal
 from app.models.models import Student
-from app.services.attendance_sync import sync_google_sheets_to_db
+from app.services.attendance_sync import scheduled_sync
+from app.services.audit_archive import maintain_audit_partitions
+from app.services.csv_importer import resume_import_jobs
+from app.services.report_batch import resume_report_jobs
+from app.core.leader import leader_only, scheduler_leader
+from datetime import datetime
 import logging
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LEADER_HEARTBEAT_SECONDS = 30
+
 def auto_update_grades():
     """学年を自動的に1つ繰り上げる処理"""
     db = SessionLocal()
@@ -43,25 +50,66 @@ def auto_update_grades():
         db.close()
 
 def start_scheduler():
-    """スケジューラーの起動"""
-    scheduler = BackgroundScheduler()
+    """
+    スケジューラーの起動
+    全ワーカーで起動するが、ジョブはリーダー（アドバイザリーロックを取れた1プロセス）だけが実行する。
+    リーダーが落ちたら、次のハートビートで他のワーカーが引き継ぐ。
+    アプリのイベントループ上で動かすので、起動中のループの中（startup イベント）から呼ぶこと。
+    通常の関数のジョブはスレッドプールで、async のジョブ（スプシ同期）はループ上で実行される。
+    """
+    scheduler = AsyncIOScheduler()
     
     # 毎年 3月 1日 00:00 に実行するクーロン設定
     scheduler.add_job(
-        auto_update_grades,
+        leader_only(auto_update_grades),
         CronTrigger(month=3, day=1, hour=0, minute=0),
         id="auto_update_grades_job",
         replace_existing=True
     )
-    scheduler.add_job(sync_google_sheets_to_db, 'interval', minutes=5)
+    # 5分おきのスプシ同期。初回は起動をブロックしないよう、起動直後にバックグラウンドで実行
+    scheduler.add_job(
+        leader_only(scheduled_sync),
+        'interval',
+        minutes=5,
+        id="sync_google_sheets_job",
+        replace_existing=True,
+        next_run_time=datetime.now()
+    )
+    # 毎日 03:00 に監査ログの先の月のパーティション作成と古い月のアーカイブ
+    scheduler.add_job(
+        leader_only(maintain_audit_partitions),
+        CronTrigger(hour=3, minute=0),
+        id="maintain_audit_partitions_job",
+        replace_existing=True
+    )
+    # 止まったCSVインポートのジョブ（ワーカーが落ちた・再起動した）を拾って続きから再開
+    scheduler.add_job(
+        leader_only(resume_import_jobs),
+        'interval',
+        minutes=1,
+        id="resume_import_jobs_job",
+        replace_existing=True
+    )
+    # 止まった一括レポート作成のジョブも同じように拾い、まだできていない生徒の分から再開
+    scheduler.add_job(
+        leader_only(resume_report_jobs),
+        'interval',
+        minutes=1,
+        id="resume_report_jobs_job",
+        replace_existing=True
+    )
+    # リーダーの生存確認・引き継ぎ
+    scheduler.add_job(
+        scheduler_leader.ensure_leader,
+        'interval',
+        seconds=LEADER_HEARTBEAT_SECONDS,
+        id="leader_heartbeat_job",
+        replace_existing=True,
+        next_run_time=datetime.now()
+    )
     
     scheduler.start()
-
-    try:
-        logger.info("🔄 初回のスプレッドシート同期を実行します...")
-        sync_google_sheets_to_db()
-    except Exception as e:
-        logger.error(f"初回の同期に失敗しました: {e}")
     
     logger.info("📅 学年自動更新スケジューラーを起動しました (次回実行: 毎年3月1日 00:00)")
     logger.info("⏰ スケジューラーが起動しました（5分おきのスプシ同期をセット完了）")
+    return scheduler
@@ -1,5 +1,8 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, distinct, func, literal, select, union_all
+from sqlalchemy.orm import Session, selectinload
 from app.models import models
+from app.services import material_search
+from app.services.blob_store import BlobInfo
 from typing import List
 
 # --- タグ操作 ---
@@ -31,15 +34,20 @@ def get_all_detail_tags(db: Session):
 def delete_subject_tag(db: Session, tag_id: int):
     tag = db.query(models.SubjectTag).filter(models.SubjectTag.id == tag_id).first()
     if tag:
+        material_ids = [m.id for m in tag.materials]
         db.delete(tag)
         db.commit()
+        # 消したタグ名が検索に残らないように作り直す
+        material_search.refresh_search_vectors(db, material_ids)
     return tag
 
 def delete_detail_tag(db: Session, tag_id: int):
     tag = db.query(models.DetailTag).filter(models.DetailTag.id == tag_id).first()
     if tag:
+        material_ids = [m.id for m in tag.materials]
         db.delete(tag)
         db.commit()
+        material_search.refresh_search_vectors(db, material_ids)
     return tag
 
 
@@ -51,13 +59,17 @@ def _set_material_tags(db: Session, db_material: models.TeachingMaterial, subjec
     if detail_tag_ids is not None:
         db_material.detail_tags = db.query(models.DetailTag).filter(models.DetailTag.id.in_(detail_tag_ids)).all()
 
-def create_material(db: Session, title: str, file_path: str, internal_memo: str = None, subject_ids: List[int] = [], detail_tag_ids: List[int] = []):
+def create_material(db: Session, title: str, blob: BlobInfo, original_filename: str, internal_memo: str = None, subject_ids: List[int] = [], detail_tag_ids: List[int] = []):
     db_material = models.TeachingMaterial(
         title=title,
-        file_path=file_path,
+        original_filename=original_filename,
+        blob_sha256=blob.sha256,
+        file_size=blob.size,
         internal_memo=internal_memo,
     )
     _set_material_tags(db, db_material, subject_ids, detail_tag_ids)
+    # PDF本文・ページ数・サムネイルは後からバックグラウンドで追加される
+    material_search.refresh_search_vector(db_material)
     
     db.add(db_material)
     db.commit()
@@ -65,34 +77,158 @@ def create_material(db: Session, title: str, file_path: str, internal_memo: str
     return db_material
 
 # ★追加: 教材の更新機能
-def update_material(db: Session, material_id: int, title: str, file_path: str = None, internal_memo: str = None, subject_ids: List[int] = None, detail_tag_ids: List[int] = None):
+def update_material(db: Session, material_id: int, title: str, blob: BlobInfo = None, original_filename: str = None, internal_memo: str = None, subject_ids: List[int] = None, detail_tag_ids: List[int] = None):
     db_material = db.query(models.TeachingMaterial).filter(models.TeachingMaterial.id == material_id).first()
     if not db_material:
         return None
         
     db_material.title = title
     db_material.internal_memo = internal_memo
-    if file_path:  # 新しいファイルがアップロードされた場合のみパスを更新
-        db_material.file_path = file_path
+    if blob:  # 新しいファイルがアップロードされた場合のみ差し替える
+        db_material.blob_sha256 = blob.sha256
+        db_material.file_size = blob.size
+        db_material.original_filename = original_filename
+        db_material.file_path = None
+        # 新しいPDFの本文・ページ数・サムネイルは後から入れ直す
+        db_material.content_text = None
+        db_material.page_count = None
+        db_material.thumbnail_sha256 = None
         
     _set_material_tags(db, db_material, subject_ids, detail_tag_ids)
+    material_search.refresh_search_vector(db_material)
     
     db.commit()
     db.refresh(db_material)
     return db_material
 
-def get_materials(db: Session, subject_id: int = None, detail_tag_id: int = None, search_query: str = None):
-    query = db.query(models.TeachingMaterial)
-    
+def _tag_filters(subject_id: int = None, detail_tag_id: int = None):
     # 中間テーブルを通した絞り込み
+    filters = []
     if subject_id:
-        query = query.filter(models.TeachingMaterial.subjects.any(id=subject_id))
+        filters.append(models.TeachingMaterial.subjects.any(id=subject_id))
     if detail_tag_id:
-        query = query.filter(models.TeachingMaterial.detail_tags.any(id=detail_tag_id))
-    if search_query:
-        query = query.filter(models.TeachingMaterial.title.ilike(f"%{search_query}%"))
-        
-    return query.order_by(models.TeachingMaterial.created_at.desc()).all()
+        filters.append(models.TeachingMaterial.detail_tags.any(id=detail_tag_id))
+    return filters
+
+def _matching_filters(subject_id: int = None, detail_tag_id: int = None, tsquery=None):
+    """一覧・検索共通の絞り込み条件（tsquery は material_search.tsquery_expr の式）"""
+    filters = _tag_filters(subject_id, detail_tag_id)
+    if tsquery is not None:
+        filters.append(models.TeachingMaterial.search_vector.op("@@")(tsquery))
+    return filters
+
+def _search_tsquery(search_query: str = None):
+    tsquery = material_search.build_tsquery(search_query)
+    return material_search.tsquery_expr(tsquery) if tsquery else None
+
+def get_materials(db: Session, subject_id: int = None, detail_tag_id: int = None, search_query: str = None, limit: int = None, before_id: int = None):
+    """
+    教材の一覧（新しい順 = id の降順）。before_id を渡すとそれより前の教材から limit 件（キーセットページング）。
+    タグは selectinload で全件分をまとめて読む（教材ごとにクエリを出さない）。
+    search_query は全文検索で絞り込むだけで、並び順は変えない（関連度順は search_materials）。
+    """
+    query = db.query(models.TeachingMaterial).options(
+        selectinload(models.TeachingMaterial.subjects), selectinload(models.TeachingMaterial.detail_tags)
+    ).filter(*_matching_filters(subject_id, detail_tag_id, _search_tsquery(search_query)))
+    if before_id is not None:
+        query = query.filter(models.TeachingMaterial.id < before_id)
+    query = query.order_by(models.TeachingMaterial.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def _facet_counts(matched):
+    """
+    絞り込み結果（matched.c.id）の中での科目タグ・詳細タグごとの教材数。
+    2つの中間テーブルを UNION ALL してから1回の GROUP BY で数え、JSON の配列で返すサブクエリ。
+    """
+    subject_assoc = models.material_subject_association
+    detail_assoc = models.material_detail_association
+    tags = union_all(
+        select(literal("subjects").label("kind"), subject_assoc.c.material_id, models.SubjectTag.id, models.SubjectTag.name)
+        .join(models.SubjectTag, models.SubjectTag.id == subject_assoc.c.subject_id),
+        select(literal("detail_tags").label("kind"), detail_assoc.c.material_id, models.DetailTag.id, models.DetailTag.name)
+        .join(models.DetailTag, models.DetailTag.id == detail_assoc.c.detail_id),
+    ).subquery()
+    counts = (
+        select(tags.c.kind, tags.c.id, tags.c.name, func.count(distinct(tags.c.material_id)).label("count"))
+        .join(matched, matched.c.id == tags.c.material_id)
+        .group_by(tags.c.kind, tags.c.id, tags.c.name)
+        .subquery()
+    )
+    return select(
+        func.coalesce(
+            func.json_agg(
+                func.json_build_object("kind", counts.c.kind, "id", counts.c.id, "name", counts.c.name, "count", counts.c.count)
+            ),
+            func.json_build_array(),
+        )
+    ).scalar_subquery()
+
+def _split_facets(rows):
+    facets = {"subjects": [], "detail_tags": []}
+    for row in sorted(rows, key=lambda r: (-r["count"], r["name"])):
+        facets[row.pop("kind")].append(row)
+    return facets
+
+def count_materials(db: Session, subject_id: int = None, detail_tag_id: int = None, search_query: str = None):
+    """一覧の総件数とタグごとの件数を1回のクエリで取る（サイドバーの絞り込み用）"""
+    matched = (
+        select(models.TeachingMaterial.id)
+        .where(*_matching_filters(subject_id, detail_tag_id, _search_tsquery(search_query)))
+        .cte("matched")
+    )
+    row = db.execute(select(
+        select(func.count()).select_from(matched).scalar_subquery().label("total"),
+        _facet_counts(matched).label("facets"),
+    )).one()
+    return {"total": row.total, "facets": _split_facets(row.facets)}
+
+def search_materials(db: Session, search_query: str, subject_id: int = None, detail_tag_id: int = None, limit: int = 20, offset: int = 0):
+    """
+    教材の全文検索（関連度順・ページ分け）。
+    件数・そのページの教材ID・タグごとの件数を1回のクエリでまとめて取る。
+    """
+    ts = _search_tsquery(search_query)
+    if ts is None:
+        return {"total": 0, "items": [], "facets": {"subjects": [], "detail_tags": []}}
+
+    material = models.TeachingMaterial
+    rank = func.ts_rank(material.search_vector, ts).label("rank")
+    matched = (
+        select(material.id, rank)
+        .where(*_matching_filters(subject_id, detail_tag_id, ts))
+        .cte("matched")
+    )
+    page = select(matched.c.id, matched.c.rank).order_by(desc(matched.c.rank), desc(matched.c.id)).limit(limit).offset(offset).subquery()
+
+    row = db.execute(select(
+        select(func.count()).select_from(matched).scalar_subquery().label("total"),
+        select(
+            func.coalesce(
+                func.json_agg(func.json_build_array(page.c.id, page.c.rank)),
+                func.json_build_array(),
+            )
+        ).scalar_subquery().label("page"),
+        _facet_counts(matched).label("facets"),
+    )).one()
+
+    ranks = {material_id: material_rank for material_id, material_rank in row.page}
+    materials = {
+        m.id: m
+        for m in db.query(material)
+        .options(selectinload(material.subjects), selectinload(material.detail_tags))
+        .filter(material.id.in_(list(ranks)))
+    }
+    return {
+        "total": row.total,
+        # 関連度順に並べ直す（json_agg の順番は保証されないため）
+        "items": [
+            (materials[i], ranks[i])
+            for i in sorted(ranks, key=lambda i: (-ranks[i], -i)) if i in materials
+        ],
+        "facets": _split_facets(row.facets),
+    }
 
 def get_material(db: Session, material_id: int):
     return db.query(models.TeachingMaterial).filter(models.TeachingMaterial.id == material_id).first()
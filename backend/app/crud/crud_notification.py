@@ -0,0 +1,59 @@
+from sqlalchemy import String, and_, column, exists, false, select, union, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models.models import Notification, Student, User
+from typing import Dict, List, Set
+
+# 1回の INSERT に載せるイベント数
+FAN_OUT_CHUNK_SIZE = 500
+
+def fan_out_notifications(db: Session, events: List[Dict[str, str]]) -> Set[int]:
+    """
+    イベント（title, message, idempotency_key, student_name, instructor_name）ごとに
+    担当講師と、生徒の校舎の管理者へ通知を作る。宛先の解決と作成は INSERT ... SELECT 1文で行う。
+    生徒が見つからない場合は全校舎の管理者に送る。
+    同じ宛先・同じ idempotency_key の通知がすでにあればスキップし、新しく通知が作られた宛先の user_id を返す。
+    idempotency_key が None のイベントは（ユニーク制約が NULL を区別するので）スキップせず毎回作る。
+    commit は呼び出し側。
+    """
+    notified: Set[int] = set()
+    for i in range(0, len(events), FAN_OUT_CHUNK_SIZE):
+        chunk = events[i:i + FAN_OUT_CHUNK_SIZE]
+        e = values(
+            column("title", String),
+            column("message", String),
+            column("idempotency_key", String),
+            column("student_name", String),
+            column("instructor_name", String),
+            name="e",
+        ).data([
+            (ev["title"], ev["message"], ev["idempotency_key"], ev["student_name"], ev["instructor_name"])
+            for ev in chunk
+        ]).cte("e")
+
+        cols = (e.c.title, e.c.message, e.c.idempotency_key, false())
+        # 1. 担当講師
+        to_instructor = select(User.id, *cols).select_from(e).join(
+            User, User.username == e.c.instructor_name
+        )
+        # 2. 生徒の校舎の管理者
+        to_school_admins = select(User.id, *cols).select_from(e).join(
+            Student, Student.name == e.c.student_name
+        ).join(
+            User, and_(User.role == "admin", User.school == Student.school)
+        )
+        # 3. 生徒が見つからない時は全校舎の管理者
+        to_all_admins = select(User.id, *cols).select_from(e).join(
+            User, User.role == "admin"
+        ).where(~exists().where(Student.name == e.c.student_name))
+        # UNION で重複（講師本人が管理者など）を除く
+        recipients = union(to_instructor, to_school_admins, to_all_admins)
+
+        stmt = insert(Notification).from_select(
+            ["user_id", "title", "message", "idempotency_key", "is_read"], recipients
+        ).on_conflict_do_nothing(
+            index_elements=["user_id", "idempotency_key"]
+        ).returning(Notification.user_id)
+
+        notified.update(db.execute(stmt).scalars())
+    return notified
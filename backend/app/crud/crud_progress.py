@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
 from app.models.models import Progress, MasterTextbook
 from app.schemas.schemas import ProgressCreate, ProgressUpdate
+from app.services.progress_aggregation import refresh_student_summaries
 from typing import List
 
 def get_student_progress(db: Session, student_id: int):
@@ -82,5 +83,6 @@ def update_student_progress(db: Session, student_id: int, progress_updates: List
     )
     
     db.execute(stmt)
+    refresh_student_summaries(db, [student_id])
     db.commit()
     return len(records)
@@ -1,8 +1,9 @@
 from sqlalchemy.orm import Session
-from app.models.models import User
+from app.models.models import User, UserLastProgressActivity
 from app.schemas.schemas import UserCreate
 from app.core.security import get_password_hash
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timedelta
 
 def get_users(db: Session, current_user: User) -> List[User]:
     if current_user.role == 'developer':
@@ -33,3 +34,35 @@ def create_user(db: Session, user: UserCreate):
     db.commit()
     db.refresh(db_user)
     return db_user
+
+def get_inactive_users(db: Session, days: int = 30, school: Optional[str] = None, exclude_roles: List[str] = ()) -> List[dict]:
+    """
+    days 日以上進捗を更新していない講師を、最終操作日時の表と1回のJOINで取得する。
+    記録なし → 放置日数が長い順 に並べて返す。
+    """
+    now = datetime.utcnow()
+    threshold = now - timedelta(days=days)
+    last_at = UserLastProgressActivity.last_progress_at
+
+    query = db.query(User.id, User.username, last_at).outerjoin(
+        UserLastProgressActivity, UserLastProgressActivity.user_id == User.id
+    ).filter(
+        (last_at.is_(None)) | (last_at < threshold)
+    )
+    if exclude_roles:
+        query = query.filter(User.role.notin_(exclude_roles))
+    if school is not None:
+        query = query.filter(User.school == school)
+
+    # NULL（一度も更新していない）を先頭に、古い順
+    rows = query.order_by(last_at.is_not(None), last_at, User.id).all()
+
+    return [
+        {
+            "user_id": user_id,
+            "name": username,
+            "last_update": last.strftime("%Y-%m-%d") if last else "記録なし",
+            "days_inactive": (now - last).days if last else f"{days}+",
+        }
+        for user_id, username, last in rows
+    ]
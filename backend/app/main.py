@@ -4,6 +4,12 @@ from app.core.config import settings
 from app.models import models 
 from app.db.database import engine
 from app.core.scheduler import start_scheduler
+from app.core.leader import scheduler_leader
+from app.services.audit_writer import audit_writer
+from app.services.audit_archive import ensure_audit_partitions
+from app.services.attendance_sync import close_http_client
+from app.services.notification_broker import notification_broker
+from app.services.pdf_renderer import pdf_renderer
 from app.routers import auth, external, students, admin, common, charts, dashboard, exams, routes, system, reports, backup, developer, system_status, audit, csv_import, student_report, materials, attendance, chat
 
 models.Base.metadata.create_all(bind=engine)
@@ -54,6 +60,29 @@ app.include_router(fix_db.router, prefix=settings.API_V1_STR, tags=["fix"])
 def root():
     return {"message": "Hello from Progress Dashboard API"}
 
+scheduler = None
+
 @app.on_event("startup")
-def on_startup():
-    start_scheduler()
+async def on_startup():
+    global scheduler
+    # 監査ログの書き込み先（今月以降のパーティション）を先に用意してからライターを動かす
+    ensure_audit_partitions()
+    # 定期ジョブはリーダーに選ばれたワーカーだけが実行する（初回同期もバックグラウンド）
+    scheduler = start_scheduler()
+    audit_writer.start()
+    # 通知のプッシュ用に LISTEN を開始
+    await notification_broker.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await notification_broker.stop()
+    # PDF作成用のプロセスを止める
+    pdf_renderer.shutdown()
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    # リーダーのロックを手放して、他のワーカーがすぐ引き継げるようにする
+    scheduler_leader.release()
+    # キューに残っている監査ログを書き切ってから終了
+    audit_writer.stop()
+    # GASとの接続を閉じる
+    await close_http_client()
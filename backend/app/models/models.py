@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Date, UniqueConstraint, Text, DateTime, LargeBinary, JSON, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Date, UniqueConstraint, Text, DateTime, LargeBinary, JSON, Table, Index, Enum
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
 from datetime import date, datetime
+import enum
 
 class User(Base):
     __tablename__ = "users"
@@ -27,7 +29,10 @@ class Student(Base):
     previous_school = Column(String)
     memo = Column(Text, nullable=True)
 
-    __table_args__ = (UniqueConstraint('school', 'name', name='_school_name_uc'),)
+    __table_args__ = (
+        UniqueConstraint('school', 'name', name='_school_name_uc'),
+        Index('ix_students_school_grade', 'school', 'grade'),  # 校舎単位の集計用
+    )
 
     instructors = relationship("StudentInstructor", back_populates="student", cascade="all, delete-orphan")
     progress = relationship("Progress", back_populates="student", cascade="all, delete-orphan")
@@ -35,6 +40,7 @@ class Student(Base):
     university_acceptances = relationship("UniversityAcceptance", back_populates="student", cascade="all, delete-orphan")
     mock_exam_results = relationship("MockExamResult", back_populates="student", cascade="all, delete-orphan")
     eiken_results = relationship("EikenResult", back_populates="student", cascade="all, delete-orphan")
+    progress_summaries = relationship("StudentProgressSummary", cascade="all, delete-orphan")
 
 class StudentInstructor(Base):
     __tablename__ = "student_instructors"
@@ -79,6 +85,21 @@ class Progress(Base):
 
     student = relationship("Student", back_populates="progress")
 
+# 生徒×科目ごとの進捗集計（Progress更新時に同じトランザクションで再計算される）
+class StudentProgressSummary(Base):
+    __tablename__ = "student_progress_summary"
+
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    subject = Column(String, primary_key=True)
+    planned_time = Column(Float, nullable=False, default=0.0)    # 傾斜後の予定時間
+    completed_time = Column(Float, nullable=False, default=0.0)  # 傾斜後の実績時間
+    progress_rate = Column(Float, nullable=False, default=0.0)   # 進捗率(%)
+    ratio_sum = Column(Float, nullable=False, default=0.0)       # 完了率の合計（時間が無い場合の単純平均用）
+    item_count = Column(Integer, nullable=False, default=0)
+    chart_total = Column(Float, nullable=False, default=0.0)
+    chart_completed = Column(Float, nullable=False, default=0.0)
+    sort_order = Column(Integer)                                 # 科目の表示順（最初に登録された進捗のID）
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 class BulkPreset(Base):
@@ -219,7 +240,12 @@ class RootTable(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
-    file_content = Column(LargeBinary, nullable=False) # バイナリデータ
+    # 本体は blob_store に置き、ここには中身の SHA-256 とサイズだけ持つ
+    blob_sha256 = Column(String(64), nullable=True, index=True)
+    file_size = Column(Integer, nullable=True)
+    # 移行前の行のバイナリデータ（Scripts/migrate_route_files_to_blob_store.py で blob_store に移して NULL にする）
+    # deferred なので、一覧や更新でモデルを読んでも本体は読み込まない（触った時だけ読まれる）
+    file_content = deferred(Column(LargeBinary, nullable=True))
     subject = Column(String)
     level = Column(String)
     academic_year = Column(Integer)
@@ -232,15 +258,56 @@ class SystemSetting(Base):
     announcement_enabled = Column(Boolean, default=False)
     announcement_message = Column(String, default="")
 
+class AuditCategory(str, enum.Enum):
+    """監査ログの大分類（action 名の文字列検索をしなくて済むように保存時に決める）"""
+    PROGRESS = "progress"   # 進捗の追加・更新・削除
+    USER = "user"           # ユーザー作成・権限変更など
+    AUTH = "auth"           # ログイン関連
+    OTHER = "other"
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # PostgreSQL では timestamp で月ごとにパーティション分割するため、主キーは (id, timestamp)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))  # 「誰が」操作したか
     action = Column(String, index=True)                # 「何を」したか (例: "CREATE_USER", "UPDATE_ROLE", "LOGIN")
+    category = Column(Enum(AuditCategory, name="audit_category", values_callable=lambda e: [m.value for m in e]))  # 「どの種類の」操作か
     branch_id = Column(Integer, index=True)            # 「どの校舎の」データか（Adminの絞り込み用！）
     details = Column(String)                           # 「詳細」 (例: "user_id 5 の権限を admin に変更")
-    timestamp = Column(DateTime, default=datetime.utcnow) # 「いつ」操作したか
+    payload = Column(JSON().with_variant(JSONB, "postgresql"))  # 詳細の構造化版 (例: {"student_id": 3, "book_name": "..."})
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow) # 「いつ」操作したか
+
+    # 一覧は (timestamp, id) の降順でカーソルページングするので、各絞り込み条件 + (timestamp, id) で複合インデックス
+    __table_args__ = (
+        Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_audit_logs_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+        Index('ix_audit_logs_action_timestamp_id', 'action', 'timestamp', 'id'),
+        Index('ix_audit_logs_category_timestamp_id', 'category', 'timestamp', 'id'),
+        Index('ix_audit_logs_branch_timestamp_id', 'branch_id', 'timestamp', 'id'),
+        # payload @> '{"student_id": 3}' のような検索用
+        Index('ix_audit_logs_payload_gin', 'payload', postgresql_using='gin'),
+        # 月ごとのパーティション（audit_logs_YYYY_MM）は services/audit_archive.py が作成・アーカイブする
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+# 古い月の監査ログをファイル（gzip圧縮した NDJSON）に書き出した記録
+class AuditLogArchive(Base):
+    __tablename__ = "audit_log_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, unique=True, nullable=False)   # 対象月の1日
+    file_path = Column(String, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+# 講師ごとの最終進捗操作日時（未更新講師アラート用。進捗系の監査ログを書くたびに更新）
+class UserLastProgressActivity(Base):
+    __tablename__ = "user_last_progress_activity"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_progress_at = Column(DateTime, nullable=False, index=True)
+    last_action = Column(String)
 
 class StudentReportState(Base):
     __tablename__ = "student_report_states"
@@ -288,8 +355,18 @@ class TeachingMaterial(Base):
     __tablename__ = "teaching_materials"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
-    file_path = Column(String, nullable=False)
+    # 旧方式（uploaded_materials/ に元のファイル名で保存）の教材だけ。新しい教材は blob_store に置く
+    file_path = Column(String, nullable=True)
+    original_filename = Column(String, nullable=True)
+    blob_sha256 = Column(String(64), index=True, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    # アップロード後にバックグラウンドで入る（services/material_files.py）
+    page_count = Column(Integer, nullable=True)
+    thumbnail_sha256 = Column(String(64), nullable=True)
     internal_memo = Column(Text, nullable=True)
+    # 検索用: PDFから取り出した本文と、タイトル・タグ・メモ・本文をまとめた tsvector（services/material_search.py）
+    content_text = deferred(Column(Text, nullable=True))
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
     
     # ※ここに前回あった subject_id と detail_tag_id のカラムは削除されています
     
@@ -300,6 +377,14 @@ class TeachingMaterial(Base):
     subjects = relationship("SubjectTag", secondary=material_subject_association, back_populates="materials")
     detail_tags = relationship("DetailTag", secondary=material_detail_association, back_populates="materials")
 
+    __table_args__ = (
+        Index("ix_teaching_materials_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    @property
+    def has_thumbnail(self) -> bool:
+        return self.thumbnail_sha256 is not None
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -309,6 +394,13 @@ class Notification(Base):
     message = Column(String, nullable=False) # 例: "佐藤先生、鈴木さんの振替申請が届きました"
     is_read = Column(Boolean, default=False) # 既読フラグ（ここがFalseならポップアップを出す）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String(64)) # 同じイベントの再送（GASのリトライ）で二重に作らないためのキー
+
+    __table_args__ = (
+        # 講師ごとの未読を id 順に取る（SSE の追いつき・未読一覧）
+        Index('ix_notifications_user_unread', 'user_id', 'is_read', 'id'),
+        UniqueConstraint('user_id', 'idempotency_key', name='uq_notifications_user_idempotency'),
+    )
 
     # リレーション（Userテーブルから notifications でアクセスできるようにするなら）
     user = relationship("User", backref="notifications")
@@ -325,6 +417,17 @@ class TransferRequest(Base):
     candidate_dates = Column(String)
     reason = Column(Text)
     is_completed = Column(Boolean, default=False)
+    content_hash = Column(String(64))  # 同期時の差分判定用（行の中身のハッシュ）
+    # 同期時にパースしておく値（一覧の絞り込み・並べ替え用）
+    timestamp_at = Column(DateTime(timezone=True))
+    original_date_at = Column(DateTime(timezone=True))
+    academic_year = Column(Integer)  # 3月始まりの年度。timestamp が読めない行は NULL
+
+    __table_args__ = (
+        UniqueConstraint('row_number', name='uq_transfer_requests_row_number'),
+        # 未完了の振替を年度で絞って新しい順に取る
+        Index('ix_transfer_requests_pending', 'is_completed', 'academic_year', 'timestamp_at'),
+    )
 
 class AbsenceReport(Base):
     __tablename__ = "absence_reports"
@@ -336,4 +439,72 @@ class AbsenceReport(Base):
     instructor = Column(String, index=True)
     day_of_week = Column(String)
     reason = Column(Text)
-    report_info = Column(Text)
\ No newline at end of file
+    report_info = Column(Text)
+    content_hash = Column(String(64))  # 同期時の差分判定用（行の中身のハッシュ）
+    timestamp_at = Column(DateTime(timezone=True))
+    academic_year = Column(Integer)
+
+    __table_args__ = (
+        UniqueConstraint('row_number', name='uq_absence_reports_row_number'),
+        Index('ix_absence_reports_year_timestamp', 'academic_year', 'timestamp_at'),
+    )
+
+# 生徒（名前）ごと・年度ごとの振替残数と欠席回数（同期のたびに作り直す集計テーブル）
+class AttendanceCount(Base):
+    __tablename__ = "attendance_counts"
+
+    academic_year = Column(Integer, primary_key=True)
+    name = Column(String, primary_key=True)
+    remaining_transfers = Column(Integer, nullable=False, default=0)  # 未完了の振替申請数
+    absences = Column(Integer, nullable=False, default=0)
+
+# 外部データ同期の状態（前回取り込んだデータ全体のハッシュ。変化がなければ同期を丸ごとスキップする）
+class SyncState(Base):
+    __tablename__ = "sync_states"
+
+    key = Column(String, primary_key=True)          # 例: "attendance_sheets"
+    payload_hash = Column(String(64))
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+# 校舎（または指定した生徒）のレポートPDFを一括作成するジョブ
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    school = Column(String, nullable=True)
+    student_ids = Column(JSON, nullable=False)   # 対象の生徒ID（投入時に確定）
+    sections = Column(JSON, nullable=False)      # ["dashboard", "calendar", "mock_exams", "past_exams"]
+    status = Column(String, nullable=False, default="pending")  # pending / running / completed / failed
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, nullable=True)  # 実行中のワーカーが最後に生存を記録した時刻
+    finished_at = Column(DateTime, nullable=True)
+
+# CSVインポートをバックグラウンドで実行するジョブ（チャンクごとに commit し、落ちても続きから再開できる）
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    import_type = Column(String, nullable=False)  # textbook / student / user
+    file_name = Column(String, nullable=True)     # アップロードされた時のファイル名
+    file_path = Column(String, nullable=False)    # IMPORT_JOB_DIR に保存したファイル
+    status = Column(String, nullable=False, default="pending", index=True)  # pending / running / completed / failed
+    bytes_total = Column(Integer, nullable=False, default=0)
+    bytes_processed = Column(Integer, nullable=False, default=0)
+    start_bytes = Column(Integer, nullable=False, default=0)  # 今回の実行を始めた時点の bytes_processed（残り時間の計算用）
+    last_line = Column(Integer, nullable=False, default=0)    # commit 済みの最後の行番号（再開はこの次の行から）
+    rows_processed = Column(Integer, nullable=False, default=0)
+    inserted = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    unchanged = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    errors = Column(JSON, nullable=False, default=list)       # 行ごとのエラー（先頭 REPORT_LIMIT 件）
+    error = Column(Text, nullable=True)                        # ジョブ自体が失敗した理由
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)             # 実行中のワーカーが最後に commit した時刻
+    finished_at = Column(DateTime, nullable=True)
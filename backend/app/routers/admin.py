@@ -11,6 +11,7 @@ from app.schemas import schemas
 from app.models import models
 from app.crud import crud_master, crud_user, crud_student
 from app.routers.audit import log_action
+from app.services.progress_aggregation import refresh_student_summaries, refresh_summaries_for_books
 import traceback
 from app.routers.deps import get_current_user
 
@@ -45,6 +46,8 @@ def create_textbook(
         duration=data.duration
     )
     session.add(new_book)
+    # 所要時間未設定の進捗がこのマスターで補完されるので集計を更新
+    refresh_summaries_for_books(session, [(new_book.subject, new_book.book_name)])
     session.commit()
     session.refresh(new_book)
     return new_book
@@ -60,6 +63,8 @@ def update_textbook(
     if not book:
         raise HTTPException(status_code=404, detail="Textbook not found")
     
+    old_key = (book.subject, book.book_name)
+
     if data.subject is not None:
         book.subject = data.subject
     if data.level is not None:
@@ -69,6 +74,8 @@ def update_textbook(
     if data.duration is not None:
         book.duration = data.duration
 
+    # 変更前後の参考書を使っている生徒の集計を更新
+    refresh_summaries_for_books(session, [old_key, (book.subject, book.book_name)])
     session.commit()
     session.refresh(book)
     return book
@@ -81,6 +88,7 @@ def delete_textbook(book_id: int, session: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Textbook not found")
     
     session.delete(book)
+    refresh_summaries_for_books(session, [(book.subject, book.book_name)])
     session.commit()
     return {"message": "Deleted successfully"}
 
@@ -474,6 +482,10 @@ def update_student(
                 continue
             setattr(student, f, data[f])
 
+    # 偏差値が変わると傾斜後の所要時間が変わるので集計を更新
+    if "deviation_value" in data:
+        refresh_student_summaries(db, [student_id])
+
     # 講師設定の更新
     # 既存の紐付けを一度削除してから再登録する方式で更新
     
@@ -536,48 +548,8 @@ def get_inactive_users(session: Session = Depends(get_db), current_user: models.
     """
     1ヶ月間進捗更新をしていない講師（User）を検知するAPI
     """
-    # 30日前の日付を計算
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-
-    # 開発者アカウントは非表示
-    query = session.query(models.User).filter(models.User.role != "developer")
-
-    # 同校舎のユーザーのみ取得
-    if current_user.role == "admin":
-        query = query.filter(models.User.school == current_user.school)
-    
-    # 対象となるユーザー（講師）を取得 
-    users = session.query(models.User).all() 
-    
-    inactive_users = []
-    
-    for u in users:
-        # このユーザーが最後に「PROGRESS」系の操作をしたログを探す
-        last_log = session.query(models.AuditLog).filter(
-            models.AuditLog.user_id == u.id,
-            models.AuditLog.action.like("%PROGRESS%")
-        ).order_by(desc(models.AuditLog.id)).first() # created_atがあればそれで降順に
-        
-        # ログが存在し、かつそれが30日以上前の場合
-        if last_log:
-            last_update_date = getattr(last_log, 'timestamp', None) 
-            
-            if last_update_date and last_update_date < thirty_days_ago:
-                days_inactive = (datetime.now() - last_update_date).days
-                inactive_users.append({
-                    "user_id": u.id,
-                    "name": getattr(u, 'username', getattr(u, 'name', '不明')),
-                    "last_update": last_update_date.strftime("%Y-%m-%d"),
-                    "days_inactive": days_inactive
-                })
-        else:
-            # そもそも一度も更新していないユーザー（入社直後などを除くロジックが必要かも）
-            # 今回はとりあえずリストに入れます
-            inactive_users.append({
-                "user_id": u.id,
-                "name": getattr(u, 'username', getattr(u, 'name', '不明')),
-                "last_update": "記録なし",
-                "days_inactive": "30+"
-            })
-            
-    return inactive_users
\ No newline at end of file
+    # 開発者アカウントは非表示、adminは同校舎のユーザーのみ
+    school = current_user.school if current_user.role == "admin" else None
+    return crud_user.get_inactive_users(
+        session, days=30, school=school, exclude_roles=["developer"]
+    )
\ No newline at end of file
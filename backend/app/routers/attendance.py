@@ -1,156 +1,171 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from anyio import from_thread
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-import httpx
 import asyncio
-from datetime import datetime, timezone, timedelta
+import hashlib
+import json
+from typing import List, Optional
 import time  # 🚨 追加：時間を計るツール
 from app.models import models
-from app.db.database import get_db
-from app.routers.deps import get_current_user
-from app.services.attendance_sync import sync_google_sheets_to_db
+from app.crud import crud_notification
+from app.db.database import SessionLocal, get_db
+from app.routers.deps import get_current_user, get_current_user_for_stream
+from app.services.attendance_sync import GAS_URL, current_academic_year, get_http_client, request_sync
+from app.services.notification_broker import notification_broker
 
 router = APIRouter()
 
-# GASのURL
-GAS_URL = "https://script.google.com/macros/s/AKfycbxKlWTOAaTJtmOflZsEVjLssdyQ2haOWwD686Omq-13M5SRSszkvyRtGiTuLhG2Fzd-/exec"
-JST = timezone(timedelta(hours=9), "JST")
-
 # 🚨 追加：キャッシュ（一時記憶）用の変数
 # 60秒間は同じデータを使い回す設定にします
 CACHE_TTL = 60 
 cache_store = {"data": None, "timestamp": 0}
 
+# 手動更新で同期の完了を待つ最大秒数（超えたら今あるDBのデータを返し、同期はそのまま続ける）
+SYNC_WAIT_TIMEOUT = 20
+
+# SSE: 通知が無い間も接続が切られないよう送るコメントの間隔（秒）と、1回に読む未読の件数
+NOTIFICATION_HEARTBEAT_SECONDS = 15
+NOTIFICATION_BATCH_SIZE = 100
+# 1本の接続を保つ最大秒数。切ってもブラウザが続きから自動で再接続するので、
+# ワーカーの再起動（終了時は開いている接続が閉じるのを待つ）が長く止まらないようにする
+NOTIFICATION_STREAM_MAX_SECONDS = 300
+
 class CompleteTransferRequest(BaseModel):
     rowNumber: int
     name: str
 
-def parse_gas_date(date_str: str):
-    if not date_str: return None
+def _jst_text(column, fmt: str):
+    """timestamptz の列を日本時間の表示用文字列にする（DB側で整形）"""
+    return func.to_char(func.timezone("Asia/Tokyo", column), fmt)
+
+async def _refresh_from_sheet(wait: bool):
+    """
+    手動更新: 同期を開始する（実行中の同期（定期実行・他の人の更新）があればそれに相乗り）。
+    wait なら SYNC_WAIT_TIMEOUT 秒まで完了を待つ。同期のタスクはイベントループ上で動くので、ループ上で呼ぶこと
+    """
+    task = request_sync()
+    if not wait:
+        return
     try:
-        dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-        return dt.astimezone(JST)
+        # shield: こちらが待つのをやめても同期自体はキャンセルしない
+        await asyncio.wait_for(asyncio.shield(task), timeout=SYNC_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
     except Exception:
-        return None
-
-def get_current_academic_year_range():
-    now = datetime.now(JST)
-    current_year = now.year
-    if now.month < 3:
-        target_year = current_year - 1
-    else:
-        target_year = current_year
-    start_dt = datetime(target_year, 3, 1, 0, 0, 0, tzinfo=JST)
-    end_dt = datetime(target_year + 1, 3, 1, 0, 0, 0, tzinfo=JST)
-    return start_dt, end_dt
+        raise HTTPException(status_code=500, detail="スプレッドシートの同期に失敗しました")
 
 @router.get("/transfers")
-async def get_transfers(
+def get_transfers(
     force_refresh: bool = Query(False),
+    wait: bool = Query(True, description="force_refresh の時、同期の完了を待ってから返すか"),
+    limit: int = Query(500, ge=1, le=2000, description="振替・欠席それぞれの最大件数（新しい順）"),
     db: Session = Depends(get_db) # 🚨 DBを使えるようにする
 ):
-    """データベースから振替・欠席データを取得（爆速0.01秒！）"""
+    """
+    データベースから振替・欠席データを取得（爆速0.01秒！）
+    DB は同期の Session なので、イベントループを止めないよう普通の def にしてスレッドプールで実行する
+    """
     
     # 🚨 フロントエンドで「最新を読み込む」ボタンが押された時だけ、手動で同期を走らせる
+    # 同期はイベントループ上のタスクなので、このスレッドからループに頼んで待つ
     if force_refresh:
-        try:
-            sync_google_sheets_to_db()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail="スプレッドシートの同期に失敗しました")
+        from_thread.run(_refresh_from_sheet, wait)
+
+    academic_year = current_academic_year()
+    T, A = models.TransferRequest, models.AbsenceReport
 
-    start_dt, end_dt = get_current_academic_year_range()
-    
     # ==========================================
-    # 1. 振替データの処理（未完了のみ取得）
+    # 1. 振替データ（今年度の未完了のみ。timestamp が読めない行も含める）
     # ==========================================
-    db_transfers = db.query(models.TransferRequest).filter(
-        models.TransferRequest.is_completed == False
-    ).all()
+    transfer_rows = db.query(
+        T.row_number,
+        func.coalesce(_jst_text(T.timestamp_at, "YYYY/MM/DD HH24:MI"), T.timestamp),
+        T.name,
+        T.instructor,
+        func.coalesce(_jst_text(T.original_date_at, "YYYY/MM/DD"), T.original_date),
+        T.candidate_dates,
+        T.reason,
+    ).filter(
+        T.is_completed == False,
+        (T.academic_year == academic_year) | (T.academic_year.is_(None))
+    ).order_by(T.timestamp_at.desc().nullslast(), T.row_number.desc()).limit(limit).all()
 
-    pending_transfers = []
-    remaining_counts_dict = {}
-
-    for t in db_transfers:
-        # タイムスタンプで今年度か判定
-        dt_jst = parse_gas_date(t.timestamp)
-        if dt_jst and not (start_dt <= dt_jst < end_dt): continue
-
-        orig_dt_jst = parse_gas_date(t.original_date)
-        orig_date_str = orig_dt_jst.strftime("%Y/%m/%d") if orig_dt_jst else t.original_date
-
-        row_dict = {
-            "rowNumber": t.row_number,
-            "timestamp": dt_jst.strftime("%Y/%m/%d %H:%M") if dt_jst else t.timestamp,
-            "name": t.name,
-            "instructor": t.instructor,
-            "originalDate": orig_date_str,
-            "candidateDates": t.candidate_dates,
-            "reason": t.reason,
+    pending_transfers = [
+        {
+            "rowNumber": row_number,
+            "timestamp": timestamp,
+            "name": name,
+            "instructor": instructor,
+            "originalDate": original_date,
+            "candidateDates": candidate_dates,
+            "reason": reason,
         }
-        pending_transfers.append(row_dict)
-        
-        # 残数カウント
-        if t.name:
-            remaining_counts_dict[t.name] = remaining_counts_dict.get(t.name, 0) + 1
-
-    # 新しい順にソート
-    pending_transfers.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        for row_number, timestamp, name, instructor, original_date, candidate_dates, reason in transfer_rows
+    ]
 
     # ==========================================
-    # 2. 欠席データの処理
+    # 2. 欠席データ（今年度のみ）
     # ==========================================
-    db_absences = db.query(models.AbsenceReport).all()
-    
-    recent_absences = []
-    absence_counts_dict = {}
-
-    for a in db_absences:
-        dt_jst = parse_gas_date(a.timestamp)
-        # 今年度のデータのみ対象
-        if dt_jst and (start_dt <= dt_jst < end_dt):
-            if a.name:
-                absence_counts_dict[a.name] = absence_counts_dict.get(a.name, 0) + 1
-            
-            row_dict = {
-                "rowNumber": a.row_number,
-                "timestamp": dt_jst.strftime("%Y/%m/%d %H:%M"),
-                "name": a.name,
-                "instructor": a.instructor,
-                "dayOfWeek": a.day_of_week,
-                "reason": a.reason,
-                "reportInfo": a.report_info
-            }
-            recent_absences.append(row_dict)
+    absence_rows = db.query(
+        A.row_number,
+        _jst_text(A.timestamp_at, "YYYY/MM/DD HH24:MI"),
+        A.name,
+        A.instructor,
+        A.day_of_week,
+        A.reason,
+        A.report_info,
+    ).filter(
+        A.academic_year == academic_year
+    ).order_by(A.timestamp_at.desc(), A.row_number.desc()).limit(limit).all()
 
-    # 新しい順にソート
-    recent_absences.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+    recent_absences = [
+        {
+            "rowNumber": row_number,
+            "timestamp": timestamp,
+            "name": name,
+            "instructor": instructor,
+            "dayOfWeek": day_of_week,
+            "reason": reason,
+            "reportInfo": report_info
+        }
+        for row_number, timestamp, name, instructor, day_of_week, reason, report_info in absence_rows
+    ]
 
     # ==========================================
-    # 3. データの結合と返却
+    # 3. 生徒ごとの件数は同期時に集計済みのテーブルから
     # ==========================================
+    counts = db.query(models.AttendanceCount).filter(
+        models.AttendanceCount.academic_year == academic_year
+    ).order_by(models.AttendanceCount.name).all()
+
     return {
         "pending_transfers": pending_transfers,
-        "remaining_counts": [{"name": k, "count": v} for k, v in remaining_counts_dict.items()],
-        "absence_counts": [{"name": k, "count": v} for k, v in absence_counts_dict.items()],
+        "remaining_counts": [{"name": c.name, "count": c.remaining_transfers} for c in counts if c.remaining_transfers],
+        "absence_counts": [{"name": c.name, "count": c.absences} for c in counts if c.absences],
         "recent_absences": recent_absences
     }
 
 @router.post("/transfers/complete")
 async def complete_transfer(req: CompleteTransferRequest):
     """振替完了の書き込み"""
-    async with httpx.AsyncClient() as client:
-        try:
-            payload = {"rowNumber": req.rowNumber, "name": req.name}
-            response = await client.post(GAS_URL, json=payload, follow_redirects=True)
-            response.raise_for_status()
-            result = response.json()
-            
-            if not result.get("success"):
-                raise HTTPException(status_code=400, detail=result.get("error", "スプレッドシートの更新に失敗しました"))
-                
-            return {"message": "振替を完了にしました"}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"スプレッドシートへの書き込みに失敗しました: {str(e)}")
+    try:
+        payload = {"rowNumber": req.rowNumber, "name": req.name}
+        response = await get_http_client().post(GAS_URL, json=payload)
+        response.raise_for_status()
+        result = response.json()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"スプレッドシートへの書き込みに失敗しました: {str(e)}")
+
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("error", "スプレッドシートの更新に失敗しました"))
+
+    # シート側が変わったので、DBにも裏で反映しておく
+    request_sync()
+    return {"message": "振替を完了にしました"}
 
 # WebhookでGASから送られてくるデータの形を定義
 class WebhookPayload(BaseModel):
@@ -158,53 +173,134 @@ class WebhookPayload(BaseModel):
     student_name: str
     instructor_name: str
     message: str
+    # 任意（この本文か Idempotency-Key ヘッダー）。フォームの回答IDやシートの行番号など、1回の申請ごとに違う値。
+    # 送られてきた時だけ再送の重複を除く（キーの無い古い GAS からのイベントはそのまま毎回通知する）
+    idempotency_key: Optional[str] = None
+
+# 1回のバッチで受け付ける最大イベント数
+WEBHOOK_BATCH_LIMIT = 1000
+
+def _webhook_event(payload: WebhookPayload, idempotency_key: Optional[str] = None) -> dict:
+    """
+    通知を作るためのイベントにする。キーがあれば同じイベントの再送は同じキーになり、通知は1回だけ作られる。
+    キーを本文から作ると、日付の入らない同じ文面の別の申請（同じ生徒の2回目の振替など）まで
+    再送とみなされて通知されなくなるので、キーが無い時は NULL のまま（ユニーク制約にかからず重複は除かない）
+    """
+    key_source = payload.idempotency_key or idempotency_key
+    return {
+        "title": "🔄 新規の振替申請" if payload.type == "transfer" else "❌ 新規の欠席連絡",
+        "message": payload.message,
+        "idempotency_key": hashlib.sha256(key_source.encode()).hexdigest() if key_source else None,
+        "student_name": payload.student_name,
+        "instructor_name": payload.instructor_name,
+    }
+
+def _fan_out(db: Session, events: List[dict]) -> int:
+    # 担当講師と生徒の校舎の管理者へ、まとめて1文で作成（再送分はスキップ）
+    notified = crud_notification.fan_out_notifications(db, events)
+    # 接続中の講師の画面へプッシュ（commit された時点で各ワーカーに届く）
+    notification_broker.notify_users(db, notified)
+    db.commit() # DBに変更を確定させる
+    return len(notified)
 
 @router.post("/webhook")
-async def receive_webhook(payload: WebhookPayload, db: Session = Depends(get_db)):
+def receive_webhook(
+    payload: WebhookPayload,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """GASからリアルタイム通知を受け取り、対象者のDBに保存する"""
-    
-    target_users = []
-    
-    # 1. 担当講師（usernameが一致するユーザー）を探す
-    instructor = db.query(models.User).filter(models.User.username == payload.instructor_name).first()
-    if instructor:
-        target_users.append(instructor)
-        
-    # 2. 全ての管理者(admin)を探す
-    admins = db.query(models.User).filter(models.User.role == "admin").all()
-    for admin in admins:
-        # もし担当講師自身がadminだった場合、通知が2重にならないようにスキップ
-        if instructor and admin.id == instructor.id:
-            continue
-        target_users.append(admin)
-        
-    # 3. DBに通知（Notification）を作成して保存
-    title = "🔄 新規の振替申請" if payload.type == "transfer" else "❌ 新規の欠席連絡"
-    
-    for user in target_users:
-        new_notif = models.Notification(
-            user_id=user.id,
-            title=title,
-            message=payload.message
-        )
-        db.add(new_notif)
-        
-    db.commit() # DBに変更を確定させる
-    
-    return {"status": "success", "notified_users": len(target_users)}
+    notified = _fan_out(db, [_webhook_event(payload, idempotency_key)])
+    return {"status": "success", "notified_users": notified}
+
+@router.post("/webhook/batch")
+def receive_webhook_batch(payloads: List[WebhookPayload], db: Session = Depends(get_db)):
+    """GASから複数のイベントをまとめて受け取る（朝の一斉送信などで1件ずつ送らなくて済むように）"""
+    if len(payloads) > WEBHOOK_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"一度に送れるイベントは{WEBHOOK_BATCH_LIMIT}件までです")
+    notified = _fan_out(db, [_webhook_event(p) for p in payloads])
+    return {"status": "success", "events": len(payloads), "notified_users": notified}
+
+def _unread_notifications_query(db: Session, user_id: int, since: Optional[int]):
+    query = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.is_read == False
+    )
+    if since is not None:
+        query = query.filter(models.Notification.id > since)
+    return query.order_by(models.Notification.id)
 
 @router.get("/notifications/unread")
 async def get_unread_notifications(
+    since: Optional[int] = Query(None, description="この通知IDより新しいものだけ"),
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(get_current_user)
 ):
     """ログイン中のユーザー宛ての「未読」通知を取得する"""
-    notifs = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).all()
-    
-    return notifs
+    return _unread_notifications_query(db, current_user.id, since).all()
+
+def _load_unread_notifications(user_id: int, since: Optional[int]):
+    # ストリームの中から呼ぶので、その都度短いセッションで読む
+    db = SessionLocal()
+    try:
+        notifs = _unread_notifications_query(db, user_id, since).limit(NOTIFICATION_BATCH_SIZE).all()
+        return [
+            {
+                "id": n.id,
+                "title": n.title,
+                "message": n.message,
+                "is_read": n.is_read,
+                "created_at": n.created_at.isoformat() if n.created_at else None,
+            }
+            for n in notifs
+        ]
+    finally:
+        db.close()
+
+@router.get("/notifications/stream")
+async def stream_notifications(
+    request: Request,
+    since: Optional[int] = Query(None, description="この通知IDより新しい未読から送る（省略時は未読すべて）"),
+    last_event_id: Optional[str] = Header(None),
+    current_user: models.User = Depends(get_current_user_for_stream)
+):
+    """
+    ログイン中のユーザー宛ての未読通知を Server-Sent Events で送り続ける。
+    接続直後に since より新しい未読を送り、その後は新しい通知が来るたびに送る。
+    再接続時はブラウザが Last-Event-ID を付けてくるので、続きから送る。
+    """
+    if last_event_id and last_event_id.isdigit():
+        since = max(since or 0, int(last_event_id))
+    user_id = current_user.id
+
+    async def event_stream():
+        # 先に購読してから未読を読む（読んでいる間に来た通知も取りこぼさない）
+        wakeup = notification_broker.subscribe(user_id)
+        cursor = since
+        deadline = asyncio.get_running_loop().time() + NOTIFICATION_STREAM_MAX_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            while asyncio.get_running_loop().time() < deadline:
+                notifs = await run_in_threadpool(_load_unread_notifications, user_id, cursor)
+                for n in notifs:
+                    cursor = n["id"]
+                    yield f"id: {n['id']}\nevent: notification\ndata: {json.dumps(n, ensure_ascii=False)}\n\n"
+                if len(notifs) == NOTIFICATION_BATCH_SIZE:
+                    continue  # まだ残っている
+                try:
+                    await asyncio.wait_for(wakeup.get(), timeout=NOTIFICATION_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+        finally:
+            notification_broker.unsubscribe(user_id, wakeup)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/notifications/{notif_id}/read")
 async def mark_notification_read(
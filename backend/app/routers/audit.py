@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
+import base64
+import json
+from itertools import islice
 
-from app.db.database import get_db
-from app.models.models import AuditLog, User
+from app.db.database import get_db, SessionLocal
+from app.models.models import AuditCategory, AuditLog, User
+from app.services.audit_writer import audit_writer
+from app.services.audit_archive import AuditLogFilter, iter_archived_logs, merge_logs
 from app.routers.auth import get_current_user
+from app.routers.deps import get_current_admin_user
 
 router = APIRouter()
 
@@ -31,40 +41,175 @@ def log_action(db: Session, user_id: int, action: str, branch_id: int = None, de
     """
     他のAPIエンドポイントの中で `log_action(db, user.id, "LOGIN", user.branch_id, "ログイン成功")` 
     のように呼び出して使います。
+    書き込みは監査ログライターがまとめて行うので、ここでは commit しません（db は互換のため残しています）。
     """
-    new_log = AuditLog(
-        user_id=user_id,
-        action=action,
-        branch_id=branch_id,
-        details=details,
-        timestamp=datetime.utcnow()
-    )
-    db.add(new_log)
-    db.commit()
+    audit_writer.log(user_id, action, branch_id, details)
 
 # ==========================================
 # 3. 監査ログを取得するAPI (ここで権限の分岐！)
 # ==========================================
-@router.get("/logs")
-def get_audit_logs(session: Session = Depends(get_db)):
-    # 🌟変更: Userテーブルをくっつけて名前を取得
-    logs = session.query(
-        AuditLog, 
+EXPORT_BATCH_SIZE = 1000
+
+def _encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """(timestamp, id) を次ページ取得用の文字列にする"""
+    raw = f"{timestamp.isoformat()}|{log_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ts, log_id = raw.split("|")
+        return datetime.fromisoformat(ts), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor が不正です")
+
+def _log_filter(
+    action: Optional[str] = None,
+    action_category: Optional[str] = None,
+    student_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    school: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> AuditLogFilter:
+    """一覧・エクスポート共通のクエリパラメータ"""
+    category = None
+    if action_category:
+        try:
+            category = AuditCategory(action_category.lower())
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"action_category は {[c.value for c in AuditCategory]} のいずれかです")
+    return AuditLogFilter(
+        action=action, category=category, student_id=student_id, user_id=user_id,
+        school=school, branch_id=branch_id, date_from=date_from, date_to=date_to,
+    )
+
+def _scoped_log_filter(
+    f: AuditLogFilter = Depends(_log_filter),
+    current_user: User = Depends(get_current_admin_user),
+) -> AuditLogFilter:
+    """
+    監査ログを見られるのは developer と admin だけ。
+    admin は自分の校舎の講師のログだけ（school の指定は無視して自分の校舎にする）
+    """
+    if current_user.role != "developer":
+        if not current_user.school:
+            raise HTTPException(status_code=403, detail="所属校舎が設定されていません")
+        f.school = current_user.school
+    return f
+
+def _filtered_logs_query(session: Session, f: AuditLogFilter):
+    """絞り込み条件をつけた (AuditLog, user_name) のクエリ。どの条件も (条件列, timestamp, id) の複合インデックスに乗る"""
+    query = session.query(
+        AuditLog,
         User.username.label("user_name")
     ).outerjoin(
         User, AuditLog.user_id == User.id
-    ).order_by(AuditLog.timestamp.desc()).all()
-    
-    result = []
-    for log, user_name in logs:
-        result.append({
-            "id": log.id,
-            "user_id": log.user_id,
-            "user_name": user_name, # 🌟ここに追加！
-            "action": log.action,
-            "branch_id": log.branch_id,
-            "details": log.details,
-            "timestamp": log.timestamp
-        })
-        
-    return result
\ No newline at end of file
+    )
+
+    if f.action:
+        query = query.filter(AuditLog.action == f.action)
+    if f.category:
+        query = query.filter(AuditLog.category == f.category)
+    if f.student_id is not None:
+        if session.get_bind().dialect.name == "postgresql":
+            # payload @> '{"student_id": X}' → GINインデックスを使う
+            query = query.filter(type_coerce(AuditLog.payload, JSONB).contains({"student_id": f.student_id}))
+        else:
+            query = query.filter(AuditLog.payload["student_id"].as_integer() == f.student_id)
+    if f.user_id is not None:
+        query = query.filter(AuditLog.user_id == f.user_id)
+    if f.school:
+        query = query.filter(AuditLog.user_id.in_(select(User.id).where(User.school == f.school)))
+    if f.branch_id is not None:
+        query = query.filter(AuditLog.branch_id == f.branch_id)
+    # timestamp の範囲はパーティションの絞り込み（pruning）にも効く
+    if f.date_from:
+        query = query.filter(AuditLog.timestamp >= f.date_from)
+    if f.date_to:
+        query = query.filter(AuditLog.timestamp < f.date_to)
+
+    return query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())
+
+def _after_cursor(query, ts: datetime, log_id: int):
+    """(timestamp, id) が cursor より古いものだけ"""
+    return query.filter(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(ts, log_id))
+
+def _log_to_dict(log: AuditLog, user_name: Optional[str]) -> dict:
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "user_name": user_name, # 🌟ここに追加！
+        "action": log.action,
+        "category": log.category.value if log.category else None,
+        "branch_id": log.branch_id,
+        "details": log.details,
+        "payload": log.payload,
+        "timestamp": log.timestamp
+    }
+
+@router.get("/logs")
+def get_audit_logs(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    f: AuditLogFilter = Depends(_scoped_log_filter),
+    session: Session = Depends(get_db)
+):
+    """
+    新しい順に limit 件ずつ返す。続きは next_cursor をそのまま cursor に渡して取得する。
+    DBの行とアーカイブ済みの古い月のファイルの行を、(timestamp, id) の順にマージして返す。
+    """
+    before = _decode_cursor(cursor) if cursor else None
+    query = _filtered_logs_query(session, f)
+    if before:
+        query = _after_cursor(query, *before)
+
+    # DB の行とアーカイブの行を (timestamp, id) の順でマージする（DEFAULT パーティションなどには
+    # アーカイブ済みの月より古い行もありうるので、DB → アーカイブと単純につなげると順番が崩れる）。
+    # 1件多く取って「次があるか」を判定
+    db_items = [_log_to_dict(log, user_name) for log, user_name in query.limit(limit + 1).all()]
+    items = list(islice(merge_logs(iter(db_items), iter_archived_logs(session, f, before)), limit + 1))
+
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(items[-1]["timestamp"], items[-1]["id"]) if has_more else None,
+    }
+
+@router.get("/logs/export")
+def export_audit_logs(f: AuditLogFilter = Depends(_scoped_log_filter)):
+    """
+    条件に合う監査ログを NDJSON（1行1ログ）でストリーミング出力する。
+    全件をメモリに載せないよう、カーソルで EXPORT_BATCH_SIZE 件ずつ読みながら流す。
+    DBの分とアーカイブ済みの分は (timestamp, id) の新しい順にマージして流す。
+    """
+    def iter_db_logs(db: Session):
+        base_query = _filtered_logs_query(db, f)
+        query = base_query
+        while True:
+            rows = query.limit(EXPORT_BATCH_SIZE).all()
+            for log, user_name in rows:
+                yield _log_to_dict(log, user_name)
+            if len(rows) < EXPORT_BATCH_SIZE:
+                break
+            query = _after_cursor(base_query, rows[-1][0].timestamp, rows[-1][0].id)
+            db.expunge_all()
+
+    def generate():
+        # レスポンスを流している間も使えるよう、セッションはジェネレーター側で持つ
+        db = SessionLocal()
+        try:
+            for row in merge_logs(iter_db_logs(db), iter_archived_logs(db, f)):
+                yield json.dumps(jsonable_encoder(row), ensure_ascii=False) + "\n"
+        finally:
+            db.close()
+
+    filename = f"audit_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,112 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
-import csv
-import io
 import logging
 
 from app.db.database import get_db
-from app.models.models import MasterTextbook, Student, User, AuditLog
-# ※ get_current_user があればインポートして、誰がインポートしたかログに残せます
+from app.models.models import ImportJob, User
+from app.routers.deps import get_current_developer_user
+from app.services import csv_importer
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# ==========================================
-# 1. 各データごとの「正しいフォーマット（ヘッダー）」を定義
-# ==========================================
-EXPECTED_HEADERS = {
-    "textbook": ["subject", "level", "book_name", "duration"],
-    "student": ["name", "grade", "school", "deviation_value"], # branch_id から school へ変更
-    "user": ["username", "role", "school"]
-}
+# 各データごとの「正しいフォーマット（ヘッダー）」は services/csv_importer.py で定義
+EXPECTED_HEADERS = csv_importer.EXPECTED_HEADERS
 
 @router.post("/upload")
-async def import_csv(
+def import_csv(
+    background_tasks: BackgroundTasks,
     import_type: str = Form(...),
     file: UploadFile = File(...),
-    session: Session = Depends(get_db)
+    dry_run: bool = Form(False),
+    background: bool = Form(False),
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_developer_user)
 ):
+    """
+    CSVを少しずつ読みながら一括で UPSERT する（services/csv_importer.py）。
+    講師の権限・校舎や全校舎の生徒を書き換えられるので developer のみ。
+    dry_run=true なら保存せずに、新規・更新になる行と差分を返す。
+    background=true ならジョブとして登録してすぐに job_id を返す（進み具合は /jobs/{job_id}）。
+    """
     if import_type not in EXPECTED_HEADERS:
         raise HTTPException(status_code=400, detail="無効なデータ種別です")
 
-    # ① ファイル読み込み
-    contents = await file.read()
-    try:
-        decoded = contents.decode('utf-8-sig')
-    except UnicodeDecodeError:
-        try:
-            decoded = contents.decode('cp932')
-        except:
-            raise HTTPException(status_code=400, detail="文字コードが不明です。UTF-8で保存してください。")
-
-    # ② ★ここで確実に 'reader' を定義する！
-    f = io.StringIO(decoded)
-    reader = csv.DictReader(f, skipinitialspace=True) # <--- ここに引数を追加！
-    
-    # さらに念押しで、ヘッダー名の前後の空白を完全に除去する処理を入れると最強です
-    if reader.fieldnames:
-        reader.fieldnames = [name.strip() for name in reader.fieldnames]
-
-    actual_cols = reader.fieldnames
-    if not actual_cols:
-        raise HTTPException(status_code=400, detail="CSVが空です")
-
-    # ヘッダーチェック
-    expected_cols = EXPECTED_HEADERS[import_type]
-    missing = [c for c in expected_cols if c not in actual_cols]
-    if missing:
-        raise HTTPException(status_code=400, detail=f"列が足りません: {', '.join(missing)}")
+    if background and not dry_run:
+        job = csv_importer.create_import_job(session, import_type, file.file, file.filename)
+        # レスポンスを返した後にスレッドで実行（落ちても定期実行が続きから再開する）
+        background_tasks.add_task(csv_importer.run_import_job, job.id)
+        return {
+            "message": "インポートを受け付けました。進み具合は画面で確認できます",
+            "job_id": job.id,
+            "status_url": f"/csv_import/jobs/{job.id}",
+        }
 
-    success_count = 0
-    update_count = 0
-
-    # ③ 保存処理
+    # ① ファイルは一度に全部読まず、文字コードだけ先頭で判定して少しずつ読む
+    text = csv_importer.open_csv_text(file.file)
     try:
-        for row in reader:
-            if import_type == "textbook":
-                # 数値変換の安全策
-                try:
-                    dur = float(row["duration"]) if row.get("duration") else 0.0
-                except: dur = 0.0
-
-                existing = session.query(MasterTextbook).filter(
-                    MasterTextbook.subject == row["subject"],
-                    MasterTextbook.book_name == row["book_name"]
-                ).first()
-                if existing:
-                    existing.level = row["level"]
-                    existing.duration = dur
-                    update_count += 1
-                else:
-                    session.add(MasterTextbook(
-                        subject=row["subject"], level=row["level"],
-                        book_name=row["book_name"], duration=dur
-                    ))
-                    success_count += 1
-
-            elif import_type == "student":
-                try:
-                    dev = float(row["deviation_value"]) if row.get("deviation_value") else None
-                except: dev = None
-
-                existing = session.query(Student).filter(
-                    Student.name == row["name"], Student.school == row["school"]
-                ).first()
-                if existing:
-                    existing.grade = row["grade"]
-                    existing.deviation_value = dev
-                    update_count += 1
-                else:
-                    session.add(Student(
-                        name=row["name"], grade=row["grade"],
-                        school=row["school"], deviation_value=dev
-                    ))
-                    success_count += 1
-
-        session.commit()
-        return {"message": f"インポート完了！\n新規: {success_count}件\n更新: {update_count}件"}
+        rows = csv_importer.read_rows(text, EXPECTED_HEADERS[import_type])
+        # ② 保存処理（チャンクごとに一括 UPSERT。全体で1トランザクション）
+        result = csv_importer.import_csv_rows(session, import_type, rows, dry_run=dry_run)
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+        return result.to_dict()
 
+    except csv_importer.CsvImportError as e:
+        session.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         session.rollback()
         logger.error(f"Import Error: {e}")
-        raise HTTPException(status_code=500, detail=f"保存失敗: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"保存失敗: {str(e)}")
+    finally:
+        # アップロードされたファイルは FastAPI が閉じるので、ラッパーだけ外す
+        text.detach()
+
+
+@router.get("/jobs/{job_id}")
+def get_import_job(
+    job_id: int,
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_developer_user)
+):
+    """バックグラウンドのインポートの進み具合（処理した行数・エラー・残り時間の目安）"""
+    job = session.query(ImportJob).filter(ImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return csv_importer.job_to_dict(job)
@@ -1,8 +1,8 @@
 # backend/app/routers/dashboard.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc
+from sqlalchemy import desc, func, select
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -10,40 +10,18 @@ import logging
 import json
 
 from app.db.database import get_db
-from app.models.models import Progress, EikenResult, MasterTextbook, BulkPreset, BulkPresetBook, User, Student, AuditLog
+from app.models.models import Progress, EikenResult, MasterTextbook, BulkPreset, BulkPresetBook, User, Student, StudentProgressSummary
 from app.routers.auth import get_current_user
 from app.routers.deps import get_current_admin_user
+from app.services.audit_writer import audit_writer
+from app.services import progress_aggregation
+from app.crud import crud_user
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_adjusted_duration(base_duration: float, book_level: str, student_dev: Optional[float]) -> float:
-    if not base_duration or not student_dev or not book_level:
-        return float(base_duration or 0.0)
-
-    level_map = {
-        "基礎徹底": 50,
-        "日大": 60,
-        "MARCH": 70,
-        "早慶": 75
-    }
-
-    target_dev = None
-    for key, val in level_map.items():
-        if key in book_level:
-            target_dev = val
-            break
-            
-    if target_dev is None:
-        return float(base_duration)
-
-    diff = target_dev - student_dev
-    adjusted_time = base_duration + base_duration * diff * 0.025
-    adjusted_time = max(0.1, adjusted_time)
-    return round(adjusted_time, 1)
-
 class DashboardData(BaseModel):
     student_id: int
     total_study_time: float      
@@ -96,7 +74,7 @@ def get_master_books(session: Session = Depends(get_db)):
     return session.query(MasterTextbook).all()
 
 @router.post("/progress/batch")
-def add_progress_batch(data: ProgressCreate, session: Session = Depends(get_db)):
+def add_progress_batch(data: ProgressCreate, session: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     added_items = []
     added_book_names = [] # 🌟ログ用に名前を集めるリスト
 
@@ -132,21 +110,27 @@ def add_progress_batch(data: ProgressCreate, session: Session = Depends(get_db))
         student_name = student.name if student else f"ID:{data.student_id}"
 
         details_dict = {
+            "student_id": data.student_id,
             "student_name": student_name,
             "book_name": " / ".join(added_book_names), # 追加した本をスラッシュ区切りで連結
             "completed": f"新規一括追加（計 {len(added_items)} 冊）"
         }
         
-        audit_log = AuditLog(
-            user_id=None, 
-            action="ADD_PROGRESS_BATCH", # PROGRESSを含めることでフロントのフィルターに引っかかる
-            branch_id=None,
-            details=json.dumps(details_dict, ensure_ascii=False)
-        )
-        session.add(audit_log)
     # 🌟🌟ここまで🌟🌟
 
+    # 集計テーブルも同じトランザクションで更新
+    if added_items:
+        progress_aggregation.refresh_student_summaries(session, [data.student_id])
+
     session.commit()
+
+    # 監査ログは保存が確定してからキューに積む（書き込みはバックグラウンドでまとめて行う）
+    if added_items:
+        audit_writer.log(
+            current_user.id,
+            "ADD_PROGRESS_BATCH", # PROGRESSを含めることでフロントのフィルターに引っかかる
+            details=details_dict
+        )
     return {"message": f"{len(added_items)} items added"}
 
 
@@ -162,57 +146,8 @@ def get_dashboard_data(student_id: int, session: Session = Depends(get_db)):
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    student_dev = getattr(student, "deviation_value", None)
-
-    progress_items = session.query(Progress).filter(Progress.student_id == student_id).all()
-    
-    total_completed_time = 0.0
-    total_planned_time = 0.0
-    weighted_progress_sum = 0.0 
-    total_duration_for_rate = 0.0 
-    simple_ratios = [] 
-
-    if progress_items:
-# その生徒が登録している参考書名だけを抽出
-        book_names = list(set([item.book_name for item in progress_items if item.book_name]))
-        
-        # 必要なマスターデータだけをDBから取得（大幅な高速化）
-        masters = session.query(MasterTextbook).filter(MasterTextbook.book_name.in_(book_names)).all()
-        master_map = { (m.subject, m.book_name): m for m in masters }
-
-        for item in progress_items:
-            duration = item.duration
-            book_level = item.level
-            
-            if (duration is None or duration <= 0) and item.subject and item.book_name:
-                master_book = master_map.get((item.subject, item.book_name))
-                if master_book:
-                    duration = master_book.duration
-                    if not book_level:
-                        book_level = master_book.level
-            
-            duration = float(duration or 0)
-            
-            adjusted_duration = get_adjusted_duration(duration, book_level, student_dev)
-
-            ratio = 0.0
-            if (item.total_units or 0) > 0:
-                ratio = min(1.0, (item.completed_units or 0) / item.total_units)
-            
-            simple_ratios.append(ratio)
-
-            if adjusted_duration > 0:
-                total_planned_time += adjusted_duration
-                total_completed_time += ratio * adjusted_duration
-                
-                weighted_progress_sum += ratio * adjusted_duration
-                total_duration_for_rate += adjusted_duration
-
-    total_progress_pct = 0.0
-    if total_duration_for_rate > 0:
-        total_progress_pct = (weighted_progress_sum / total_duration_for_rate) * 100
-    elif len(simple_ratios) > 0:
-        total_progress_pct = (sum(simple_ratios) / len(simple_ratios)) * 100
+    # 予定・実績時間と進捗率は集計テーブルから主キーで読む
+    totals = progress_aggregation.load_student_totals(session, student_id)
 
     latest_eiken = session.query(EikenResult).filter(EikenResult.student_id == student_id).order_by(desc(EikenResult.exam_date)).first()
     eiken_grade = latest_eiken.grade or "未登録" if latest_eiken else "未登録"
@@ -221,9 +156,9 @@ def get_dashboard_data(student_id: int, session: Session = Depends(get_db)):
 
     return {
         "student_id": student.id if hasattr(student, 'id') else student_id,
-        "total_study_time": round(total_completed_time, 1),
-        "total_planned_time": round(total_planned_time, 1),
-        "progress_rate": round(total_progress_pct, 1),
+        "total_study_time": round(totals.completed_time, 1),
+        "total_planned_time": round(totals.planned_time, 1),
+        "progress_rate": round(totals.progress_rate, 1),
         "eiken_grade": eiken_grade,
         "eiken_score": eiken_score,
         "eiken_date": eiken_date
@@ -232,58 +167,12 @@ def get_dashboard_data(student_id: int, session: Session = Depends(get_db)):
 
 @router.get("/chart/{student_id}")
 def get_subject_chart(student_id: int, session: Session = Depends(get_db)):
-    student = session.query(Student).filter(Student.id == student_id).first()
-    student_dev = getattr(student, "deviation_value", None)
-
-    items = session.query(Progress).filter(Progress.student_id == student_id).all()
-    subject_stats = {} 
-    
-    all_masters = session.query(MasterTextbook).all()
-    master_map = { (m.subject, m.book_name): m for m in all_masters }
+    subject_totals = progress_aggregation.load_subject_totals(session, student_id)
 
-    for item in items:
-        if (item.total_units or 0) <= 0:
-            continue
-
-        subj = item.subject or "その他"
-        if subj not in subject_stats:
-            subject_stats[subj] = {"planned": 0.0, "completed": 0.0, "ratios": []}
-
-        duration = item.duration
-        book_level = item.level
-        if (duration is None or duration <= 0) and item.subject and item.book_name:
-            master_book = master_map.get((item.subject, item.book_name))
-            if master_book:
-                duration = master_book.duration
-                if not book_level:
-                    book_level = master_book.level
-                    
-        duration = float(duration or 0)
-        
-        adjusted_duration = get_adjusted_duration(duration, book_level, student_dev)
-
-        ratio = min(1.0, (item.completed_units or 0) / item.total_units)
-        subject_stats[subj]["ratios"].append(ratio * 100)
-        
-        if adjusted_duration > 0:
-            subject_stats[subj]["planned"] += adjusted_duration
-            subject_stats[subj]["completed"] += ratio * adjusted_duration
-            
-    result = []
-    for subj, stats in subject_stats.items():
-        if stats["planned"] > 0:
-            avg_progress = (stats["completed"] / stats["planned"]) * 100
-        elif stats["ratios"]:
-            avg_progress = sum(stats["ratios"]) / len(stats["ratios"])
-        else:
-            avg_progress = 0.0
-            
-        result.append({
-            "subject": subj,
-            "progress": round(avg_progress, 1)
-        })
-        
-    return result
+    return [
+        {"subject": t.subject or "その他", "progress": round(t.progress_rate, 1)}
+        for t in subject_totals
+    ]
 
 @router.get("/list/{student_id}")
 def get_progress_list(student_id: int, session: Session = Depends(get_db)) -> List[Dict[str, Any]]:
@@ -311,28 +200,30 @@ def update_progress(row_id: int, update_data: ProgressUpdate, session: Session =
 
     # フロントエンドが綺麗にバッジ化できるようにJSON形式で詳細を作る
     details_dict = {
+        "student_id": progress_item.student_id,
         "student_name": student_name,
         "book_name": progress_item.book_name,
         "completed": f"{old_completed} → {update_data.completed_units} / {update_data.total_units}"
     }
     
-    # 監査ログレコードの作成
-    audit_log = AuditLog(
-        user_id=current_user.id,
-        action="UPDATE_PROGRESS", # フロントの `includes('PROGRESS')` に引っかかるように！
-        branch_id=None,
-        details=json.dumps(details_dict, ensure_ascii=False)
-    )
-    session.add(audit_log)
     # 🌟🌟ここまで🌟🌟
 
-    # 一緒に保存！
+    # 集計テーブルも一緒に更新
+    progress_aggregation.refresh_student_summaries(session, [progress_item.student_id])
+
     session.commit()
     session.refresh(progress_item)
+
+    # 監査ログは保存が確定してからキューに積む（書き込みはバックグラウンドでまとめて行う）
+    audit_writer.log(
+        current_user.id,
+        "UPDATE_PROGRESS", # フロントの `includes('PROGRESS')` に引っかかるように！
+        details=details_dict
+    )
     return progress_item
 
 @router.delete("/progress/{row_id}")
-def delete_progress(row_id: int, session: Session = Depends(get_db)):
+def delete_progress(row_id: int, session: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     progress_item = session.query(Progress).filter(Progress.id == row_id).first()
     if not progress_item: 
         raise HTTPException(status_code=404, detail="Progress item not found")
@@ -342,149 +233,90 @@ def delete_progress(row_id: int, session: Session = Depends(get_db)):
     student_name = student.name if student else f"ID:{progress_item.student_id}"
 
     details_dict = {
+        "student_id": progress_item.student_id,
         "student_name": student_name,
         "book_name": progress_item.book_name,
         "completed": f"削除時の進捗: {progress_item.completed_units or 0} / {progress_item.total_units}"
     }
     
-    audit_log = AuditLog(
-        user_id=None,
-        action="DELETE_PROGRESS", # PROGRESSを含めることでフィルター対象に
-        branch_id=None,
-        details=json.dumps(details_dict, ensure_ascii=False)
-    )
-    session.add(audit_log)
     # 🌟🌟ここまで🌟🌟
 
-    # ログを作った後に、本体を削除してコミット！
+    # 情報を抜き取った後に、本体を削除してコミット！
     session.delete(progress_item)
+    progress_aggregation.refresh_student_summaries(session, [progress_item.student_id])
     session.commit()
+
+    audit_writer.log(
+        current_user.id,
+        "DELETE_PROGRESS", # PROGRESSを含めることでフィルター対象に
+        details=details_dict
+    )
     return {"message": "Deleted successfully"}
 
 @router.get("/admin/study-time-summary")
 def get_study_time_summary(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
     session: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
     ):
     """
     管理者画面用: 全生徒の学習予定時間と実績時間の乖離をチェックするAPI
+    集計・並び替え・ページングまで1本のSQLで行う
     """
-    # 1. 退塾済以外の全生徒を取得(管理者の所属している校舎のみ)
-    query = session.query(Student).filter(Student.grade != "退塾済")
+    # 1. 退塾済以外の全生徒が対象(管理者の所属している校舎のみ)
+    student_filters = [Student.grade != "退塾済"]
     if current_user.role == "admin":
-        query = query.filter(Student.school == current_user.school)
-        
-    students = query.all()
-    
-    # 全ての進捗データとマスターデータを一括で取得（N+1問題回避のため）
-    student_ids = [s.id for s in students]
-    all_progress = session.query(Progress).filter(Progress.student_id.in_(student_ids)).all()
-    
-    all_masters = session.query(MasterTextbook).all()
-    master_map = { (m.subject, m.book_name): m for m in all_masters }
-
-    summary_list = []
+        student_filters.append(Student.school == current_user.school)
+
+    # 2. 生徒ごとの予定・実績時間（偏差値による傾斜は集計テーブル作成時にDB側で計算済み）
+    # 集計テーブルは進捗を書き込む処理の中で更新される（導入前のデータは backfill_progress_summary.py で作る）。
+    # 対象の生徒の分だけ集計する（他の校舎の生徒まで合計しない）
+    target_students = select(Student.id).where(*student_filters)
+    totals = (
+        select(
+            StudentProgressSummary.student_id,
+            func.sum(StudentProgressSummary.planned_time).label("planned_time"),
+            func.sum(StudentProgressSummary.completed_time).label("completed_time"),
+        )
+        .where(StudentProgressSummary.student_id.in_(target_students))
+        .group_by(StudentProgressSummary.student_id)
+        .subquery("totals")
+    )
 
-    for student in students:
-        # この生徒の進捗データだけを抽出
-        my_progress = [p for p in all_progress if p.student_id == student.id]
-        
-        total_planned = 0.0
-        total_actual = 0.0
-        student_dev = getattr(student, "deviation_value", None)
-
-        for item in my_progress:
-            duration = item.duration
-            book_level = item.level
-            
-            # マスターデータからの補完
-            if (duration is None or duration <= 0) and item.subject and item.book_name:
-                master_book = master_map.get((item.subject, item.book_name))
-                if master_book:
-                    duration = master_book.duration
-                    if not book_level:
-                        book_level = master_book.level
-            
-            duration = float(duration or 0.0)
-            
-            # 偏差値による傾斜計算（ダッシュボードと同じロジック）
-            adjusted_duration = get_adjusted_duration(duration, book_level, student_dev)
-
-            # 進捗率の計算
-            ratio = 0.0
-            if (item.total_units or 0) > 0:
-                ratio = min(1.0, (item.completed_units or 0) / item.total_units)
-
-            if adjusted_duration > 0:
-                total_planned += adjusted_duration
-                total_actual += ratio * adjusted_duration
-
-        # 差分の計算（実績 - 予定）
-        diff = total_actual - total_planned
-
-        summary_list.append({
-            "student_id": student.id,
-            "name": student.name,
-            "grade": student.grade or "未設定",
-            "planned_time": round(total_planned, 1),
-            "actual_time": round(total_actual, 1),
-            "diff": round(diff, 1)
-        })
-
-    # 差分の絶対値が大きい順（つまり違和感が大きい順）に並び替えて返す
-    summary_list.sort(key=lambda x: abs(x["diff"]), reverse=True)
-    
-    return summary_list
+    planned = func.coalesce(totals.c.planned_time, 0.0)
+    actual = func.coalesce(totals.c.completed_time, 0.0)
+    diff = actual - planned
+
+    # 3. 差分の絶対値が大きい順（つまり違和感が大きい順）に並び替え
+    stmt = (
+        select(Student.id, Student.name, Student.grade, planned.label("planned_time"), actual.label("actual_time"))
+        .outerjoin(totals, totals.c.student_id == Student.id)
+        .where(*student_filters)
+        .order_by(func.abs(diff).desc(), Student.id)
+        .offset(skip)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return [
+        {
+            "student_id": row.id,
+            "name": row.name,
+            "grade": row.grade or "未設定",
+            "planned_time": round(row.planned_time, 1),
+            "actual_time": round(row.actual_time, 1),
+            # 差分の計算（実績 - 予定）
+            "diff": round(row.actual_time - row.planned_time, 1)
+        }
+        for row in session.execute(stmt)
+    ]
 
 @router.get("/admin/inactive-users")
 def get_inactive_users(session: Session = Depends(get_db)):
     """
     管理者用: 1ヶ月間(30日)進捗を更新していない講師(User)を抽出するAPI
+    講師ごとの最終操作日時の表を引くだけなので、ユーザー数・ログ件数に関わらず1クエリ
     """
-    # 30日前の日時を計算
-    threshold_date = datetime.now() - timedelta(days=30)
-    
-    # ユーザー一覧を取得（※もしUserモデルに role などの権限カラムがあり、
-    # 管理者をアラートから除外したい場合は filter(User.role != 'admin') などを足してください）
-    users = session.query(User).all()
-    
-    inactive_users = []
-    
-    for u in users:
-        # このユーザーが実行した最新の「進捗関連の操作」ログを取得
-        # action名が "UPDATE_PROGRESS", "ADD_PROGRESS_BATCH" などPROGRESSを含むものを検索
-        last_log = session.query(AuditLog).filter(
-            AuditLog.user_id == u.id,
-            AuditLog.action.like("%PROGRESS%")
-        ).order_by(desc(AuditLog.id)).first()  # ID降順で最新のログを取得
-        
-        user_name = getattr(u, 'username', getattr(u, 'name', f"ユーザー{u.id}"))
-        
-        if last_log:
-            # AuditLogモデルに作成日時のカラム（created_at等）があることを想定
-            last_date = getattr(last_log, 'created_at', None)
-            
-            if last_date and last_date < threshold_date:
-                days_inactive = (datetime.now() - last_date).days
-                inactive_users.append({
-                    "user_id": u.id,
-                    "name": user_name,
-                    "last_update": last_date.strftime("%Y-%m-%d"),
-                    "days_inactive": days_inactive
-                })
-        else:
-            # ログが1件もない（一度も進捗更新をしたことがない）場合
-            inactive_users.append({
-                "user_id": u.id,
-                "name": user_name,
-                "last_update": "記録なし",
-                "days_inactive": "30+"
-            })
-            
-    # 放置日数が多い順に並び替え（「記録なし(30+)」を一番上にする）
-    inactive_users.sort(
-        key=lambda x: 9999 if str(x["days_inactive"]) == "30+" else int(x["days_inactive"]), 
-        reverse=True
-    )
-    
-    return inactive_users
\ No newline at end of file
+    # 放置日数が多い順（「記録なし(30+)」が一番上）で返る
+    return crud_user.get_inactive_users(session, days=30)
\ No newline at end of file
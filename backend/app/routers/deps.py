@@ -1,4 +1,5 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
@@ -9,6 +10,7 @@ from app.crud.crud_user import get_user_by_username
 from app.schemas.schemas import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
@@ -56,4 +58,22 @@ def get_current_admin_user(current_user = Depends(get_current_user)):
 def get_current_developer_user(current_user = Depends(get_current_user)):
     if current_user.role != "developer":
         raise HTTPException(status_code=403, detail="The user does not have enough privileges")
-    return current_user
\ No newline at end of file
+    return current_user
+
+def get_current_user_for_stream(
+    token: Optional[str] = Query(None),
+    header_token: Optional[str] = Depends(oauth2_scheme_optional),
+    db: Session = Depends(get_db),
+):
+    """SSE 用。EventSource はヘッダーを付けられないので ?token= でも認証できるようにする"""
+    token = header_token or token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = get_current_user(token=token, db=db)
+    # ストリームの間ずっとDB接続を持ち続けないよう、ここで返しておく
+    db.close()
+    return user
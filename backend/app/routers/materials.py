@@ -1,17 +1,44 @@
+import base64
 import os
-import shutil
+from functools import partial
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from urllib.parse import quote
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, UploadFile, File, Form, Query
+from fastapi.routing import APIRoute
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.db.database import get_db
 from app.crud import crud_materials
 from app.schemas import schemas
+from app.services import material_files
+from app.services.blob_store import BlobInfo, BlobTooLarge, blob_store
+from app.services.material_search import index_material_content
+from app.utils.range_response import file_response
 
-router = APIRouter()
-UPLOAD_DIR = "uploaded_materials"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# アップロードの Content-Length に、PDF 本体の上限に加えて認める分（タイトル・メモなどのフォーム項目と区切り）
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+class _UploadLimitRoute(APIRoute):
+    """
+    Content-Length が上限を超えるアップロードは、本体を受け取る前に 413 にする。
+    FastAPI はエンドポイントを呼ぶ前にフォームを全部受け取って一時ファイルに書くので、エンドポイントの中では遅い。
+    Content-Length が無い（chunked の）時は _store_upload の書きながらの確認で止める
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request):
+            length = request.headers.get("content-length")
+            limit = settings.MATERIAL_UPLOAD_MAX_MB * 1024 * 1024 + UPLOAD_FORM_OVERHEAD_BYTES
+            if length and length.isdigit() and int(length) > limit:
+                raise HTTPException(status_code=413, detail=f"ファイルサイズは{settings.MATERIAL_UPLOAD_MAX_MB}MBまでです")
+            return await handler(request)
+
+        return limited_handler
+
+router = APIRouter(route_class=_UploadLimitRoute)
 
 # --- タグ関連エンドポイント ---
 @router.get("/tags/subjects", response_model=List[schemas.SubjectTagResponse])
@@ -43,8 +70,32 @@ def delete_detail_tag(tag_id: int, db: Session = Depends(get_db)):
 
 
 # --- 教材関連エンドポイント ---
+def _store_upload(db: Session, file: UploadFile) -> BlobInfo:
+    """
+    アップロードされたPDFを blob_store に保存する（ハッシュを取りながら少しずつ書くので、大きなファイルでもメモリは一定）。
+    保存名は中身の SHA-256 なので、同じファイル名の別の教材を上書きすることはない。
+    教材の行を commit するまで、同じ blob は他のリクエストから消されない（material_files.store_blob）
+    """
+    if not file.filename.lower().endswith('.pdf') or not material_files.is_pdf(file.file):
+        raise HTTPException(status_code=400, detail="PDFファイルのみアップロード可能です")
+    try:
+        return material_files.store_blob(db, file.file, max_bytes=settings.MATERIAL_UPLOAD_MAX_MB * 1024 * 1024)
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail=f"ファイルサイズは{settings.MATERIAL_UPLOAD_MAX_MB}MBまでです")
+
+def _discard_upload(db: Session, blob: BlobInfo):
+    """教材の保存に失敗した時、アップロードした blob が他から使われていなければ消す"""
+    db.rollback()
+    material_files.delete_blob_if_unused(db, blob.sha256)
+
+def _process_upload(background_tasks: BackgroundTasks, material_id: int):
+    # PDF本文の検索登録・ページ数とサムネイルの作成はレスポンスの後で
+    background_tasks.add_task(index_material_content, material_id)
+    background_tasks.add_task(material_files.build_material_preview, material_id)
+
 @router.post("/", response_model=schemas.TeachingMaterialResponse)
 def upload_material(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     internal_memo: Optional[str] = Form(""),
     subject_ids: List[int] = Form([]), # 複数受け取る
@@ -52,20 +103,20 @@ def upload_material(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ):
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="PDFファイルのみアップロード可能です")
-
-    safe_filename = file.filename.replace(" ", "_")
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    return crud_materials.create_material(db, title, file_path, internal_memo, subject_ids, detail_tag_ids)
+    blob = _store_upload(db, file)
+    try:
+        material = crud_materials.create_material(db, title, blob, file.filename, internal_memo, subject_ids, detail_tag_ids)
+    except Exception:
+        _discard_upload(db, blob)
+        raise
+    _process_upload(background_tasks, material.id)
+    return material
 
 # ★追加: 教材の編集エンドポイント
 @router.put("/{material_id}", response_model=schemas.TeachingMaterialResponse)
 def update_material(
     material_id: int,
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     internal_memo: Optional[str] = Form(""),
     subject_ids: List[int] = Form([]),
@@ -77,45 +128,145 @@ def update_material(
     if not existing_material:
         raise HTTPException(status_code=404, detail="Material not found")
 
-    file_path = None
+    blob = None
+    old_file = (existing_material.blob_sha256, existing_material.thumbnail_sha256, existing_material.file_path)
     if file and file.filename:
-        if not file.filename.endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="PDFファイルのみアップロード可能です")
-        
-        # 古いファイルを削除
-        if os.path.exists(existing_material.file_path):
-            os.remove(existing_material.file_path)
-            
-        safe_filename = file.filename.replace(" ", "_")
-        file_path = os.path.join(UPLOAD_DIR, safe_filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-    updated_material = crud_materials.update_material(
-        db, material_id, title, file_path, internal_memo, subject_ids, detail_tag_ids
-    )
+        blob = _store_upload(db, file)
+
+    try:
+        updated_material = crud_materials.update_material(
+            db, material_id, title, blob, file.filename if blob else None, internal_memo, subject_ids, detail_tag_ids
+        )
+    except Exception:
+        if blob:
+            _discard_upload(db, blob)
+        raise
+    if blob:
+        _delete_material_files(db, *old_file)
+        _process_upload(background_tasks, material_id)
     return updated_material
 
+def _encode_cursor(material_id: int) -> str:
+    return base64.urlsafe_b64encode(str(material_id).encode()).decode()
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor が不正です")
 
-@router.get("/", response_model=List[schemas.TeachingMaterialResponse])
+@router.get("/", response_model=schemas.TeachingMaterialListResponse)
 def read_materials(
     subject_id: Optional[int] = None,
     detail_tag_id: Optional[int] = None,
     search_query: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db)
 ):
-    return crud_materials.get_materials(db, subject_id, detail_tag_id, search_query)
+    """
+    新しい順に limit 件ずつ返す。続きは next_cursor をそのまま cursor に渡して取得する。
+    最初のページ（cursor なし）だけ、総件数とタグごとの件数（facets）も返す（続きのページでは null）。
+    """
+    before_id = _decode_cursor(cursor) if cursor else None
+    # 1件多く取って「次があるか」を判定
+    materials = crud_materials.get_materials(db, subject_id, detail_tag_id, search_query, limit + 1, before_id)
+    has_more = len(materials) > limit
+    materials = materials[:limit]
+
+    summary = {"total": None, "facets": None}
+    if before_id is None:
+        summary = crud_materials.count_materials(db, subject_id, detail_tag_id, search_query)
+
+    return {
+        "items": materials,
+        "next_cursor": _encode_cursor(materials[-1].id) if has_more else None,
+        **summary,
+    }
+
+@router.get("/search", response_model=schemas.TeachingMaterialSearchResponse)
+def search_materials(
+    q: str = Query(..., min_length=1, description="検索語（タイトル・タグ・メモ・PDF本文。空白区切りはすべて含む）"),
+    subject_id: Optional[int] = None,
+    detail_tag_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """教材の全文検索。関連度順の1ページ分と、検索結果全体でのタグごとの件数を返す"""
+    result = crud_materials.search_materials(db, q, subject_id, detail_tag_id, limit, offset)
+    return {
+        "total": result["total"],
+        "limit": limit,
+        "offset": offset,
+        "items": [
+            {**schemas.TeachingMaterialResponse.model_validate(material).model_dump(), "rank": rank}
+            for material, rank in result["items"]
+        ],
+        "facets": result["facets"],
+    }
 
 @router.get("/{material_id}/pdf")
-def download_material_pdf(material_id: int, db: Session = Depends(get_db)):
+def download_material_pdf(material_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    教材のPDF。Range に対応しているので、ブラウザのPDFビューアは全体が届く前に表示を始められる
+    """
     material = crud_materials.get_material(db, material_id)
-    if not material or not os.path.exists(material.file_path):
+    if not material:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(material.file_path, media_type="application/pdf", filename=os.path.basename(material.file_path))
+
+    if material.blob_sha256:
+        sha256 = material.blob_sha256
+        size = material.file_size if material.file_size is not None else blob_store.size(sha256)
+        filename = material.original_filename or f"material_{material_id}.pdf"
+        etag = f'"{sha256}"'
+        open_range = lambda start, end: blob_store.iter_range(sha256, start, end)
+    else:
+        # blob_store に移す前の教材（移行スクリプトを実行するまでの互換用）
+        if not material.file_path or not os.path.exists(material.file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        stat = os.stat(material.file_path)
+        size = stat.st_size
+        filename = os.path.basename(material.file_path)
+        etag = f'"legacy-{material_id}-{stat.st_mtime_ns}-{size}"'
+        open_range = partial(material_files.iter_file_range, material.file_path)
+
+    return file_response(
+        request,
+        size=size,
+        etag=etag,
+        open_range=open_range,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"inline; filename*=UTF-8''{quote(filename)}"},
+        last_modified=material.updated_at or material.created_at,
+    )
+
+@router.get("/{material_id}/thumbnail")
+def read_material_thumbnail(material_id: int, request: Request, db: Session = Depends(get_db)):
+    """1ページ目のサムネイル（PNG）。まだ作られていない（アップロード直後・PDF が壊れている）時は 404"""
+    material = crud_materials.get_material(db, material_id)
+    if not material or not material.thumbnail_sha256:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    sha256 = material.thumbnail_sha256
+    return file_response(
+        request,
+        size=blob_store.size(sha256),
+        etag=f'"{sha256}"',
+        open_range=lambda start, end: blob_store.iter_range(sha256, start, end),
+        media_type="image/png",
+        headers={"Cache-Control": "private, no-cache"},
+    )
+
+def _delete_material_files(db: Session, blob_sha256: Optional[str], thumbnail_sha256: Optional[str], file_path: Optional[str]):
+    """使われなくなった教材の本体・サムネイルを消す（commit の後に呼ぶ）"""
+    material_files.delete_blob_if_unused(db, blob_sha256)
+    material_files.delete_blob_if_unused(db, thumbnail_sha256)
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
 
 @router.delete("/{material_id}")
 def delete_material(material_id: int, db: Session = Depends(get_db)):
     material = crud_materials.delete_material(db, material_id)
-    if material and os.path.exists(material.file_path):
-        os.remove(material.file_path)
-    return {"detail": "Material deleted"}
\ No newline at end of file
+    if material:
+        _delete_material_files(db, material.blob_sha256, material.thumbnail_sha256, material.file_path)
+    return {"detail": "Material deleted"}
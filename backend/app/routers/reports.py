@@ -1,20 +1,25 @@
 # backend/app/routers/reports.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict
 from pydantic import BaseModel
 from datetime import datetime
+from functools import partial
 import traceback
 
+from app.core.config import settings
 from app.db.database import get_db
+from app.routers.deps import get_current_user
 from app.models.models import (
     User, Progress, EikenResult, Student,
-    PastExamResult, MockExamResult, UniversityAcceptance
+    PastExamResult, MockExamResult, UniversityAcceptance, ReportJob
 )
-from app.utils.pdf_generator import create_pdf_from_template
+from app.services import progress_aggregation, report_batch, report_cache, report_data
+from app.services.pdf_renderer import PdfRendererBusy
 
 router = APIRouter()
 
@@ -26,47 +31,71 @@ class IntegratedReportRequest(BaseModel):
     chart_images: Dict[str, Optional[str]] = {} # {"dashboard": "base64...", "past_exams": "base64..."}
     teacher_comment: Optional[str] = None
     next_action: Optional[str] = None
+class ReportJobRequest(BaseModel):
+    sections: List[str]                      # 統合レポートと同じセクション
+    school: Optional[str] = None             # 校舎全員（student_ids が無い時。省略時は自分の校舎）
+    student_ids: Optional[List[int]] = None  # 生徒を指定する場合
+
+# --- PDF ---
+# 個人のデータなので共有キャッシュには置かせず、毎回 ETag で確認させる
+PDF_CACHE_CONTROL = "private, no-cache"
+
+async def _pdf_response(
+    template_name: str, build_context: Callable[[], dict], filename: str, if_none_match: Optional[str] = None
+) -> Response:
+    """
+    context を作ってから、同じ内容のPDFがあればキャッシュ（手元にあれば 304）を返し、なければ作成して返す。
+    作成が混み合っている時は 503 + Retry-After。
+    """
+    context = await run_in_threadpool(build_context)
+    etag = f'"{report_cache.content_key(template_name, context)}"'
+    headers = {"ETag": etag, "Cache-Control": PDF_CACHE_CONTROL}
+    if report_cache.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        _, pdf_bytes = await report_cache.render_cached(template_name, context)
+    except PdfRendererBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="PDFの作成が混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"inline; filename={filename}", **headers}
+    )
 
 # --- Endpoints ---
+# データの取得（DB）はスレッドで、PDFの作成は専用のプロセスで行い、イベントループは止めない
+# 同じデータ・同じグラフ画像のレポートはキャッシュから返す（services/report_cache.py）
 
 # 1. 学習ダッシュボード レポート
-@router.post("/dashboard/{student_id}")
-def generate_dashboard_report(
-    student_id: int, 
-    request: ReportRequest, 
-    session: Session = Depends(get_db)
-):
+def _dashboard_report_context(session: Session, student_id: int, request: ReportRequest) -> dict:
     student = session.query(Student).filter(Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
     progress_items = session.query(Progress).filter(Progress.student_id == student_id).all()
-    
-    total_study_time = 0.0
-    total_progress_pct = 0.0
+    # 学習時間・進捗率はダッシュボードと同じ集計エンジンで計算
+    totals = progress_aggregation.summarize_student(session, student_id)
+    total_study_time = totals.completed_time
+    total_progress_pct = totals.progress_rate
+
     formatted_items = []
-    
-    if progress_items:
-        valid_items = [p for p in progress_items if p.total_units > 0]
-        if valid_items:
-            ratios = [min(1.0, p.completed_units / p.total_units) for p in valid_items]
-            total_progress_pct = (sum(ratios) / len(ratios)) * 100
-        
-        for item in progress_items:
-            pct = 0
-            if item.total_units > 0:
-                pct = round((item.completed_units / item.total_units) * 100)
-                if item.duration and item.duration > 0:
-                     ratio = min(1.0, item.completed_units / item.total_units)
-                     total_study_time += ratio * item.duration
-            
-            formatted_items.append({
-                "subject": item.subject or "-",
-                "book_name": item.book_name,
-                "completed_units": item.completed_units,
-                "total_units": item.total_units,
-                "pct": pct
-            })
+    for item in progress_items:
+        pct = 0
+        if item.total_units > 0:
+            pct = round((item.completed_units / item.total_units) * 100)
+
+        formatted_items.append({
+            "subject": item.subject or "-",
+            "book_name": item.book_name,
+            "completed_units": item.completed_units,
+            "total_units": item.total_units,
+            "pct": pct
+        })
 
     latest_eiken = session.query(EikenResult).filter(EikenResult.student_id == student_id).order_by(desc(EikenResult.exam_date)).first()
     eiken_str = "未登録"
@@ -84,23 +113,20 @@ def generate_dashboard_report(
         "items": formatted_items,
         "chart_image": request.chart_image
     }
+    return context
 
-    pdf_buffer = create_pdf_from_template("report_template.html", context)
+@router.post("/dashboard/{student_id}")
+async def generate_dashboard_report(
+    student_id: int, 
+    request: ReportRequest, 
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
+):
     filename = f"dashboard_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    
-    return StreamingResponse(
-        pdf_buffer, 
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={filename}"}
-    )
+    return await _pdf_response("report_template.html", partial(_dashboard_report_context, session, student_id, request), filename, if_none_match)
 
 # 2. 過去問演習 レポート
-@router.post("/past-exams/{student_id}")
-def generate_past_exam_report(
-    student_id: int,
-    request: ReportRequest,
-    session: Session = Depends(get_db)
-):
+def _past_exam_report_context(session: Session, student_id: int, request: ReportRequest) -> dict:
     student = session.query(User).filter(User.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -124,26 +150,23 @@ def generate_past_exam_report(
         "date_str": datetime.now().strftime("%Y年%m月%d日"),
         "items": formatted_items,
         "chart_image": request.chart_image,
-        "teacher_comment": req.teacher_comment,
-        "next_action": req.next_action
+        "teacher_comment": getattr(request, "teacher_comment", None),
+        "next_action": getattr(request, "next_action", None)
     }
+    return context
 
-    pdf_buffer = create_pdf_from_template("past_exam_report.html", context)
-    filename = f"past_exam_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    
-    return StreamingResponse(
-        pdf_buffer, 
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={filename}"}
-    )
-
-# 3. 模試成績 レポート
-@router.post("/mock-exams/{student_id}")
-def generate_mock_exam_report(
+@router.post("/past-exams/{student_id}")
+async def generate_past_exam_report(
     student_id: int,
     request: ReportRequest,
-    session: Session = Depends(get_db)
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
+    filename = f"past_exam_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    return await _pdf_response("past_exam_report.html", partial(_past_exam_report_context, session, student_id, request), filename, if_none_match)
+
+# 3. 模試成績 レポート
+def _mock_exam_report_context(session: Session, student_id: int, request: ReportRequest) -> dict:
     student = session.query(User).filter(User.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -166,23 +189,20 @@ def generate_mock_exam_report(
         "items": formatted_items,
         "chart_image": request.chart_image
     }
+    return context
 
-    pdf_buffer = create_pdf_from_template("mock_exam_report.html", context)
-    filename = f"mock_exam_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    
-    return StreamingResponse(
-        pdf_buffer, 
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={filename}"}
-    )
-
-# 4. 入試カレンダー レポート
-@router.post("/calendar/{student_id}")
-def generate_calendar_report(
+@router.post("/mock-exams/{student_id}")
+async def generate_mock_exam_report(
     student_id: int,
     request: ReportRequest,
-    session: Session = Depends(get_db)
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
+    filename = f"mock_exam_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    return await _pdf_response("mock_exam_report.html", partial(_mock_exam_report_context, session, student_id, request), filename, if_none_match)
+
+# 4. 入試カレンダー レポート
+def _calendar_report_context(session: Session, student_id: int, request: ReportRequest) -> dict:
     student = session.query(User).filter(User.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -204,251 +224,188 @@ def generate_calendar_report(
         "items": formatted_items,
         "chart_image": request.chart_image
     }
+    return context
 
-    pdf_buffer = create_pdf_from_template("calendar_report.html", context)
+@router.post("/calendar/{student_id}")
+async def generate_calendar_report(
+    student_id: int,
+    request: ReportRequest,
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
+):
     filename = f"calendar_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    
-    return StreamingResponse(
-        pdf_buffer, 
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={filename}"}
-    )
+    return await _pdf_response("calendar_report.html", partial(_calendar_report_context, session, student_id, request), filename, if_none_match)
+
+def _integrated_report_context(session: Session, student_id: int, request: IntegratedReportRequest) -> dict:
+    # 生徒と必要なセクションをまとめて読み込む（Studentテーブルに無ければ旧仕様のUserテーブルも探す）
+    data = report_data.load_student_report_data(session, student_id, request.sections)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    # コンテキスト（フロントから送られた画像データも一緒に。組み立ては一括作成ジョブと共通）
+    return report_batch.integrated_context(data, request.sections, images=request.chart_images)
 
 @router.post("/integrated/{student_id}")
-def generate_integrated_report(
+async def generate_integrated_report(
     student_id: int, 
     request: IntegratedReportRequest, 
-    session: Session = Depends(get_db)
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
     try:
-        # ★修正: Userテーブルではなく、Studentテーブルから検索する
-        student = session.query(Student).filter(Student.id == student_id).first()
-        if not student:
-            # IDが合わない場合、念のためUserテーブルも探す（旧仕様との互換性）
-            student_fallback = session.query(User).filter(User.id == student_id).first()
-            if student_fallback:
-                student = student_fallback
-            else:
-                raise HTTPException(status_code=404, detail="Student not found")
-
-        # 名前フィールドの取得 (Studentモデルはname, Userモデルはusername)
-        student_name = getattr(student, "name", getattr(student, "username", "不明"))
-
-        # 2. 基本コンテキスト
-        context = {
-            "student_name": student_name, # ★正しい名前が入る
-            "date_str": datetime.now().strftime("%Y年%m月%d日"),
-            "sections": request.sections,
-            "images": request.chart_images, # フロントから送られた画像データ
-            "dashboard": None,
-            "past_exams": [],
-            "mock_exams": [],
-            "calendar": [],
-            "eiken_str": "未登録"
-        }
-
-        # 3. データ取得ロジック
-        if "dashboard" in request.sections:
-            progress_items = session.query(Progress).filter(Progress.student_id == student_id).all()
-            formatted_items = []
-            total_study_time = 0.0
-            total_progress_pct = 0.0
-            
-            if progress_items:
-                valid_items = [p for p in progress_items if (p.total_units or 0) > 0]
-                if valid_items:
-                    ratios = [min(1.0, (p.completed_units or 0) / p.total_units) for p in valid_items]
-                    total_progress_pct = (sum(ratios) / len(ratios)) * 100
-                
-                for item in progress_items:
-                    pct = 0
-                    total = item.total_units or 0
-                    completed = item.completed_units or 0
-                    if total > 0:
-                        pct = round((completed / total) * 100)
-                        if (item.duration or 0) > 0:
-                             ratio = min(1.0, completed / total)
-                             total_study_time += ratio * item.duration
-                    
-                    formatted_items.append({
-                        "subject": item.subject or "-",
-                        "book_name": item.book_name,
-                        "pct": pct
-                    })
-
-            # 英検
-            latest_eiken = session.query(EikenResult).filter(EikenResult.student_id == student_id).order_by(desc(EikenResult.exam_date)).first()
-            if latest_eiken:
-                eiken_str = latest_eiken.grade
-                if latest_eiken.cse_score:
-                    eiken_str += f" / CSE {latest_eiken.cse_score}"
-                context["eiken_str"] = eiken_str
-
-            context["dashboard"] = {
-                "total_study_time": round(total_study_time, 1),
-                "total_progress_pct": round(total_progress_pct, 1),
-                # ★修正: キー名を 'items' から 'progress_list' に変更（衝突回避）
-                "progress_list": formatted_items 
-            }
-
-        if "past_exams" in request.sections:
-            results = session.query(PastExamResult).filter(PastExamResult.student_id == student_id).all()
-            formatted_past = []
-            for r in results:
-                formatted_past.append({
-                    "date": r.date,
-                    "university": r.university_name,
-                    "faculty": r.faculty_name,
-                    "year": r.year,
-                    "subject": r.subject,
-                    "correct_answers": r.correct_answers or 0,
-                    "total_questions": r.total_questions or 0
-                })
-            context["past_exams"] = formatted_past
-
-        if "mock_exams" in request.sections:
-            results = session.query(MockExamResult).filter(MockExamResult.student_id == student_id).all()
-            formatted_mock = []
-            for r in results:
-                formatted_mock.append({
-                    "name": r.mock_exam_name,
-                    "type": r.result_type,
-                    "grade": r.grade,
-                    "score_summary": f"{r.mock_exam_format}" if hasattr(r, 'mock_exam_format') else "-"
-                })
-            context["mock_exams"] = formatted_mock
-
-        if "calendar" in request.sections:
-            acceptances = session.query(UniversityAcceptance).filter(UniversityAcceptance.student_id == student_id).all()
-            formatted_cal = []
-            for a in acceptances:
-                formatted_cal.append({
-                    "univ": a.university_name,
-                    "faculty": a.faculty_name,
-                    "exam_date": a.exam_date or "-",
-                    "announce_date": a.announcement_date or "-"
-                })
-            context["calendar"] = formatted_cal
-
         # 4. PDF生成
-        pdf_buffer = create_pdf_from_template("integrated_report_template.html", context)
-        
         filename = f"report_{student_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        
-        return StreamingResponse(
-            pdf_buffer, 
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"inline; filename={filename}"}
+        return await _pdf_response(
+            "integrated_report_template.html",
+            partial(_integrated_report_context, session, student_id, request),
+            filename,
+            if_none_match,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("PDF Generation Error:")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+# --- 一括作成ジョブ ---
+def _job_to_dict(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "school": job.school,
+        "sections": job.sections,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "download_url": f"/reports/jobs/{job.id}/download",
+    }
+
+def _get_own_job(session: Session, job_id: int, current_user: User) -> ReportJob:
+    job = session.query(ReportJob).filter(ReportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current_user.role != "developer" and job.created_by != current_user.id:
+        raise HTTPException(status_code=403, detail="The user does not have enough privileges")
+    return job
+
+@router.post("/jobs")
+async def create_report_job(
+    request: ReportJobRequest,
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """校舎全体（または指定した生徒）の統合レポートPDFをまとめて作るジョブを登録する"""
+    def create_job() -> ReportJob:
+        query = session.query(Student.id)
+        if request.student_ids:
+            query = query.filter(Student.id.in_(request.student_ids))
+        else:
+            query = query.filter(Student.school == (request.school or current_user.school))
+        # developer 以外は自分の校舎の生徒だけ
+        if current_user.role != "developer":
+            query = query.filter(Student.school == current_user.school)
+        student_ids = [sid for (sid,) in query.order_by(Student.grade, Student.name, Student.id)]
+
+        if not student_ids:
+            raise HTTPException(status_code=404, detail="対象の生徒が見つかりません")
+        if len(student_ids) > settings.REPORT_JOB_MAX_STUDENTS:
+            raise HTTPException(status_code=400, detail=f"一度に作成できるのは{settings.REPORT_JOB_MAX_STUDENTS}名までです")
+
+        job = ReportJob(
+            created_by=current_user.id,
+            school=None if request.student_ids else (request.school or current_user.school),
+            student_ids=student_ids,
+            sections=request.sections,
+            total=len(student_ids),
+        )
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+    job = await run_in_threadpool(create_job)
+    report_batch.start_report_job(job.id)
+    return _job_to_dict(job)
+
+@router.get("/jobs/{job_id}")
+def get_report_job(
+    job_id: int,
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """ジョブの進み具合"""
+    return _job_to_dict(_get_own_job(session, job_id, current_user))
+
+@router.get("/jobs/{job_id}/download")
+def download_report_job(
+    job_id: int,
+    session: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """ジョブの PDF を ZIP で返す（作成中ならできた分から流し、終わるまで続ける）"""
+    job = _get_own_job(session, job_id, current_user)
+    if job.status == "failed" and not job.completed:
+        raise HTTPException(status_code=409, detail=job.error or "ジョブが失敗しました")
+    filename = f"reports_{job.id}_{(job.created_at or datetime.now()).strftime('%Y%m%d')}.zip"
+    return StreamingResponse(
+        report_batch.stream_job_zip(job.id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 # backend/app/routers/reports.py の一番下に追加
 
 @router.get("/data/{student_id}")
 def get_report_data_json(
     student_id: int, 
-    session: Session = Depends(get_db)
+    response: Response,
+    session: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     フロントエンドでのPDFレンダリング用に、生徒の全レポートデータをJSONで返すAPI
+    （内容が前回と同じなら 304 を返し、フロント側のキャッシュを使わせる）
     """
     try:
-        # 1. 生徒情報の取得
-        student = session.query(Student).filter(Student.id == student_id).first()
-        if not student:
-            student_fallback = session.query(User).filter(User.id == student_id).first()
-            if student_fallback:
-                student = student_fallback
-            else:
-                raise HTTPException(status_code=404, detail="Student not found")
-
-        student_name = getattr(student, "name", getattr(student, "username", "不明"))
-        
-        # ※もしStudentモデルに第一志望のフィールドがあれば取得する（なければ None）
-        target_university = getattr(student, "target_university", None)
-
-        # 2. ダッシュボード（進捗・学習時間）の取得
-        progress_items = session.query(Progress).filter(Progress.student_id == student_id).all()
-        formatted_items = []
-        total_study_time = 0.0
-        total_progress_pct = 0.0
-        
-        if progress_items:
-            valid_items = [p for p in progress_items if (p.total_units or 0) > 0]
-            if valid_items:
-                ratios = [min(1.0, (p.completed_units or 0) / p.total_units) for p in valid_items]
-                total_progress_pct = (sum(ratios) / len(ratios)) * 100
-            
-            for item in progress_items:
-                pct = 0
-                total = item.total_units or 0
-                completed = item.completed_units or 0
-                if total > 0:
-                    pct = round((completed / total) * 100)
-                    if (item.duration or 0) > 0:
-                         ratio = min(1.0, completed / total)
-                         total_study_time += ratio * item.duration
-                
-                formatted_items.append({
-                    "subject": item.subject or "-",
-                    "book_name": item.book_name,
-                    "pct": pct
-                })
-
-        # 3. 英検ステータスの取得
-        latest_eiken = session.query(EikenResult).filter(EikenResult.student_id == student_id).order_by(desc(EikenResult.exam_date)).first()
-        eiken_str = "未登録"
-        if latest_eiken:
-            eiken_str = latest_eiken.grade
-            if latest_eiken.cse_score:
-                eiken_str += f" / CSE {latest_eiken.cse_score}"
-
-        # 4. 過去問演習記録の取得
-        past_results = session.query(PastExamResult).filter(PastExamResult.student_id == student_id).order_by(desc(PastExamResult.date)).all()
-        formatted_past = []
-        for r in past_results:
-            formatted_past.append({
-                "date": r.date,
-                "university": r.university_name,
-                "faculty": r.faculty_name,
-                "year": r.year,
-                "subject": r.subject,
-                "correct_answers": r.correct_answers or 0,
-                "total_questions": r.total_questions or 0
-            })
-
-        # 5. 模試成績の取得
-        mock_results = session.query(MockExamResult).filter(MockExamResult.student_id == student_id).all()
-        formatted_mock = []
-        for r in mock_results:
-            formatted_mock.append({
-                "name": r.mock_exam_name,
-                "type": r.result_type,
-                "grade": r.grade,
-                "score_summary": f"{r.mock_exam_format}" if hasattr(r, 'mock_exam_format') else "-"
-            })
-
-        # 6. JSONとしてレスポンスを返す
-        return {
-            "student": {
-                "name": student_name,
-                "target_university": target_university
-            },
-            "dashboard": {
-                "total_study_time": round(total_study_time, 1),
-                "total_progress_pct": round(total_progress_pct, 1),
-                "progress_list": formatted_items 
-            },
-            "eiken_str": eiken_str,
-            "past_exams": formatted_past,
-            "mock_exams": formatted_mock
-        }
-
+        # 生徒の全セクションをまとめて読み込む
+        report = report_data.load_student_report_data(session, student_id)
+        if report is None:
+            raise HTTPException(status_code=404, detail="Student not found")
+        data = report_batch.report_data_json(report)
+        etag = report_cache.json_etag(data)
+        headers = {"ETag": etag, "Cache-Control": PDF_CACHE_CONTROL}
+        if report_cache.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return data
+
+    except HTTPException:
+        raise
     except Exception as e:
         print("Report Data Fetch Error:")
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+# 印刷用データを複数の生徒分まとめて返す（人数に関係なくクエリ数は一定）
+REPORT_DATA_BATCH_LIMIT = 200
+
+@router.get("/data")
+def get_report_data_batch(
+    student_ids: List[int] = Query(...),
+    session: Session = Depends(get_db)
+):
+    """生徒ごとの印刷用データ（/data/{student_id} と同じ形）を student_ids の順に返す"""
+    if len(student_ids) > REPORT_DATA_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"一度に取得できるのは{REPORT_DATA_BATCH_LIMIT}名までです")
+    reports = report_data.load_report_data(session, student_ids, include_users=True)
+    return {
+        "reports": [
+            {"student_id": student_id, **report_batch.report_data_json(report)}
+            for student_id, report in reports.items()
+        ],
+        "not_found": [student_id for student_id in student_ids if student_id not in reports],
+    }
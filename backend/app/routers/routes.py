@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File, Form, Body
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, Body
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+from functools import partial
 from urllib.parse import quote  # ★追加: URLエンコード用
-from app.db.database import get_db
+from app.db.database import engine, get_db
 from app.models.models import RootTable
+from app.services.blob_store import BlobInfo, blob_store
+# ルート表と教材は同じ blob を共有することがあるので、両方を見てから消す
+from app.services.material_files import delete_blob_if_unused, store_blob
+from app.utils.range_response import file_response
 
 router = APIRouter()
 
@@ -33,10 +39,39 @@ def get_route_list(session: Session = Depends(get_db)):
         RootTable.uploaded_at
     ).order_by(RootTable.uploaded_at.desc()).all()
 
+# ファイル本体は blob_store に置く（同じ中身のファイルは1つだけ保存される）
+# 行を commit するまで、同じ blob は他のリクエストから消されない
+def _store_upload(session: Session, file: UploadFile) -> BlobInfo:
+    return store_blob(session, file.file)
+
+# 移行前の行の本体を読む時の1回あたりのバイト数
+LEGACY_SLICE_BYTES = 256 * 1024
+
+def _iter_legacy_content(file_id: int, start: int, end: int) -> Iterator[bytes]:
+    """
+    移行前の行の file_content を substring で少しずつ読む（PDF全体を Python のメモリに載せない）。
+    レスポンスを流している間に使うので、リクエストのセッションではなく専用の接続で読む
+    """
+    with engine.connect() as conn:
+        position = start
+        while position <= end:
+            length = min(LEGACY_SLICE_BYTES, end - position + 1)
+            chunk = conn.execute(
+                text("SELECT substring(file_content FROM :start FOR :length) FROM root_tables WHERE id = :id"),
+                {"start": position + 1, "length": length, "id": file_id},  # substring は1始まり
+            ).scalar()
+            if not chunk:
+                break
+            yield bytes(chunk)
+            position += len(chunk)
+
 # 2. ダウンロードAPI
 @router.get("/download/{file_id}")
-def download_route_file(file_id: int, session: Session = Depends(get_db)):
-    file_record = session.query(RootTable).filter(RootTable.id == file_id).first()
+def download_route_file(file_id: int, request: Request, session: Session = Depends(get_db)):
+    # メタデータだけ読む（本体は blob_store・移行前の行は DB から少しずつ流す）
+    file_record = session.query(
+        RootTable.filename, RootTable.blob_sha256, RootTable.file_size, RootTable.uploaded_at
+    ).filter(RootTable.id == file_id).first()
     
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
@@ -44,30 +79,52 @@ def download_route_file(file_id: int, session: Session = Depends(get_db)):
     # ★修正: 日本語ファイル名対応
     # ファイル名をURLエンコードする
     encoded_filename = quote(file_record.filename)
-    
-    return Response(
-        content=file_record.file_content,
+    headers = {
+        # RFC 5987形式で指定することで、日本語ファイル名が文字化けせずにダウンロードされます
+        "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
+    }
+
+    if file_record.blob_sha256 is not None:
+        sha256 = file_record.blob_sha256
+        size = file_record.file_size if file_record.file_size is not None else blob_store.size(sha256)
+        # 中身のハッシュそのものなので強い ETag として使える
+        etag = f'"{sha256}"'
+        open_range = lambda start, end: blob_store.iter_range(sha256, start, end)
+    else:
+        # blob_store に移す前の行（移行スクリプトを実行するまでの互換用）。サイズだけDBで数える
+        size = session.query(func.octet_length(RootTable.file_content)).filter(RootTable.id == file_id).scalar() or 0
+        # 移行前の行の本体は書き換えられない（差し替えると blob_store に移る）ので、行とアップロード日時で決まる
+        uploaded = file_record.uploaded_at.timestamp() if file_record.uploaded_at else 0
+        etag = f'"legacy-{file_id}-{uploaded:.0f}"'
+        open_range = partial(_iter_legacy_content, file_id)
+
+    return file_response(
+        request,
+        size=size,
+        etag=etag,
+        open_range=open_range,
         media_type="application/pdf",
-        headers={
-            # RFC 5987形式で指定することで、日本語ファイル名が文字化けせずにダウンロードされます
-            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-        }
+        headers=headers,
+        last_modified=file_record.uploaded_at,
     )
 
 # ★追加: 3. アップロードAPI
 @router.post("/upload")
-async def upload_route_table(
+def upload_route_table(
     file: UploadFile = File(...),
     subject: str = Form(...),
     level: str = Form(...),
     academic_year: int = Form(...),
     session: Session = Depends(get_db)
 ):
+    blob = None
     try:
-        content = await file.read()
+        # 一度に全部読まず、書きながらハッシュを取って保存する
+        blob = _store_upload(session, file)
         new_table = RootTable(
             filename=file.filename,
-            file_content=content,
+            blob_sha256=blob.sha256,
+            file_size=blob.size,
             subject=subject,
             level=level,
             academic_year=academic_year
@@ -77,17 +134,22 @@ async def upload_route_table(
         return {"message": "Uploaded successfully", "filename": file.filename}
     except Exception as e:
         print(f"Upload Error: {e}")
+        # 行を保存できなかったら、アップロードした blob は（他で使われていなければ）消す
+        session.rollback()
+        if blob:
+            delete_blob_if_unused(session, blob.sha256)
         raise HTTPException(status_code=500, detail="Upload failed")
 
 # ★追加: 4. 削除API
 @router.delete("/{file_id}")
 def delete_route_table(file_id: int, session: Session = Depends(get_db)):
-    item = session.query(RootTable).filter(RootTable.id == file_id).first()
+    item = session.query(RootTable.id, RootTable.blob_sha256).filter(RootTable.id == file_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Not found")
     
-    session.delete(item)
+    session.query(RootTable).filter(RootTable.id == file_id).delete(synchronize_session=False)
     session.commit()
+    delete_blob_if_unused(session, item.blob_sha256)
     return {"message": "Deleted successfully"}
 
 # ==================================
@@ -103,8 +165,6 @@ def update_route(
     file: Optional[UploadFile] = File(None), # 新しいファイルが選択された時用
     session: Session = Depends(get_db)
 ):
-    from app.models.models import RootTable # ※実際のモデル名に合わせてください
-    
     item = session.query(RootTable).filter(RootTable.id == route_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Route not found")
@@ -117,28 +177,32 @@ def update_route(
     if academic_year is not None:
         item.academic_year = academic_year
         
-    # もし「新しいファイル」も一緒にアップロードされていたら、ファイルを保存し直す
+    # もし「新しいファイル」も一緒にアップロードされていたら、ファイルを差し替える
+    old_sha256 = None
+    blob = None
     if file:
-        # ※アップロード先のフォルダ名は、新規アップロード(POST)の時と同じに合わせてください
-        upload_dir = "uploads/routes" 
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 安全なファイル名を生成して保存
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # データベースのファイル名とパスも上書き
+        blob = _store_upload(session, file)
+        old_sha256 = item.blob_sha256
         item.filename = file.filename
-        if hasattr(item, 'filepath'):
-            item.filepath = file_path
+        item.blob_sha256 = blob.sha256
+        item.file_size = blob.size
+        item.file_content = None
         
-    session.commit()
+    try:
+        session.commit()
+    except Exception:
+        # 差し替えを保存できなかったら、アップロードした blob は（他で使われていなければ）消す
+        session.rollback()
+        if blob:
+            delete_blob_if_unused(session, blob.sha256)
+        raise
     session.refresh(item)
+    if old_sha256 != item.blob_sha256:
+        delete_blob_if_unused(session, old_sha256)
     return {
         "id": item.id,
-        "filename": getattr(item, 'filename', None),
-        "subject": getattr(item, 'subject', None),
-        "level": getattr(item, 'level', None),
-        "academic_year": getattr(item, 'academic_year', None)
-    }
\ No newline at end of file
+        "filename": item.filename,
+        "subject": item.subject,
+        "level": item.level,
+        "academic_year": item.academic_year
+    }
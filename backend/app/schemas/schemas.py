@@ -282,7 +282,11 @@ class TeachingMaterialUpdate(BaseModel):
 class TeachingMaterialResponse(BaseModel):
     id: int
     title: str
-    file_path: str
+    file_path: Optional[str] = None
+    original_filename: Optional[str] = None
+    file_size: Optional[int] = None
+    page_count: Optional[int] = None
+    has_thumbnail: bool = False
     internal_memo: Optional[str] = None
     created_at: Optional[Any] = None
     updated_at: Optional[Any] = None
@@ -292,4 +296,30 @@ class TeachingMaterialResponse(BaseModel):
     detail_tags: List[DetailTagResponse] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class TeachingMaterialSearchItem(TeachingMaterialResponse):
+    rank: float
+
+class TagFacetCount(BaseModel):
+    id: int
+    name: str
+    count: int
+
+class TeachingMaterialFacets(BaseModel):
+    subjects: List[TagFacetCount] = []
+    detail_tags: List[TagFacetCount] = []
+
+class TeachingMaterialListResponse(BaseModel):
+    items: List[TeachingMaterialResponse]
+    next_cursor: Optional[str] = None
+    # 最初のページだけ
+    total: Optional[int] = None
+    facets: Optional[TeachingMaterialFacets] = None
+
+class TeachingMaterialSearchResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[TeachingMaterialSearchItem]
+    facets: TeachingMaterialFacets
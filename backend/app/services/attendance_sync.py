@@ -1,5 +1,13 @@
 # backend/app/services/attendance_sync.py （新規作成）
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
 import httpx
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from app.db.database import SessionLocal
 from app.models import models
@@ -7,58 +15,251 @@ from app.models import models
 # 🚨 先ほどまで使っていたGASのURL
 GAS_URL = "https://script.google.com/macros/s/AKfycbxKlWTOAaTJtmOflZsEVjLssdyQ2haOWwD686Omq-13M5SRSszkvyRtGiTuLhG2Fzd-/exec"
 
-def sync_google_sheets_to_db():
-    """5分おきに動き、GASの最新データをDBに丸写しする関数"""
+JST = timezone(timedelta(hours=9), "JST")
+
+# sync_states のキー
+SYNC_KEY = "attendance_sheets"
+UPSERT_CHUNK_SIZE = 1000
+
+# このプロセスで最後に取り込んだデータ全体のハッシュ（DBに問い合わせる前の早期判定用）
+_last_payload_hash: Optional[str] = None
+
+
+def parse_gas_date(date_str: Optional[str]) -> Optional[datetime]:
+    """GASの ISO 形式の日時を日本時間の datetime にする（読めなければ None）"""
+    if not date_str: return None
+    try:
+        dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+        return dt.astimezone(JST)
+    except Exception:
+        return None
+
+
+def academic_year_of(dt: Optional[datetime]) -> Optional[int]:
+    """3月始まりの年度（2026年2月なら2025年度）"""
+    if dt is None:
+        return None
+    dt = dt.astimezone(JST)
+    return dt.year if dt.month >= 3 else dt.year - 1
+
+
+def current_academic_year() -> int:
+    return academic_year_of(datetime.now(JST))
+
+
+def _content_hash(values: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _transfer_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    timestamp_at = parse_gas_date(row.get("timestamp"))
+    return {
+        "row_number": row.get("rowNumber"),
+        "timestamp": row.get("timestamp"),
+        "name": row.get("name"),
+        "instructor": row.get("instructor"),
+        "original_date": row.get("originalDate"),
+        "candidate_dates": row.get("candidateDates"),
+        "reason": row.get("reason"),
+        "is_completed": row.get("isCompleted") in [True, "TRUE", "true", "True"],
+        "timestamp_at": timestamp_at,
+        "original_date_at": parse_gas_date(row.get("originalDate")),
+        "academic_year": academic_year_of(timestamp_at),
+    }
+
+
+def _absence_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    timestamp_at = parse_gas_date(row.get("timestamp"))
+    return {
+        "row_number": row.get("rowNumber"),
+        "timestamp": row.get("timestamp"),
+        "name": row.get("name"),
+        "instructor": row.get("instructor"),
+        "day_of_week": row.get("dayOfWeek"),
+        "reason": row.get("reason"),
+        "report_info": row.get("reportInfo"),
+        "timestamp_at": timestamp_at,
+        "academic_year": academic_year_of(timestamp_at),
+    }
+
+
+def _sync_table(db: Session, model, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    row_number をキーに差分だけ反映する。
+    中身のハッシュが変わった行・新しい行はまとめて UPSERT、シートから消えた行だけ DELETE。
+    """
+    incoming: Dict[int, Dict[str, Any]] = {}
+    for values in rows:
+        if values["row_number"] is None:
+            continue
+        values["content_hash"] = _content_hash(values)
+        incoming[values["row_number"]] = values  # 同じ行番号が重複していたら後勝ち
+
+    existing = dict(db.query(model.row_number, model.content_hash).all())
+
+    changed = [v for num, v in incoming.items() if existing.get(num) != v["content_hash"]]
+    removed = [num for num in existing if num not in incoming]
+
+    # パラメータ数の上限に当たらないよう UPSERT_CHUNK_SIZE 行ずつ
+    for i in range(0, len(changed), UPSERT_CHUNK_SIZE):
+        stmt = insert(model.__table__).values(changed[i:i + UPSERT_CHUNK_SIZE])
+        update_cols = {c: stmt.excluded[c] for c in changed[0] if c != "row_number"}
+        db.execute(stmt.on_conflict_do_update(index_elements=["row_number"], set_=update_cols))
+    if removed:
+        db.query(model).filter(model.row_number.in_(removed)).delete(synchronize_session=False)
+
+    return {"upserted": len(changed), "deleted": len(removed)}
+
+
+def refresh_attendance_counts(db: Session):
+    """
+    attendance_counts を振替・欠席テーブルから作り直す（commit は呼び出し側）。
+    timestamp が読めない未完了の振替は、これまでの一覧と同じく今年度の分として数える。
+    """
+    db.execute(text("DELETE FROM attendance_counts"))
+    db.execute(text("""
+        INSERT INTO attendance_counts (academic_year, name, remaining_transfers, absences)
+        SELECT academic_year, name, SUM(remaining), SUM(absent)
+        FROM (
+            SELECT COALESCE(academic_year, :current_year) AS academic_year, name, 1 AS remaining, 0 AS absent
+            FROM transfer_requests
+            WHERE is_completed = false AND name IS NOT NULL
+            UNION ALL
+            SELECT academic_year, name, 0, 1
+            FROM absence_reports
+            WHERE academic_year IS NOT NULL AND name IS NOT NULL
+        ) t
+        GROUP BY academic_year, name
+    """), {"current_year": current_academic_year()})
+
+
+def apply_sheet_payload(db: Session, content: bytes, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    GASから取得したレスポンス本体をDBに反映する。
+    前回と全体のハッシュが同じならトランザクションを開かずに None を返す。
+    """
+    global _last_payload_hash
+
+    payload_hash = hashlib.sha256(content).hexdigest()
+    if not force and payload_hash == _last_payload_hash:
+        return None
+
+    state = db.get(models.SyncState, SYNC_KEY)
+    if not force and state is not None and state.payload_hash == payload_hash:
+        # 他のワーカーがすでに取り込み済み
+        _last_payload_hash = payload_hash
+        db.rollback()
+        return None
+
+    data = json.loads(content)
+    result = {
+        "transfers": _sync_table(db, models.TransferRequest, [_transfer_values(r) for r in data.get("transfers", [])]),
+        "absences": _sync_table(db, models.AbsenceReport, [_absence_values(r) for r in data.get("absences", [])]),
+    }
+
+    # 行に変化があった時だけ集計を作り直す
+    if any(r["upserted"] or r["deleted"] for r in result.values()):
+        refresh_attendance_counts(db)
+
+    if state is None:
+        state = models.SyncState(key=SYNC_KEY)
+        db.add(state)
+    state.payload_hash = payload_hash
+    state.synced_at = datetime.utcnow()
+
+    # 差分の反映・集計・状態の更新を1トランザクションで（途中の空テーブルが見えることはない）
+    db.commit()
+    _last_payload_hash = payload_hash
+    return result
+
+
+# ==========================================
+# GASからの取得（非同期・接続使い回し）
+# ==========================================
+# プロセスで1つだけ持ち続ける HTTP クライアント（毎回の TLS 接続を省く）
+_http_client: Optional[httpx.AsyncClient] = None
+# 前回のレスポンスの ETag（GAS側が返す場合のみ。304 なら本文のダウンロードごと省ける）
+_etag: Optional[str] = None
+# 実行中の同期（同時に来た更新要求はこれを待つだけにして、重複して取りに行かない）
+_inflight: Optional["asyncio.Task"] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=15.0, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def fetch_sheet_payload() -> Optional[bytes]:
+    """GASの最新データを取得する。ETag が一致して 304 が返った時は None"""
+    global _etag
+    headers = {"If-None-Match": _etag} if _etag else {}
+    response = await get_http_client().get(GAS_URL, headers=headers)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    _etag = response.headers.get("ETag")
+    return response.content
+
+
+def _apply_in_new_session(content: bytes) -> Optional[Dict[str, Any]]:
     db: Session = SessionLocal()
     try:
-        # 1. GASから最新データを取得
-        with httpx.Client() as client:
-            response = client.get(GAS_URL, timeout=15.0, follow_redirects=True)
-            response.raise_for_status()
-            data = response.json()
-            
-        transfers_data = data.get("transfers", [])
-        absences_data = data.get("absences", [])
-        
-        # 2. DBの古いデータを一旦すべて消去（洗い替え）
-        # ※5分おきの完全同期なので、複雑な差分更新よりも「全消去＆全追加」が最もバグが出ず安全です
-        db.query(models.TransferRequest).delete()
-        db.query(models.AbsenceReport).delete()
-        
-        # 3. 振替データをDBに流し込む
-        for row in transfers_data:
-            is_completed = row.get("isCompleted") in [True, "TRUE", "true", "True"]
-            new_transfer = models.TransferRequest(
-                row_number=row.get("rowNumber"),
-                timestamp=row.get("timestamp"),
-                name=row.get("name"),
-                instructor=row.get("instructor"),
-                original_date=row.get("originalDate"),
-                candidate_dates=row.get("candidateDates"),
-                reason=row.get("reason"),
-                is_completed=is_completed
-            )
-            db.add(new_transfer)
-            
-        # 4. 欠席データをDBに流し込む
-        for row in absences_data:
-            new_absence = models.AbsenceReport(
-                row_number=row.get("rowNumber"),
-                timestamp=row.get("timestamp"),
-                name=row.get("name"),
-                instructor=row.get("instructor"),
-                day_of_week=row.get("dayOfWeek"),
-                reason=row.get("reason"),
-                report_info=row.get("reportInfo")
-            )
-            db.add(new_absence)
-            
-        # 5. 最後にまとめて保存！
-        db.commit()
-        print("✅ [Sync Success] スプレッドシートからDBへの同期が完了しました！")
-        
-    except Exception as e:
+        return apply_sheet_payload(db, content)
+    except Exception:
         db.rollback() # エラーが起きたら途中の操作を取り消す
-        print(f"❌ [Sync Error] 同期に失敗しました: {e}")
+        raise
     finally:
-        db.close() # データベースの接続を必ず閉じる
\ No newline at end of file
+        db.close() # データベースの接続を必ず閉じる
+
+
+async def sync_google_sheets_to_db() -> Optional[Dict[str, Any]]:
+    """GASの最新データとDBの差分だけを反映する。変化がなければ None"""
+    # 1. GASから最新データを取得（待っている間もイベントループは止めない）
+    content = await fetch_sheet_payload()
+    if content is None:
+        return None
+
+    # 2. DBへの反映は同期処理なのでスレッドで
+    result = await asyncio.to_thread(_apply_in_new_session, content)
+    if result is not None:
+        t, a = result["transfers"], result["absences"]
+        print(
+            "✅ [Sync Success] スプレッドシートからDBへの同期が完了しました！"
+            f"（振替 更新{t['upserted']}/削除{t['deleted']}, 欠席 更新{a['upserted']}/削除{a['deleted']}）"
+        )
+    return result
+
+
+def request_sync() -> "asyncio.Task":
+    """
+    同期をバックグラウンドタスクとして開始する（実行中ならそのタスクを返す）。
+    待ちたい呼び出し側は戻り値を await する。
+    """
+    global _inflight
+    if _inflight is None or _inflight.done():
+        _inflight = asyncio.create_task(sync_google_sheets_to_db())
+        # 誰も await しなかった場合でも例外を回収してログに出す
+        _inflight.add_done_callback(_log_sync_error)
+    return _inflight
+
+
+def _log_sync_error(task: "asyncio.Task"):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ [Sync Error] 同期に失敗しました: {task.exception()}")
+
+
+async def scheduled_sync():
+    """5分おきの定期同期（手動の更新と同時になっても1回にまとまる）"""
+    try:
+        await request_sync()
+    except Exception:
+        pass  # ログは _log_sync_error が出す
@@ -0,0 +1,269 @@
+# backend/app/services/audit_archive.py
+"""
+監査ログの月別パーティションとアーカイブ。
+
+- PostgreSQL の audit_logs は timestamp の月ごとにパーティション（audit_logs_YYYY_MM）に分かれる。
+  先の月のパーティションはスケジューラーが AUDIT_PARTITION_MONTHS_AHEAD ヶ月分作っておく。
+- AUDIT_ARCHIVE_AFTER_MONTHS ヶ月より前の月は gzip 圧縮した NDJSON に書き出し、パーティションごと削除する。
+  書き出したファイルは audit_log_archives に記録し、一覧・エクスポートAPIからはDBの行と (timestamp, id) の順でマージして読める。
+"""
+
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import AuditCategory, AuditLogArchive, User
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+PARTITION_LOCK_KEY = 72340002
+
+
+@dataclass
+class AuditLogFilter:
+    """一覧・エクスポートの絞り込み条件（DB と アーカイブファイルの両方に同じ条件をかける）"""
+    action: Optional[str] = None
+    category: Optional[AuditCategory] = None
+    student_id: Optional[int] = None
+    user_id: Optional[int] = None
+    school: Optional[str] = None
+    branch_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+
+def _month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'audit_logs'"
+    )).first() is not None
+
+
+def _list_partitions(db: Session) -> List[Tuple[str, date]]:
+    rows = db.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'audit_logs'
+    """)).all()
+    partitions = []
+    for (name,) in rows:
+        m = PARTITION_NAME.match(name)
+        if m:
+            partitions.append((name, date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+# ==========================================
+# パーティションの作成・アーカイブ（スケジューラーから実行）
+# ==========================================
+def ensure_partitions(db: Session, months_ahead: int = None) -> int:
+    """今月から months_ahead ヶ月先までのパーティション（と受け皿の DEFAULT）を作る。作った数を返す"""
+    if months_ahead is None:
+        months_ahead = settings.AUDIT_PARTITION_MONTHS_AHEAD
+    if not _is_partitioned(db):
+        return 0
+
+    # 起動時は全ワーカーが同時に呼ぶので、パーティション作成はトランザクション単位のロックで1つずつ
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    existing = {month for _, month in _list_partitions(db)}
+    db.execute(text("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+
+    created = 0
+    this_month = _month_start(datetime.utcnow())
+    for i in range(months_ahead + 1):
+        month = _add_months(this_month, i)
+        if month in existing:
+            continue
+        create_month_partition(db, month)
+        created += 1
+    db.commit()
+    return created
+
+
+def create_month_partition(db: Session, month: date):
+    """1ヶ月分のパーティション audit_logs_YYYY_MM を作る（commit は呼び出し側）"""
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS audit_logs_{month:%Y_%m} PARTITION OF audit_logs "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def archive_partition(db: Session, name: str, month: date) -> int:
+    """1ヶ月分のパーティションを NDJSON.gz に書き出してから削除する。書き出した件数を返す"""
+    os.makedirs(settings.AUDIT_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(settings.AUDIT_ARCHIVE_DIR, f"audit_logs_{month:%Y_%m}.ndjson.gz")
+    tmp_path = path + ".tmp"
+
+    # 1. 新しい順に書き出す（読む時もこの順で返す）。ユーザー名は削除されても読めるよう一緒に保存
+    result = db.execute(text(f"""
+        SELECT l.id, l.user_id, u.username AS user_name, l.action, l.category, l.branch_id,
+               l.details, l.payload, l.timestamp
+        FROM {name} l LEFT JOIN users u ON u.id = l.user_id
+        ORDER BY l.timestamp DESC, l.id DESC
+    """).execution_options(stream_results=True))
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for row in result.mappings():
+            f.write(json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n")
+            count += 1
+    os.replace(tmp_path, path)
+
+    # 2. 記録を残してからパーティションを外して削除
+    archive = db.query(AuditLogArchive).filter(AuditLogArchive.month == month).first()
+    if archive is None:
+        archive = AuditLogArchive(month=month, file_path=path)
+        db.add(archive)
+    archive.file_path = path
+    archive.row_count = count
+    archive.archived_at = datetime.utcnow()
+    db.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+    db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+    return count
+
+
+def archive_old_partitions(db: Session, after_months: int = None) -> int:
+    """after_months ヶ月より前の月のパーティションをアーカイブする。アーカイブした月数を返す"""
+    if after_months is None:
+        after_months = settings.AUDIT_ARCHIVE_AFTER_MONTHS
+    if not _is_partitioned(db):
+        return 0
+
+    cutoff = _add_months(_month_start(datetime.utcnow()), -after_months)
+    archived = 0
+    for name, month in _list_partitions(db):
+        if month >= cutoff:
+            break
+        count = archive_partition(db, name, month)
+        logger.info(f"📦 監査ログ {month:%Y-%m} をアーカイブしました（{count}件）")
+        archived += 1
+    return archived
+
+
+def ensure_audit_partitions():
+    """起動時用: 書き込み先のパーティションが無いと INSERT できないので、最初に作っておく"""
+    db = SessionLocal()
+    try:
+        ensure_partitions(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ 監査ログのパーティション作成エラー: {e}")
+    finally:
+        db.close()
+
+
+def maintain_audit_partitions():
+    """定期実行用: 先の月のパーティション作成と古い月のアーカイブ"""
+    db = SessionLocal()
+    try:
+        created = ensure_partitions(db)
+        archived = archive_old_partitions(db)
+        logger.info(f"✅ 監査ログのパーティション整理完了: 作成 {created} / アーカイブ {archived}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ 監査ログのパーティション整理エラー: {e}")
+    finally:
+        db.close()
+
+
+# ==========================================
+# アーカイブの読み出し（一覧・エクスポートAPIから）
+# ==========================================
+def _read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    アーカイブファイルを1行ずつ読む。archive_partition が (timestamp, id) の新しい順に書いているので
+    並べ替えはせず、そのまま流す（ページに必要な分だけ読んだら止められる）
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            yield row
+
+
+def _matches(row: Dict[str, Any], f: AuditLogFilter, school_user_ids: Optional[Set[int]]) -> bool:
+    if f.action and row.get("action") != f.action:
+        return False
+    if f.category and row.get("category") != f.category.value:
+        return False
+    if f.student_id is not None and (row.get("payload") or {}).get("student_id") != f.student_id:
+        return False
+    if f.user_id is not None and row.get("user_id") != f.user_id:
+        return False
+    if school_user_ids is not None and row.get("user_id") not in school_user_ids:
+        return False
+    if f.branch_id is not None and row.get("branch_id") != f.branch_id:
+        return False
+    if f.date_from and row["timestamp"] < f.date_from:
+        return False
+    if f.date_to and row["timestamp"] >= f.date_to:
+        return False
+    return True
+
+
+def iter_archived_logs(
+    db: Session, f: AuditLogFilter, before: Optional[Tuple[datetime, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    アーカイブ済みの監査ログを新しい順に返す（before=(timestamp, id) より古いものだけ）。
+    DB（DEFAULT パーティションなど）にもアーカイブ済みの月より古い行がありうるので、
+    一覧では DB の行と (timestamp, id) でマージして使う（merge_logs）。
+    """
+    query = db.query(AuditLogArchive)
+    if before:
+        query = query.filter(AuditLogArchive.month <= _month_start(before[0]))
+    if f.date_from:
+        query = query.filter(AuditLogArchive.month >= _month_start(f.date_from))
+    if f.date_to:
+        query = query.filter(AuditLogArchive.month < f.date_to)
+    archives = query.order_by(AuditLogArchive.month.desc()).all()
+    if not archives:
+        return
+
+    school_user_ids = None
+    if f.school:
+        school_user_ids = {row[0] for row in db.query(User.id).filter(User.school == f.school)}
+
+    for archive in archives:
+        if not os.path.exists(archive.file_path):
+            logger.warning(f"⚠️ 監査ログのアーカイブが見つかりません: {archive.file_path}")
+            continue
+        for row in _read_archive(archive.file_path):
+            if before and (row["timestamp"], row["id"]) >= before:
+                continue
+            if _matches(row, f, school_user_ids):
+                yield row
+
+
+def merge_logs(*sources: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """どれも (timestamp, id) の新しい順に並んだ DB の行とアーカイブの行を、同じ順で1本にまとめる"""
+    return heapq.merge(*sources, key=lambda row: (row["timestamp"], row["id"]), reverse=True)
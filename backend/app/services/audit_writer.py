@@ -0,0 +1,247 @@
+# backend/app/services/audit_writer.py
+"""
+監査ログの非同期書き込み。
+
+リクエスト処理側は audit_writer.log(...) でイベントをキューに積むだけにして、
+バックグラウンドのスレッドが AUDIT_FLUSH_INTERVAL_MS ごと（または AUDIT_FLUSH_BATCH_SIZE 件たまったら）
+まとめて1回の INSERT で書き込む。アプリ終了時はキューを空にしてから止まる。
+
+AUDIT_LOG_SYNC=true の時（テストなど）や、ライターが起動していない時（スクリプトなど）は
+その場で書き込む同期モードになる。
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import AuditCategory, AuditLog, UserLastProgressActivity
+
+logger = logging.getLogger(__name__)
+
+# 書き込みに失敗した時のやり直しの回数と待ち時間（回数に比例して延ばす）
+WRITE_RETRIES = 3
+WRITE_RETRY_BACKOFF_SECONDS = 0.5
+
+
+def categorize_action(action: Optional[str]) -> AuditCategory:
+    """action 名から大分類を決める（保存時と既存データの移行で共通）"""
+    upper = (action or "").upper()
+    if "PROGRESS" in upper:
+        return AuditCategory.PROGRESS
+    if "LOGIN" in upper or "LOGOUT" in upper or "PASSWORD" in upper:
+        return AuditCategory.AUTH
+    if "USER" in upper or "ROLE" in upper:
+        return AuditCategory.USER
+    return AuditCategory.OTHER
+
+
+def parse_details(details: Optional[str]) -> Optional[Dict[str, Any]]:
+    """文字列の details が JSON オブジェクトなら dict にする（それ以外は None）"""
+    if not details:
+        return None
+    try:
+        parsed = json.loads(details)
+    except (TypeError, ValueError):
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+@dataclass
+class AuditEvent:
+    user_id: Optional[int]
+    action: str
+    branch_id: Optional[int] = None
+    # dict で渡された場合は書き込み時に JSON 文字列にする
+    details: Union[str, Dict[str, Any], None] = ""
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def category(self) -> AuditCategory:
+        return categorize_action(self.action)
+
+    def to_row(self) -> Dict[str, Any]:
+        # details は画面表示用の文字列、payload は検索用の構造化データとして両方持つ
+        if isinstance(self.details, dict):
+            details = json.dumps(self.details, ensure_ascii=False)
+            payload = self.details
+        else:
+            details = self.details
+            payload = parse_details(details)
+        return {
+            "user_id": self.user_id,
+            "action": self.action,
+            "category": self.category,
+            "branch_id": self.branch_id,
+            "details": details,
+            "payload": payload,
+            "timestamp": self.timestamp,
+        }
+
+
+def touch_progress_activities(db: Session, latest: Dict[int, AuditEvent]):
+    """
+    user_last_progress_activity を講師ごとに1行 upsert する（今より新しい操作の時だけ更新）。
+    ワーカーごとのライターや同期モードのリクエストが同時に同じ講師の行を作っても、
+    ON CONFLICT で片方が更新に回るので主キーの重複エラーにならない
+    """
+    if not latest:
+        return
+    # 講師IDの順に並べて、同時に走る upsert 同士が行ロックの順番でデッドロックしないようにする
+    stmt = pg_insert(UserLastProgressActivity).values([
+        {"user_id": user_id, "last_progress_at": latest[user_id].timestamp, "last_action": latest[user_id].action}
+        for user_id in sorted(latest)
+    ])
+    current = UserLastProgressActivity.__table__.c
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[current.user_id],
+        set_={
+            "last_progress_at": func.greatest(current.last_progress_at, stmt.excluded.last_progress_at),
+            "last_action": stmt.excluded.last_action,
+        },
+        where=current.last_progress_at <= stmt.excluded.last_progress_at,
+    ))
+
+
+def write_events(db: Session, events: List[AuditEvent]):
+    """イベントをまとめて INSERT し、進捗系なら講師の最終操作日時も更新する（commit は呼び出し側）"""
+    if not events:
+        return
+    db.execute(insert(AuditLog), [event.to_row() for event in events])
+
+    # 進捗系の操作は、講師ごとに一番新しいものだけ反映（未更新講師アラート用）
+    latest: Dict[int, AuditEvent] = {}
+    for event in events:
+        if event.user_id and event.category == AuditCategory.PROGRESS:
+            current = latest.get(event.user_id)
+            if current is None or current.timestamp <= event.timestamp:
+                latest[event.user_id] = event
+    touch_progress_activities(db, latest)
+
+
+class AuditWriter:
+    def __init__(self, flush_interval_ms: int, batch_size: int, sync: bool = False):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.sync = sync
+        self._queue: "queue.Queue[AuditEvent]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def log(self, user_id: Optional[int], action: str, branch_id: Optional[int] = None,
+            details: Union[str, Dict[str, Any], None] = ""):
+        """監査ログを1件積む。同期モード・未起動の時はその場で書き込む"""
+        event = AuditEvent(user_id=user_id, action=action, branch_id=branch_id, details=details)
+        if self.sync or not self.running:
+            self._write([event])
+        else:
+            self._queue.put(event)
+
+    def start(self):
+        if self.sync or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        logger.info("📝 監査ログライターを起動しました")
+
+    def stop(self, timeout: float = 10.0):
+        """キューに残っているログをすべて書き込んでから止める"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # 止めるまでの間に積まれた分も書く
+        self._write(self._drain())
+        logger.info("📝 監査ログライターを停止しました")
+
+    def flush(self):
+        """キューに残っている分を今すぐ書き込む"""
+        self._write(self._drain())
+
+    def _drain(self, limit: Optional[int] = None) -> List[AuditEvent]:
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # 1件目が来たら、flush_interval が経つか batch_size 件たまるまで集める
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+        # 停止時にキューを空にする
+        self._write(self._drain())
+
+    def _write_once(self, events: List[AuditEvent]) -> Optional[Exception]:
+        """1回書き込んでみる。失敗したら例外を返す（ロールバック済み）"""
+        db = SessionLocal()
+        try:
+            write_events(db, events)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    def _write(self, events: List[AuditEvent]):
+        """
+        まとめて書き込む。一時的なエラー（接続切れ・デッドロックなど）は少し待ってやり直し、
+        それでも失敗する時は1件ずつ書いて、書けないイベントだけを捨てる（バッチ全体は失わない）
+        """
+        if not events:
+            return
+        for attempt in range(WRITE_RETRIES):
+            error = self._write_once(events)
+            if error is None:
+                return
+            logger.warning(f"⚠️ 監査ログの書き込みに失敗しました（{len(events)}件, {attempt + 1}回目）: {error}")
+            time.sleep(WRITE_RETRY_BACKOFF_SECONDS * (attempt + 1))
+
+        if len(events) == 1:
+            logger.error(f"❌ 監査ログを書き込めませんでした（破棄します）: {events[0].action} user={events[0].user_id}")
+            return
+        for event in events:
+            error = self._write_once([event])
+            if error is not None:
+                logger.error(f"❌ 監査ログを書き込めませんでした（破棄します）: {event.action} user={event.user_id}: {error}")
+
+
+audit_writer = AuditWriter(
+    flush_interval_ms=settings.AUDIT_FLUSH_INTERVAL_MS,
+    batch_size=settings.AUDIT_FLUSH_BATCH_SIZE,
+    sync=settings.AUDIT_LOG_SYNC,
+)
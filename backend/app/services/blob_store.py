@@ -0,0 +1,138 @@
+# backend/app/services/blob_store.py
+"""
+ファイル本体（PDFなど）の置き場。中身の SHA-256 をキーにするので、同じファイルは1つしか保存されない。
+
+DB には sha256 とサイズなどのメタデータだけを持ち、本体はここから少しずつ読んで返す。
+今はローカルのディレクトリ（BLOB_STORE_DIR）だけだが、BlobStore と同じメソッドを持つクラスを
+用意して BLOB_STORE_BACKEND で切り替えれば、S3 互換のストレージなどにも差し替えられる。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class BlobTooLarge(Exception):
+    """max_bytes を超えるファイルを保存しようとした時"""
+
+
+@dataclass
+class BlobInfo:
+    sha256: str
+    size: int
+
+
+class BlobStore(ABC):
+    """ストレージの共通インターフェース（メソッドが足りないバックエンドはインスタンスを作る時点でエラーになる）"""
+
+    @abstractmethod
+    def put(self, source: BinaryIO, max_bytes: Optional[int] = None) -> BlobInfo:
+        """source を最後まで読んで保存する（同じ中身が既にあればそれを使う）"""
+
+    @abstractmethod
+    def exists(self, sha256: str) -> bool:
+        ...
+
+    @abstractmethod
+    def size(self, sha256: str) -> int:
+        ...
+
+    @abstractmethod
+    def iter_range(self, sha256: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """start〜end バイト目（end を含む。None なら最後まで）を少しずつ返す"""
+
+    @abstractmethod
+    def open(self, sha256: str) -> BinaryIO:
+        """シークできるファイルオブジェクトとして開く（PDF の解析など。閉じるのは呼び出し側）"""
+
+    @abstractmethod
+    def delete(self, sha256: str):
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha256: str) -> str:
+        # 1つのディレクトリにファイルが溜まりすぎないよう先頭4文字で2階層に分ける
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def put(self, source: BinaryIO, max_bytes: Optional[int] = None) -> BlobInfo:
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # 書きながらハッシュを取る（ファイル全体をメモリに載せない）
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = source.read(READ_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"file exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.path(sha256)
+            if os.path.exists(path):
+                # 同じ中身が保存済み
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return BlobInfo(sha256=sha256, size=size)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def size(self, sha256: str) -> int:
+        return os.path.getsize(self.path(sha256))
+
+    def iter_range(self, sha256: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.path(sha256), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(READ_CHUNK_BYTES if remaining is None else min(READ_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def open(self, sha256: str) -> BinaryIO:
+        return open(self.path(sha256), "rb")
+
+    def delete(self, sha256: str):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+def _create_blob_store() -> BlobStore:
+    if settings.BLOB_STORE_BACKEND == "local":
+        return LocalBlobStore(settings.BLOB_STORE_DIR)
+    raise ValueError(f"Unknown BLOB_STORE_BACKEND: {settings.BLOB_STORE_BACKEND}")
+
+
+blob_store = _create_blob_store()
@@ -0,0 +1,459 @@
+# backend/app/services/csv_importer.py
+"""
+CSVインポート（参考書マスタ・生徒・講師）。
+
+アップロードされたファイルを全部メモリに読み込まず、IMPORT_CHUNK_ROWS 行ずつ読んでは
+一意制約（_subject_level_book_uc / _school_name_uc）への INSERT ... ON CONFLICT DO UPDATE で
+まとめて反映する。値が変わらない行は更新しない（RETURNING に出てこない行 = 変更なし）。
+
+- 読めない行（必須の列が空・数値が読めないなど）は飛ばして、行番号つきのエラーとして返す。
+- dry_run=True なら何も書き込まず、新規・更新になる行と変わる値（差分）を返す。
+- リクエスト内で実行する時は全体で1トランザクション。途中で失敗したら何も反映されない。
+- バックグラウンドのジョブ（import_jobs）はチャンクごとに進み具合と一緒に commit する。
+  ワーカーが落ちても、止まったジョブを定期実行が見つけて commit 済みの次の行から再開する。
+"""
+
+import codecs
+import csv
+import io
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, literal_column, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import ImportJob, MasterTextbook, Student, User
+from app.services.progress_aggregation import refresh_student_summaries, refresh_summaries_for_books
+
+logger = logging.getLogger(__name__)
+
+# 各データごとの「正しいフォーマット（ヘッダー）」
+EXPECTED_HEADERS = {
+    "textbook": ["subject", "level", "book_name", "duration"],
+    "student": ["name", "grade", "school", "deviation_value"], # branch_id から school へ変更
+    "user": ["username", "role", "school"]
+}
+USER_ROLES = ("user", "admin", "developer")
+
+IMPORT_CHUNK_ROWS = 1000
+# 文字コードの判定に使う先頭のバイト数
+ENCODING_SNIFF_BYTES = 64 * 1024
+# レスポンスに載せるエラー・差分の最大件数（件数自体は全部数える）
+REPORT_LIMIT = 1000
+
+
+class CsvImportError(Exception):
+    """ファイル全体を読めない時（文字コード・CSVの形式・ヘッダー）"""
+
+
+# ==========================================
+# 行の読み取り
+# ==========================================
+def _text(row: Dict[str, Optional[str]], column: str, required: bool = False) -> Optional[str]:
+    value = (row.get(column) or "").strip()
+    if required and not value:
+        raise ValueError(f"{column} が空です")
+    return value or None
+
+
+def _number(row: Dict[str, Optional[str]], column: str, default: Optional[float]) -> Optional[float]:
+    value = (row.get(column) or "").strip()
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{column} は数値で入力してください: {value}")
+
+
+def _parse_textbook(row) -> Dict[str, Any]:
+    return {
+        "subject": _text(row, "subject", required=True),
+        "level": _text(row, "level", required=True),
+        "book_name": _text(row, "book_name", required=True),
+        "duration": _number(row, "duration", 0.0),
+    }
+
+
+def _parse_student(row) -> Dict[str, Any]:
+    return {
+        "school": _text(row, "school", required=True),
+        "name": _text(row, "name", required=True),
+        "grade": _text(row, "grade"),
+        "deviation_value": _number(row, "deviation_value", None),
+    }
+
+
+def _parse_user(row) -> Dict[str, Any]:
+    role = _text(row, "role", required=True)
+    if role not in USER_ROLES:
+        raise ValueError(f"role は {' / '.join(USER_ROLES)} のどれかにしてください: {role}")
+    return {
+        "username": _text(row, "username", required=True),
+        "role": role,
+        "school": _text(row, "school"),
+    }
+
+
+@dataclass(frozen=True)
+class ImportSpec:
+    model: Any
+    key_columns: Tuple[str, ...]
+    value_columns: Tuple[str, ...]
+    parse: Callable[[Dict[str, Optional[str]]], Dict[str, Any]]
+    constraint: Optional[str] = None  # 無ければ key_columns の一意制約
+    # 新規の行にだけ入れる値（更新の時は変えない）
+    insert_defaults: Dict[str, Any] = field(default_factory=dict)
+    # CSV の値を新規の行にだけ入れる列（既存の行は CSV に何が書いてあっても変えない）
+    insert_only_columns: Tuple[str, ...] = ()
+
+
+IMPORT_SPECS = {
+    "textbook": ImportSpec(MasterTextbook, ("subject", "level", "book_name"), ("duration",), _parse_textbook, constraint="_subject_level_book_uc"),
+    "student": ImportSpec(Student, ("school", "name"), ("grade", "deviation_value"), _parse_student, constraint="_school_name_uc"),
+    # CSV にパスワードは載せない。新規の講師はパスワード未設定（空 = ログイン不可）で作り、管理画面で設定する。
+    # 既存の講師の権限は CSV では変えない（権限の変更は developer の画面から）
+    "user": ImportSpec(
+        User, ("username",), ("school",), _parse_user,
+        insert_defaults={"password": ""}, insert_only_columns=("role",),
+    ),
+}
+
+
+@dataclass
+class ImportResult:
+    dry_run: bool = False
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    error_count: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    diff: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < REPORT_LIMIT:
+            self.errors.append({"line": line, "error": message})
+
+    def add_diff(self, entry: Dict[str, Any]):
+        if len(self.diff) < REPORT_LIMIT:
+            self.diff.append(entry)
+
+    @property
+    def message(self) -> str:
+        title = "確認のみ（まだ保存していません）" if self.dry_run else "インポート完了！"
+        lines = [title, f"新規: {self.inserted}件", f"更新: {self.updated}件", f"変更なし: {self.unchanged}件"]
+        if self.error_count:
+            lines.append(f"エラー: {self.error_count}件（取り込んでいません）")
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message": self.message,
+            "dry_run": self.dry_run,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "diff": self.diff,
+        }
+
+
+# ==========================================
+# ファイルの読み込み
+# ==========================================
+def open_csv_text(binary) -> io.TextIOWrapper:
+    """
+    アップロードされたファイル（バイナリ）を文字列として少しずつ読めるようにする。
+    先頭が UTF-8 として読めなければ Shift_JIS（cp932）とみなす
+    """
+    head = binary.read(ENCODING_SNIFF_BYTES)
+    binary.seek(0)
+    encoding = "utf-8-sig"
+    try:
+        # 末尾で文字が途中で切れていてもエラーにならないよう final=False で
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = "cp932"
+    return io.TextIOWrapper(binary, encoding=encoding, newline="")
+
+
+def read_rows(text, expected_headers: List[str]) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """(行番号, 行) を順に返す。ヘッダーが足りなければ CsvImportError"""
+    reader = csv.DictReader(text, skipinitialspace=True)
+    try:
+        fieldnames = reader.fieldnames
+    except UnicodeDecodeError:
+        raise CsvImportError("文字コードが不明です。UTF-8で保存してください。")
+    if not fieldnames:
+        raise CsvImportError("CSVが空です")
+    # ヘッダー名の前後の空白は無視する
+    reader.fieldnames = [name.strip() for name in fieldnames]
+
+    missing = [c for c in expected_headers if c not in reader.fieldnames]
+    if missing:
+        raise CsvImportError(f"列が足りません: {', '.join(missing)}")
+
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise CsvImportError(f"{reader.line_num + 1}行目付近の文字コードが読めません。UTF-8で保存してください。")
+    except csv.Error as e:
+        raise CsvImportError(f"{reader.line_num}行目のCSVの形式が正しくありません: {e}")
+
+
+# ==========================================
+# 反映
+# ==========================================
+def _upsert_chunk(db: Session, spec: ImportSpec, items: Dict[tuple, Tuple[int, Dict[str, Any]]], result: ImportResult):
+    table = spec.model.__table__
+    stmt = insert(table)
+    conflict_target = {"constraint": spec.constraint} if spec.constraint else {"index_elements": list(spec.key_columns)}
+    stmt = stmt.on_conflict_do_update(
+        **conflict_target,
+        set_={c: stmt.excluded[c] for c in spec.value_columns},
+        # 値が同じ行は書き換えない
+        where=or_(*[table.c[c].is_distinct_from(stmt.excluded[c]) for c in spec.value_columns]),
+    ).returning(
+        table.c.id,
+        *[table.c[c] for c in spec.key_columns],
+        # xmax = 0 なら今回 INSERT された行（PostgreSQL）
+        literal_column("xmax = 0").label("inserted"),
+    )
+    # executemany でも RETURNING が使える（SQLAlchemy が複数行の VALUES にまとめて送る）
+    changed = db.execute(stmt, [{**spec.insert_defaults, **values} for _, values in items.values()]).all()
+
+    inserted = [row for row in changed if row.inserted]
+    updated = [row for row in changed if not row.inserted]
+    result.inserted += len(inserted)
+    result.updated += len(updated)
+    result.unchanged += len(items) - len(changed)
+
+    # 集計テーブルも同じトランザクションで更新する
+    if spec.model is MasterTextbook:
+        refresh_summaries_for_books(db, [(row.subject, row.book_name) for row in changed])
+    elif spec.model is Student:
+        refresh_student_summaries(db, [row.id for row in updated])
+
+
+def _diff_chunk(db: Session, spec: ImportSpec, items: Dict[tuple, Tuple[int, Dict[str, Any]]], result: ImportResult):
+    key_cols = [getattr(spec.model, c) for c in spec.key_columns]
+    existing = {
+        tuple(getattr(obj, c) for c in spec.key_columns): obj
+        for obj in db.query(spec.model).filter(tuple_(*key_cols).in_(list(items)))
+    }
+    for key, (line, values) in items.items():
+        entry = {"line": line, "key": dict(zip(spec.key_columns, key))}
+        obj = existing.get(key)
+        if obj is None:
+            result.inserted += 1
+            columns = spec.value_columns + spec.insert_only_columns
+            result.add_diff({**entry, "action": "insert", "values": {c: values[c] for c in columns}})
+            continue
+        changes = {
+            c: {"before": getattr(obj, c), "after": values[c]}
+            for c in spec.value_columns if getattr(obj, c) != values[c]
+        }
+        if changes:
+            result.updated += 1
+            result.add_diff({**entry, "action": "update", "changes": changes})
+        else:
+            result.unchanged += 1
+
+
+def import_csv_rows(
+    db: Session,
+    import_type: str,
+    rows: Iterator[Tuple[int, Dict[str, Optional[str]]]],
+    dry_run: bool = False,
+    result: Optional[ImportResult] = None,
+    on_chunk: Optional[Callable[[ImportResult, int, int], None]] = None,
+    skip_through_line: int = 0,
+) -> ImportResult:
+    """
+    (行番号, 行) を IMPORT_CHUNK_ROWS 行ずつ反映する（dry_run なら差分を数えるだけ）。
+    チャンクを反映するたびに on_chunk(result, そのチャンクの最後の行番号, 読んだ行数) を呼ぶ。
+    skip_through_line 行目までは読み飛ばす（ジョブの再開用）。commit は呼び出し側で行う。
+    """
+    spec = IMPORT_SPECS[import_type]
+    result = result or ImportResult(dry_run=dry_run)
+    apply_chunk = _diff_chunk if dry_run else _upsert_chunk
+
+    # 一意キー -> (行番号, 値)。同じキーが1つのチャンクに2回出てきたら後勝ち
+    items: Dict[tuple, Tuple[int, Dict[str, Any]]] = {}
+    last_line, rows_read = skip_through_line, 0
+
+    def flush():
+        if items:
+            apply_chunk(db, spec, items, result)
+        if on_chunk:
+            on_chunk(result, last_line, rows_read)
+
+    for line, row in rows:
+        if line <= skip_through_line:
+            continue
+        last_line = line
+        rows_read += 1
+        try:
+            values = spec.parse(row)
+        except ValueError as e:
+            result.add_error(line, str(e))
+        else:
+            key = tuple(values[c] for c in spec.key_columns)
+            items.pop(key, None)
+            items[key] = (line, values)
+        if rows_read % IMPORT_CHUNK_ROWS == 0:
+            flush()
+            items = {}
+            rows_read = 0
+    flush()
+    return result
+
+
+# ==========================================
+# バックグラウンドのジョブ
+# ==========================================
+def create_import_job(db: Session, import_type: str, upload: BinaryIO, file_name: Optional[str]) -> ImportJob:
+    """アップロードされたファイルを IMPORT_JOB_DIR に保存してジョブを登録する"""
+    job = ImportJob(import_type=import_type, file_name=file_name, file_path="", errors=[])
+    db.add(job)
+    db.flush()
+
+    os.makedirs(settings.IMPORT_JOB_DIR, exist_ok=True)
+    job.file_path = os.path.join(settings.IMPORT_JOB_DIR, f"{job.id}.csv")
+    with open(job.file_path, "wb") as out:
+        shutil.copyfileobj(upload, out)
+    job.bytes_total = os.path.getsize(job.file_path)
+    db.commit()
+    return job
+
+
+def _claim_job(db: Session, job_id: int) -> Optional[ImportJob]:
+    """
+    待ち（pending）か、止まった（heartbeat が IMPORT_JOB_STALE_SECONDS 以上前）実行中のジョブを自分のものにする。
+    他のワーカーが先に取っていたら None
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    claimed = db.query(ImportJob).filter(
+        ImportJob.id == job_id,
+        or_(
+            ImportJob.status == "pending",
+            and_(ImportJob.status == "running", or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale_before)),
+        ),
+    ).update(
+        {"status": "running", "started_at": now, "heartbeat_at": now, "start_bytes": ImportJob.bytes_processed},
+        synchronize_session=False,
+    )
+    db.commit()
+    return db.get(ImportJob, job_id) if claimed else None
+
+
+def _finish_job(db: Session, job: ImportJob, status: str, error: Optional[str] = None):
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    if status == "completed" and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+
+
+def run_import_job(job_id: int):
+    """ジョブを最後まで実行する（スレッドで呼ぶ）。チャンクごとに取り込んだ行と進み具合を一緒に commit する"""
+    db = SessionLocal()
+    try:
+        job = _claim_job(db, job_id)
+        if job is None:
+            return
+        if job.last_line:
+            logger.info(f"🔁 CSVインポートを {job.last_line} 行目の次から再開します（job={job_id}）")
+
+        result = ImportResult(
+            inserted=job.inserted, updated=job.updated, unchanged=job.unchanged,
+            error_count=job.error_count, errors=list(job.errors or []),
+        )
+        with open(job.file_path, "rb") as binary:
+            text = open_csv_text(binary)
+
+            def on_chunk(result: ImportResult, last_line: int, rows_read: int):
+                job.last_line = last_line
+                job.rows_processed += rows_read
+                job.bytes_processed = min(binary.tell(), job.bytes_total)
+                job.inserted, job.updated, job.unchanged = result.inserted, result.updated, result.unchanged
+                job.error_count, job.errors = result.error_count, list(result.errors)
+                job.heartbeat_at = datetime.utcnow()
+                db.commit()
+
+            try:
+                rows = read_rows(text, EXPECTED_HEADERS[job.import_type])
+                import_csv_rows(db, job.import_type, rows, result=result, on_chunk=on_chunk, skip_through_line=job.last_line)
+            finally:
+                text.detach()
+
+        job.bytes_processed = job.bytes_total
+        _finish_job(db, job, "completed")
+        logger.info(f"✅ CSVインポートが完了しました（job={job_id}）: {result.message}")
+    except CsvImportError as e:
+        db.rollback()
+        _finish_job(db, db.get(ImportJob, job_id), "failed", str(e))
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ CSVインポートのジョブが失敗しました（job={job_id}）: {e}")
+        _finish_job(db, db.get(ImportJob, job_id), "failed", f"保存失敗: {str(e)}")
+    finally:
+        db.close()
+
+
+def resume_import_jobs():
+    """定期実行用: 待ちのまま・実行中のまま止まったジョブを拾って実行する"""
+    db = SessionLocal()
+    try:
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+        job_ids = [job_id for (job_id,) in db.query(ImportJob.id).filter(
+            or_(
+                ImportJob.status == "pending",
+                and_(ImportJob.status == "running", or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale_before)),
+            )
+        ).order_by(ImportJob.id)]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        run_import_job(job_id)
+
+
+def job_to_dict(job: ImportJob) -> Dict[str, Any]:
+    """ステータスAPI用（進み具合はファイルの読んだバイト数から、残り時間は今回の実行の速さから）"""
+    progress = job.bytes_processed / job.bytes_total if job.bytes_total else (1.0 if job.status == "completed" else 0.0)
+    eta_seconds = None
+    if job.status == "running" and job.started_at:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        done = job.bytes_processed - job.start_bytes
+        if done > 0 and elapsed > 0:
+            eta_seconds = round((job.bytes_total - job.bytes_processed) * elapsed / done, 1)
+    return {
+        "id": job.id,
+        "import_type": job.import_type,
+        "file_name": job.file_name,
+        "status": job.status,
+        "progress": round(progress, 4),
+        "eta_seconds": eta_seconds,
+        "rows_processed": job.rows_processed,
+        "inserted": job.inserted,
+        "updated": job.updated,
+        "unchanged": job.unchanged,
+        "error_count": job.error_count,
+        "errors": job.errors or [],
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,160 @@
+# backend/app/services/material_files.py
+"""
+教材PDFの本体とプレビュー（ページ数・1ページ目のサムネイル）。
+
+本体は blob_store に SHA-256 の名前で置く（同じ名前のファイルで上書きされることはない）。
+旧方式で uploaded_materials/ に置かれた教材は、移行スクリプトを実行するまで file_path から読む。
+サムネイルは PyMuPDF で1ページ目を PNG にし、blob_store にキャッシュする。
+blob の保存（参照する行の commit まで）と削除は、SHA-256 ごとのアドバイザリーロックで1つずつにする。
+"""
+
+import io
+import logging
+from typing import BinaryIO, Iterator, Optional
+
+import pymupdf
+from sqlalchemy import or_, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import RootTable, TeachingMaterial
+from app.services.blob_store import READ_CHUNK_BYTES, BlobInfo, blob_store
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+
+
+def is_pdf(source: BinaryIO) -> bool:
+    """先頭が %PDF- か（読んだ位置は元に戻す）"""
+    head = source.read(1024)
+    source.seek(0)
+    return PDF_MAGIC in head
+
+
+def file_key(material: TeachingMaterial) -> Optional[str]:
+    """今のファイルを表す値（バックグラウンド処理中に差し替えられたかの判定用）"""
+    return material.blob_sha256 or material.file_path
+
+
+def open_material_file(material: TeachingMaterial) -> BinaryIO:
+    if material.blob_sha256:
+        return blob_store.open(material.blob_sha256)
+    return open(material.file_path, "rb")
+
+
+def iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    """旧方式のファイルを start〜end バイト目（end を含む）まで少しずつ返す"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def lock_blob(db: Session, sha256: str):
+    """
+    同じ blob の保存と削除を1つずつにするロック（db のトランザクションが終わるまで持つ）。
+    Session でも engine.begin() の Connection でもよい
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:sha256))"), {"sha256": sha256})
+
+
+def store_blob(db: Session, source: BinaryIO, max_bytes: Optional[int] = None) -> BlobInfo:
+    """
+    blob_store に保存し、参照する行を commit するまで delete_blob_if_unused に消されないようロックしておく。
+    同じ中身の blob がロックを取る前に消されていたら、source を読み直してもう一度保存する
+    """
+    blob = blob_store.put(source, max_bytes=max_bytes)
+    lock_blob(db, blob.sha256)
+    if not blob_store.exists(blob.sha256):
+        source.seek(0)
+        blob = blob_store.put(source, max_bytes=max_bytes)
+    return blob
+
+
+def delete_blob_if_unused(db: Session, sha256: Optional[str]):
+    """
+    どの教材（本体・サムネイル）・ルート表からも使われなくなった blob を消す（commit の後に呼ぶ）。
+    同じ内容のPDFはルート表と教材で1つの blob を共有するので両方を見る。
+    同じ中身を今まさに保存しているリクエスト（store_blob）とはロックで順番にし、その行の commit を待ってから見る
+    """
+    if not sha256:
+        return
+    lock_blob(db, sha256)
+    in_materials = db.query(TeachingMaterial.id).filter(
+        or_(TeachingMaterial.blob_sha256 == sha256, TeachingMaterial.thumbnail_sha256 == sha256)
+    ).first()
+    in_routes = db.query(RootTable.id).filter(RootTable.blob_sha256 == sha256).first()
+    if in_materials is None and in_routes is None:
+        blob_store.delete(sha256)
+    # ロックを外す
+    db.commit()
+
+
+def _render_thumbnail(source: BinaryIO) -> Optional[bytes]:
+    """1ページ目を MATERIAL_THUMBNAIL_WIDTH の幅の PNG にする"""
+    with pymupdf.open(stream=source.read(), filetype="pdf") as doc:
+        if doc.page_count == 0:
+            return None
+        page = doc[0]
+        zoom = settings.MATERIAL_THUMBNAIL_WIDTH / page.rect.width
+        return page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False).tobytes("png")
+
+
+def build_material_preview(material_id: int):
+    """
+    アップロードされた教材のページ数とサムネイルを作って保存する。
+    PDF の解析は時間がかかるので、アップロードのレスポンスを返した後に BackgroundTasks で動かす。
+    """
+    db = SessionLocal()
+    try:
+        material = db.query(TeachingMaterial).filter(TeachingMaterial.id == material_id).first()
+        if not material:
+            return
+        key = file_key(material)
+        old_thumbnail = material.thumbnail_sha256
+        source = open_material_file(material)
+        db.commit()  # PDF を読んでいる間は DB の接続を返しておく
+
+        page_count = None
+        thumbnail = None
+        with source as f:
+            if PdfReader is not None:
+                try:
+                    page_count = len(PdfReader(f).pages)
+                except Exception as e:
+                    logger.warning(f"⚠️ 教材 {material_id} のページ数を読み取れませんでした: {e}")
+            try:
+                f.seek(0)
+                png = _render_thumbnail(f)
+                if png:
+                    thumbnail = store_blob(db, io.BytesIO(png)).sha256
+            except Exception as e:
+                logger.warning(f"⚠️ 教材 {material_id} のサムネイルを作れませんでした: {e}")
+
+        if file_key(material) != key:
+            # 読んでいる間にファイルが差し替えられた（差し替え側のタスクに任せる）
+            delete_blob_if_unused(db, thumbnail)
+            return
+        material.page_count = page_count
+        material.thumbnail_sha256 = thumbnail
+        db.commit()
+        if old_thumbnail != thumbnail:
+            delete_blob_if_unused(db, old_thumbnail)
+        logger.info(f"🖼️ 教材 {material_id} のプレビューを作成しました ({page_count}ページ, サムネイル{'あり' if thumbnail else 'なし'})")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ 教材 {material_id} のプレビューの作成に失敗しました: {e}")
+    finally:
+        db.close()
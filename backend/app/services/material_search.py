@@ -0,0 +1,176 @@
+# backend/app/services/material_search.py
+"""
+教材の全文検索。
+
+タイトル・タグ名・内部メモ・PDF本文を teaching_materials.search_vector（tsvector + GIN インデックス）にまとめる。
+日本語は単語の区切りが無く PostgreSQL の標準パーサーでは分かち書きできないので、
+ここで文字の 2-gram（「東京大学」→ 東京 京大 大学 学）に分けてから 'simple' 設定で tsvector にする。
+検索語も同じように分け、隣り合う 2-gram を <->（フレーズ）でつなぐので、語の並びまで一致したものだけが当たる。
+
+重み: タイトル A / タグ B / メモ C / PDF本文 D（ts_rank の並び順に使う）
+"""
+
+import logging
+import re
+import unicodedata
+from typing import BinaryIO, Iterable, List, Optional, Union
+
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.models.models import TeachingMaterial
+from app.services import material_files
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf が無い環境では PDF 本文を検索対象にしない
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+TS_CONFIG = "simple"
+# PDF本文は先頭からこの文字数まで（tsvector の上限 1MB を超えないように）
+MAX_CONTENT_CHARS = 200_000
+
+WORD_PATTERN = re.compile(r"\w+")
+# ひらがな・カタカナ・漢字（2-gram に分ける文字）
+CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿]+")
+
+
+def _normalize(text: str) -> str:
+    # 全角英数・半角カナなどを揃える
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _word_tokens(word: str) -> List[str]:
+    """1語（\\w の連続）をトークンにする。日本語の部分は 2-gram + 末尾の1文字"""
+    tokens = []
+    pos = 0
+    for m in CJK_PATTERN.finditer(word):
+        if m.start() > pos:
+            tokens.append(word[pos:m.start()])
+        run = m.group()
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        # 末尾の1文字も入れておくと、1文字の検索語（前方一致）が語末にも当たる
+        tokens.append(run[-1])
+        pos = m.end()
+    if pos < len(word):
+        tokens.append(word[pos:])
+    return tokens
+
+
+def tokenize(text: Optional[str]) -> str:
+    """tsvector に入れる文字列（トークンを空白区切りにしたもの）"""
+    if not text:
+        return ""
+    tokens = []
+    for word in WORD_PATTERN.findall(_normalize(text)):
+        tokens.extend(_word_tokens(word))
+    return " ".join(tokens)
+
+
+def build_tsquery(query: Optional[str]) -> Optional[str]:
+    """
+    検索語を to_tsquery 用の文字列にする。空白で区切った語はすべて含む（AND）。
+    日本語の語は 2-gram をフレーズでつなぎ、1文字・英数字の語は前方一致にする。
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(_normalize(query or "")):
+        tokens = [t for t in _word_tokens(word) if t]
+        if not CJK_PATTERN.fullmatch(word):
+            # 英数字まじりの語: 各トークンを前方一致でつなぐ
+            terms.append(" <-> ".join(f"'{t}':*" for t in tokens))
+        elif len(word) == 1:
+            terms.append(f"'{word}':*")
+        else:
+            # 末尾の1文字トークンは不要（2-gram だけで並びが決まる）
+            terms.append(" <-> ".join(f"'{t}'" for t in tokens[:-1]))
+    if not terms:
+        return None
+    return " & ".join(f"({t})" for t in terms)
+
+
+def tsquery_expr(query: str):
+    """build_tsquery の結果を tsquery にする式"""
+    return func.to_tsquery(literal(TS_CONFIG, REGCONFIG), query)
+
+
+def _weighted(text: Optional[str], weight: str):
+    return func.setweight(func.to_tsvector(literal(TS_CONFIG, REGCONFIG), tokenize(text)), weight)
+
+
+def refresh_search_vector(material: TeachingMaterial):
+    """
+    material.search_vector を今のタイトル・タグ・メモ・PDF本文から作り直す（保存は呼び出し側の commit で）。
+    タグを付け替えた後に呼ぶこと。
+    """
+    tag_names = " ".join(t.name for t in list(material.subjects) + list(material.detail_tags))
+    material.search_vector = (
+        _weighted(material.title, "A")
+        .op("||")(_weighted(tag_names, "B"))
+        .op("||")(_weighted(material.internal_memo, "C"))
+        .op("||")(_weighted(material.content_text, "D"))
+    )
+
+
+def refresh_search_vectors(db: Session, material_ids: Iterable[int]):
+    """タグを消した時など、複数の教材の検索用データを作り直す"""
+    material_ids = list(material_ids)
+    if not material_ids:
+        return
+    for material in db.query(TeachingMaterial).filter(TeachingMaterial.id.in_(material_ids)):
+        refresh_search_vector(material)
+    db.commit()
+
+
+def extract_pdf_text(source: Union[str, BinaryIO], max_chars: int = MAX_CONTENT_CHARS) -> str:
+    """PDF（パスかファイルオブジェクト）の本文テキストを取り出す（先頭から max_chars 文字まで）。読めなければ空文字"""
+    if PdfReader is None:
+        logger.warning("⚠️ pypdf がインストールされていないため、PDF本文は検索対象になりません")
+        return ""
+    parts = []
+    length = 0
+    try:
+        reader = PdfReader(source)
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            parts.append(text)
+            length += len(text)
+            if length >= max_chars:
+                break
+    except Exception as e:
+        logger.warning(f"⚠️ PDF本文を読み取れませんでした: {e}")
+    # PostgreSQL の text には NUL を入れられない
+    return "\n".join(parts)[:max_chars].replace("\x00", "")
+
+
+def index_material_content(material_id: int):
+    """
+    アップロードされた PDF の本文を取り出して検索用データを更新する。
+    PDF が大きいと数秒かかるので、アップロードのレスポンスを返した後に BackgroundTasks で動かす。
+    """
+    db = SessionLocal()
+    try:
+        material = db.query(TeachingMaterial).filter(TeachingMaterial.id == material_id).first()
+        if not material:
+            return
+        key = material_files.file_key(material)
+        source = material_files.open_material_file(material)
+        db.commit()  # PDF を読んでいる間は DB の接続を返しておく
+        with source as f:
+            content_text = extract_pdf_text(f)
+
+        if material_files.file_key(material) != key:
+            # 読んでいる間にファイルが差し替えられた（差し替え側のタスクに任せる）
+            return
+        material.content_text = content_text
+        refresh_search_vector(material)
+        db.commit()
+        logger.info(f"🔎 教材 {material_id} の本文を検索用に登録しました ({len(content_text)}文字)")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ 教材 {material_id} の本文の登録に失敗しました: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,161 @@
+# backend/app/services/notification_broker.py
+"""
+通知のサーバープッシュ（SSE）用のブローカー。
+
+通知を作る側は commit 前に notification_broker.notify_users(db, user_ids) を呼ぶだけ。
+PostgreSQL では pg_notify で全ワーカーに「このユーザーに新しい通知がある」と伝わり（commit 時に配信）、
+各ワーカーは LISTEN している接続から受け取って、そのユーザーの SSE 接続を起こす。
+起こされた SSE 接続は since（最後に送った通知ID）より新しい未読を DB から読んで送る。
+
+PostgreSQL 以外では同じプロセス内だけで、commit 後に起こす。
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.db.database import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "notifications"
+RECONNECT_SECONDS = 5
+
+
+class NotificationBroker:
+    def __init__(self):
+        # user_id -> その講師の SSE 接続ごとの起床用キュー
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listen_conn = None
+        self._listen_fd: Optional[int] = None
+
+    @property
+    def uses_postgres(self) -> bool:
+        return engine.dialect.name == "postgresql"
+
+    # ==========================================
+    # SSE 接続側
+    # ==========================================
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        # 中身は「起きろ」の合図だけなので1つたまっていれば十分
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def _wake(self, user_ids: Iterable[int]):
+        """イベントループ上で呼ぶ"""
+        for user_id in user_ids:
+            for queue in self._subscribers.get(user_id, ()):
+                if queue.empty():
+                    queue.put_nowait(None)
+
+    def _wake_all(self):
+        self._wake(list(self._subscribers))
+
+    # ==========================================
+    # 通知を作る側
+    # ==========================================
+    def notify_users(self, db: Session, user_ids: Iterable[int]):
+        """新しい通知があることを伝える。commit 前に呼ぶ（commit されてから届く）"""
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        if self.uses_postgres:
+            for user_id in user_ids:
+                db.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": CHANNEL, "payload": json.dumps({"user_id": user_id})},
+                )
+        else:
+            event.listen(db, "after_commit", lambda session: self._wake_threadsafe(user_ids), once=True)
+
+    def _wake_threadsafe(self, user_ids):
+        # 同期エンドポイントはスレッドプールで動くので、ループ側に渡して起こす
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake, user_ids)
+
+    # ==========================================
+    # LISTEN（アプリの起動・終了時）
+    # ==========================================
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.uses_postgres:
+            self._listen()
+
+    async def stop(self):
+        self._close_listen_conn()
+        self._loop = None
+
+    def _listen(self):
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            # LISTEN したままの接続をプールに戻さないよう切り離して専用にする
+            raw.detach()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+        except Exception as e:
+            logger.error(f"❌ 通知チャンネルの LISTEN に失敗しました。{RECONNECT_SECONDS}秒後に再接続します: {e}")
+            self._loop.call_later(RECONNECT_SECONDS, self._reconnect)
+            return
+
+        self._listen_conn = conn
+        self._listen_fd = conn.fileno()
+        self._loop.add_reader(self._listen_fd, self._on_readable)
+        logger.info("🔔 通知チャンネルの LISTEN を開始しました")
+
+    def _reconnect(self):
+        if self._loop is None:
+            return
+        self._listen()
+        if self._listen_conn is not None:
+            # 切れていた間の通知を取りこぼさないよう、全接続に読み直させる
+            self._wake_all()
+
+    def _on_readable(self):
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            logger.warning(f"⚠️ 通知チャンネルの接続が切れました。{RECONNECT_SECONDS}秒後に再接続します: {e}")
+            self._close_listen_conn()
+            self._loop.call_later(RECONNECT_SECONDS, self._reconnect)
+            return
+
+        user_ids = set()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                user_ids.add(int(json.loads(notify.payload)["user_id"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+        self._wake(user_ids)
+
+    def _close_listen_conn(self):
+        conn, self._listen_conn = self._listen_conn, None
+        fd, self._listen_fd = self._listen_fd, None
+        if conn is None:
+            return
+        if self._loop is not None and fd is not None:
+            self._loop.remove_reader(fd)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+notification_broker = NotificationBroker()
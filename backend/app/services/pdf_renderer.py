@@ -0,0 +1,108 @@
+# backend/app/services/pdf_renderer.py
+"""
+PDF作成用のプロセスプール。
+
+xhtml2pdf の処理は重く、リクエストのスレッドで動かすと学校全体の期末レポートなどで
+ワーカーのスレッドを使い切ってしまうため、専用のプロセス（PDF_WORKERS 個）で作成する。
+各プロセスは起動時に1回だけフォントの確認とテンプレートのコンパイルを行う。
+作成中＋待ちの件数が PDF_WORKERS + PDF_QUEUE_LIMIT を超えたら PdfRendererBusy を投げる（API は 503 を返す）。
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Union
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.utils.pdf_generator import ensure_japanese_font, init_pdf_worker, render_pdf_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class PdfRendererBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("PDF renderer queue is full")
+        self.retry_after = retry_after
+
+
+class PdfRenderer:
+    def __init__(self, workers: int, queue_limit: int, retry_after: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def render(
+        self, template_name: str, context: Union[dict, Callable[[], dict]], background: bool = False
+    ) -> bytes:
+        """
+        テンプレートから PDF を作る。混み合っている時は PdfRendererBusy。
+        context に関数を渡すと、枠が取れてからスレッドで呼んで context を作る（混雑時にDBを読みに行かない）。
+        background=True（一括作成ジョブ）は呼び出し側で同時実行数を絞る前提で、待ち行列の上限を見ずに待つ。
+        """
+        # イベントループ上でだけ数えるのでロックは不要
+        if not background and self._in_flight >= self.workers + self.queue_limit:
+            raise PdfRendererBusy(self.retry_after)
+        counted = not background
+        if counted:
+            self._in_flight += 1
+        try:
+            if callable(context):
+                context = await run_in_threadpool(context)
+            executor = await self._get_executor()
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, render_pdf_bytes, template_name, context)
+            except BrokenProcessPool:
+                # ワーカーが落ちたら次の呼び出しで作り直す
+                logger.error("❌ PDF作成プロセスが異常終了しました。プールを作り直します")
+                self._discard_executor(executor)
+                raise
+        finally:
+            if counted:
+                self._in_flight -= 1
+
+    async def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is not None:
+            return self._executor
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._executor is None:
+                # フォントのダウンロードは親で1回だけ（各ワーカーが同時にダウンロードしないように）
+                await asyncio.to_thread(ensure_japanese_font)
+                # アプリのスレッド（監査ログライターなど）やDB接続を引き継がないよう spawn で起動
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_pdf_worker,
+                )
+                logger.info(f"🖨️ PDF作成プロセスを {self.workers} 個起動しました")
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pdf_renderer = PdfRenderer(
+    workers=settings.PDF_WORKERS,
+    queue_limit=settings.PDF_QUEUE_LIMIT,
+    retry_after=settings.PDF_RETRY_AFTER_SECONDS,
+)
@@ -0,0 +1,345 @@
+# backend/app/services/progress_aggregation.py
+"""
+進捗集計エンジン
+
+ダッシュボード・チャート・レポート・管理画面で共通して使う
+「マスターから所要時間を補完 → 偏差値で傾斜 → 完了率を掛ける」計算を
+1本のSQL（サブクエリ + GROUP BY）でまとめて行う。
+生徒1人でも校舎全体でも、1回のクエリで集計できる。
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, and_, case, cast, exists, func, insert, literal, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.models import MasterTextbook, Progress, Student, StudentProgressSummary
+
+# ルート（参考書レベル）ごとの目標偏差値。先に一致したものが優先される
+LEVEL_TARGET_DEVIATION = [
+    ("基礎徹底", 50),
+    ("日大", 60),
+    ("MARCH", 70),
+    ("早慶", 75),
+]
+
+# 集計の単位
+GROUP_STUDENT = ("student_id",)
+GROUP_SUBJECT = ("student_id", "subject")
+GROUP_BOOK = ("student_id", "subject", "book_name")
+
+
+@dataclass
+class ProgressTotals:
+    student_id: int
+    subject: Optional[str] = None
+    book_name: Optional[str] = None
+    planned_time: float = 0.0      # 傾斜後の予定時間
+    completed_time: float = 0.0    # 傾斜後の実績時間
+    ratio_sum: float = 0.0         # 完了率（0〜1）の合計
+    item_count: int = 0            # 参考書の冊数
+    chart_total: float = 0.0       # チャート用の分母（時間 or 単元数）
+    chart_completed: float = 0.0   # チャート用の分子（時間 or 単元数）
+
+    @property
+    def progress_rate(self) -> float:
+        """時間で重み付けした進捗率(%)。時間が無い場合は単純平均"""
+        if self.planned_time > 0:
+            return self.completed_time / self.planned_time * 100
+        if self.item_count > 0:
+            return self.ratio_sum / self.item_count * 100
+        return 0.0
+
+
+def _master_durations():
+    """(科目, 参考書名) ごとのマスター所要時間とレベル"""
+    return (
+        select(
+            MasterTextbook.subject.label("subject"),
+            MasterTextbook.book_name.label("book_name"),
+            func.max(MasterTextbook.duration).label("duration"),
+            func.max(MasterTextbook.level).label("level"),
+        )
+        .group_by(MasterTextbook.subject, MasterTextbook.book_name)
+        .subquery("master")
+    )
+
+
+def progress_rows(
+    student_ids: Optional[Iterable[int]] = None,
+    subject: Optional[str] = None,
+    units_only: bool = False,
+    student_filters: Sequence = (),
+):
+    """
+    進捗1行ごとに傾斜後の所要時間・完了率を計算したサブクエリを返す。
+    集計（GROUP BY）やJOINの材料としてそのまま使える。
+    student_filters には Student に対する条件（校舎・学年など）を渡せる。
+    """
+    master = _master_durations()
+
+    # 1. 所要時間が未設定ならマスターから補完する
+    needs_master = and_(
+        or_(Progress.duration.is_(None), Progress.duration <= 0),
+        master.c.subject.isnot(None),
+    )
+    base_duration = func.coalesce(
+        case((needs_master, master.c.duration), else_=Progress.duration), 0.0
+    )
+    book_level = case(
+        (and_(needs_master, or_(Progress.level.is_(None), Progress.level == "")), master.c.level),
+        else_=Progress.level,
+    )
+    # ルートごとの目標偏差値
+    target_dev = case(
+        *[(book_level.like(f"%{key}%"), literal(val)) for key, val in LEVEL_TARGET_DEVIATION],
+        else_=None,
+    )
+    completed_ratio = case(
+        (Progress.total_units > 0, case(
+            (Progress.completed_units >= Progress.total_units, 1.0),
+            else_=cast(Progress.completed_units, Float) / Progress.total_units,
+        )),
+        else_=0.0,
+    )
+
+    stmt = (
+        select(
+            Progress.id.label("progress_id"),
+            Progress.student_id.label("student_id"),
+            Progress.subject.label("subject"),
+            Progress.book_name.label("book_name"),
+            Progress.completed_units.label("completed_units"),
+            Progress.total_units.label("total_units"),
+            base_duration.label("base_duration"),
+            book_level.label("book_level"),
+            target_dev.label("target_dev"),
+            completed_ratio.label("ratio"),
+            Student.deviation_value.label("deviation_value"),
+        )
+        .select_from(Progress)
+        .outerjoin(master, and_(
+            master.c.subject == Progress.subject,
+            master.c.book_name == Progress.book_name,
+        ))
+        .outerjoin(Student, Student.id == Progress.student_id)
+    )
+    if student_ids is not None:
+        stmt = stmt.where(Progress.student_id.in_(list(student_ids)))
+    if subject:
+        stmt = stmt.where(Progress.subject == subject)
+    if units_only:
+        stmt = stmt.where(Progress.total_units > 0)
+    if student_filters:
+        stmt = stmt.where(*student_filters)
+    base = stmt.cte("progress_base").prefix_with("MATERIALIZED")
+
+    # 2. 偏差値による傾斜
+    # (所要時間) = (マスタの所要時間) + (マスタの所要時間) * ((ルート数値) - (本人の偏差値)) * 0.025
+    raw_adjusted = base.c.base_duration + base.c.base_duration * (base.c.target_dev - base.c.deviation_value) * 0.025
+    adjusted = case(
+        (or_(
+            base.c.base_duration == 0,
+            base.c.deviation_value.is_(None),
+            base.c.deviation_value == 0,
+            base.c.book_level.is_(None),
+            base.c.book_level == "",
+            base.c.target_dev.is_(None),
+        ), base.c.base_duration),
+        # 小数第1位で丸める（下限 0.1）
+        else_=func.round(case((raw_adjusted < 0.1, 0.1), else_=raw_adjusted) * 10) / 10.0,
+    )
+    # 傾斜計算は重いので、外側の式に展開されないよう1行1回だけ計算させる
+    adjusted_rows = select(
+        base.c.progress_id, base.c.student_id, base.c.subject, base.c.book_name,
+        base.c.completed_units, base.c.total_units, base.c.ratio,
+        adjusted.label("adjusted_duration"),
+    ).cte("progress_adjusted").prefix_with("MATERIALIZED")
+
+    # 3. 予定・実績・チャート用の値
+    has_time = adjusted_rows.c.adjusted_duration > 0
+    planned = case((has_time, adjusted_rows.c.adjusted_duration), else_=0.0)
+    chart_by_time = and_(has_time, adjusted_rows.c.total_units > 0)
+    return select(
+        adjusted_rows.c.progress_id,
+        adjusted_rows.c.student_id,
+        adjusted_rows.c.subject,
+        adjusted_rows.c.book_name,
+        adjusted_rows.c.ratio,
+        planned.label("planned_time"),
+        (adjusted_rows.c.ratio * planned).label("completed_time"),
+        case(
+            (chart_by_time, adjusted_rows.c.adjusted_duration),
+            else_=cast(func.coalesce(adjusted_rows.c.total_units, 0), Float),
+        ).label("chart_total"),
+        case(
+            (chart_by_time, cast(adjusted_rows.c.completed_units, Float) / adjusted_rows.c.total_units * adjusted_rows.c.adjusted_duration),
+            else_=cast(func.coalesce(adjusted_rows.c.completed_units, 0), Float),
+        ).label("chart_completed"),
+    ).subquery("progress_rows")
+
+
+def aggregate_query(
+    group_by: Sequence[str] = GROUP_STUDENT,
+    student_ids: Optional[Iterable[int]] = None,
+    subject: Optional[str] = None,
+    units_only: bool = False,
+    student_filters: Sequence = (),
+):
+    """progress_rows を group_by の単位で集計する SELECT を返す（他のクエリに埋め込み可能）"""
+    rows = progress_rows(student_ids, subject, units_only, student_filters)
+    keys = [rows.c[name] for name in group_by]
+    return (
+        select(
+            *keys,
+            func.sum(rows.c.planned_time).label("planned_time"),
+            func.sum(rows.c.completed_time).label("completed_time"),
+            func.sum(rows.c.ratio).label("ratio_sum"),
+            func.count(rows.c.progress_id).label("item_count"),
+            func.sum(rows.c.chart_total).label("chart_total"),
+            func.sum(rows.c.chart_completed).label("chart_completed"),
+            func.min(rows.c.progress_id).label("first_progress_id"),
+        )
+        .group_by(*keys)
+        # 登録順（最初に登録された参考書の順）を保つ
+        .order_by(func.min(rows.c.progress_id))
+    )
+
+
+def summarize_progress(
+    db: Session,
+    student_ids: Iterable[int],
+    group_by: Sequence[str] = GROUP_STUDENT,
+    subject: Optional[str] = None,
+    units_only: bool = False,
+) -> List[ProgressTotals]:
+    """生徒（複数可）の進捗を group_by の単位で1回のクエリで集計する"""
+    student_ids = list(student_ids)
+    if not student_ids:
+        return []
+
+    stmt = aggregate_query(group_by, student_ids, subject, units_only)
+    return [
+        ProgressTotals(
+            **{name: row._mapping[name] for name in group_by},
+            planned_time=float(row.planned_time or 0.0),
+            completed_time=float(row.completed_time or 0.0),
+            ratio_sum=float(row.ratio_sum or 0.0),
+            item_count=int(row.item_count or 0),
+            chart_total=float(row.chart_total or 0.0),
+            chart_completed=float(row.chart_completed or 0.0),
+        )
+        for row in db.execute(stmt)
+    ]
+
+
+def summarize_student(db: Session, student_id: int) -> ProgressTotals:
+    """生徒1人分の合計（進捗が無い場合はゼロの合計を返す）"""
+    totals = summarize_progress(db, [student_id])
+    return totals[0] if totals else ProgressTotals(student_id=student_id)
+
+
+# ==========================================
+# 集計テーブル (student_progress_summary) の維持
+# ==========================================
+def refresh_student_summaries(db: Session, student_ids: Iterable[int]) -> None:
+    """
+    指定した生徒の科目別集計を作り直す。
+    Progress・偏差値・マスター所要時間を変更した処理の中で、commit の前に呼ぶこと
+    （同じトランザクションで集計も更新される）。
+    """
+    student_ids = sorted({sid for sid in student_ids if sid is not None})
+    if not student_ids:
+        return
+
+    # 未flushの変更を集計に反映させる
+    db.flush()
+    db.query(StudentProgressSummary).filter(
+        StudentProgressSummary.student_id.in_(student_ids)
+    ).delete(synchronize_session=False)
+
+    agg = aggregate_query(GROUP_SUBJECT, student_ids).order_by(None).subquery("agg")
+    progress_rate = case(
+        (agg.c.planned_time > 0, agg.c.completed_time / agg.c.planned_time * 100),
+        (agg.c.item_count > 0, agg.c.ratio_sum / agg.c.item_count * 100),
+        else_=0.0,
+    )
+    db.execute(
+        insert(StudentProgressSummary).from_select(
+            [
+                "student_id", "subject", "planned_time", "completed_time", "progress_rate",
+                "ratio_sum", "item_count", "chart_total", "chart_completed", "sort_order",
+            ],
+            select(
+                agg.c.student_id, agg.c.subject, agg.c.planned_time, agg.c.completed_time, progress_rate,
+                agg.c.ratio_sum, agg.c.item_count, agg.c.chart_total, agg.c.chart_completed, agg.c.first_progress_id,
+            ),
+        )
+    )
+
+
+def refresh_summaries_for_books(db: Session, books: Iterable[Tuple[str, str]]) -> None:
+    """(科目, 参考書名) のマスター情報が変わった時、その参考書を使っている生徒の集計を作り直す"""
+    books = list({b for b in books if b[0] and b[1]})
+    if not books:
+        return
+
+    db.flush()
+    rows = db.query(Progress.student_id).filter(
+        tuple_(Progress.subject, Progress.book_name).in_(books)
+    ).distinct().all()
+    refresh_student_summaries(db, [r[0] for r in rows])
+
+
+def ensure_student_summaries(db: Session, student_filters: Sequence = ()) -> int:
+    """
+    進捗があるのに集計テーブルに行が無い生徒（導入前のデータなど）を探して集計を作る。
+    作成した人数を返す。コミットは呼び出し側で行う。
+    """
+    missing = (
+        select(Student.id)
+        .where(*student_filters)
+        .where(exists().where(Progress.student_id == Student.id))
+        .where(~exists().where(StudentProgressSummary.student_id == Student.id))
+    )
+    student_ids = [row[0] for row in db.execute(missing)]
+    refresh_student_summaries(db, student_ids)
+    return len(student_ids)
+
+
+def load_subject_totals(db: Session, student_id: int) -> List[ProgressTotals]:
+    """集計テーブルから科目別の合計を主キーで読む（未作成の生徒はその場で集計する）"""
+    summaries = db.query(StudentProgressSummary).filter(
+        StudentProgressSummary.student_id == student_id
+    ).order_by(StudentProgressSummary.sort_order).all()
+
+    if not summaries:
+        return summarize_progress(db, [student_id], group_by=GROUP_SUBJECT)
+
+    return [
+        ProgressTotals(
+            student_id=s.student_id,
+            subject=s.subject,
+            planned_time=s.planned_time,
+            completed_time=s.completed_time,
+            ratio_sum=s.ratio_sum,
+            item_count=s.item_count,
+            chart_total=s.chart_total,
+            chart_completed=s.chart_completed,
+        )
+        for s in summaries
+    ]
+
+
+def load_student_totals(db: Session, student_id: int) -> ProgressTotals:
+    """集計テーブルから生徒1人分の合計を読む"""
+    totals = ProgressTotals(student_id=student_id)
+    for t in load_subject_totals(db, student_id):
+        totals.planned_time += t.planned_time
+        totals.completed_time += t.completed_time
+        totals.ratio_sum += t.ratio_sum
+        totals.item_count += t.item_count
+        totals.chart_total += t.chart_total
+        totals.chart_completed += t.chart_completed
+    return totals
@@ -0,0 +1,411 @@
+# backend/app/services/report_batch.py
+"""
+統合レポートPDFの一括作成。
+
+校舎全体（または指定した生徒）のレポートをジョブとして受け付け、
+1. 全員分の進捗・英検・過去問・模試・入試カレンダーを数回の一括クエリで読み込み（services/report_data.py）
+2. PDF作成用のプロセスで並列に作成し、できた順に REPORT_JOB_DIR/<job_id>/ に保存する。
+進み具合は report_jobs に記録し、ダウンロードはできた分から ZIP にして流す。
+実行中は heartbeat_at を更新し続け、ワーカーが落ちて止まったジョブはスケジューラーが拾って、
+まだ PDF ができていない生徒の分から再開する（resume_report_jobs）。
+"""
+
+import asyncio
+import logging
+import os
+import re
+import zipfile
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import EikenResult, MockExamResult, PastExamResult, Progress, ReportJob, UniversityAcceptance
+from app.services import report_cache
+from app.services.pdf_renderer import pdf_renderer
+from app.services.report_data import StudentReportData, load_report_data
+
+logger = logging.getLogger(__name__)
+
+INTEGRATED_TEMPLATE = "integrated_report_template.html"
+JOB_POLL_SECONDS = 0.5
+# 実行中のジョブが heartbeat_at を更新する間隔（REPORT_JOB_STALE_SECONDS より十分短く）
+JOB_HEARTBEAT_SECONDS = 15
+
+
+# ==========================================
+# レポートの中身（単体のレポートAPIと共通）
+# ==========================================
+def format_progress_items(progress_items: Iterable[Progress]) -> List[Dict[str, Any]]:
+    formatted_items = []
+    for item in progress_items:
+        pct = 0
+        total = item.total_units or 0
+        completed = item.completed_units or 0
+        if total > 0:
+            pct = round((completed / total) * 100)
+
+        formatted_items.append({
+            "subject": item.subject or "-",
+            "book_name": item.book_name,
+            "pct": pct
+        })
+    return formatted_items
+
+
+def format_eiken(latest_eiken: Optional[EikenResult]) -> str:
+    if not latest_eiken:
+        return "未登録"
+    eiken_str = latest_eiken.grade
+    if latest_eiken.cse_score:
+        eiken_str += f" / CSE {latest_eiken.cse_score}"
+    return eiken_str
+
+
+def format_past_exams(results: Iterable[PastExamResult]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "date": r.date,
+            "university": r.university_name,
+            "faculty": r.faculty_name,
+            "year": r.year,
+            "subject": r.subject,
+            "correct_answers": r.correct_answers or 0,
+            "total_questions": r.total_questions or 0
+        }
+        for r in results
+    ]
+
+
+def format_mock_exams(results: Iterable[MockExamResult]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "name": r.mock_exam_name,
+            "type": r.result_type,
+            "grade": r.grade,
+            "score_summary": f"{r.mock_exam_format}" if hasattr(r, 'mock_exam_format') else "-"
+        }
+        for r in results
+    ]
+
+
+def format_calendar(acceptances: Iterable[UniversityAcceptance]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "univ": a.university_name,
+            "faculty": a.faculty_name,
+            "exam_date": a.exam_date or "-",
+            "announce_date": a.announcement_date or "-"
+        }
+        for a in acceptances
+    ]
+
+
+def integrated_context(
+    data: StudentReportData,
+    sections: List[str],
+    images: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, Any]:
+    """統合レポートのテンプレートに渡す context を組み立てる"""
+    context = {
+        "student_name": data.student_name,
+        "date_str": datetime.now().strftime("%Y年%m月%d日"),
+        "sections": sections,
+        "images": images or {},
+        "dashboard": None,
+        "past_exams": [],
+        "mock_exams": [],
+        "calendar": [],
+        "eiken_str": "未登録"
+    }
+    if "dashboard" in sections:
+        context["eiken_str"] = format_eiken(data.latest_eiken)
+        context["dashboard"] = _dashboard_summary(data)
+    if "past_exams" in sections:
+        context["past_exams"] = format_past_exams(data.past_exams)
+    if "mock_exams" in sections:
+        context["mock_exams"] = format_mock_exams(data.mock_exams)
+    if "calendar" in sections:
+        context["calendar"] = format_calendar(data.acceptances)
+    return context
+
+
+def _dashboard_summary(data: StudentReportData) -> Dict[str, Any]:
+    totals = data.totals
+    return {
+        "total_study_time": round(totals.completed_time if totals else 0.0, 1),
+        "total_progress_pct": round(totals.progress_rate if totals else 0.0, 1),
+        "progress_list": format_progress_items(data.progress_items)
+    }
+
+
+def report_data_json(data: StudentReportData) -> Dict[str, Any]:
+    """フロントエンドの印刷用ページに返すデータ（全セクションを読み込んだ StudentReportData から）"""
+    return {
+        "student": {
+            "name": data.student_name,
+            "target_university": data.target_university
+        },
+        "dashboard": _dashboard_summary(data),
+        "eiken_str": format_eiken(data.latest_eiken),
+        "past_exams": format_past_exams(data.past_exams),
+        "mock_exams": format_mock_exams(data.mock_exams)
+    }
+
+
+def load_integrated_contexts(db: Session, student_ids: List[int], sections: List[str]) -> List[Dict[str, Any]]:
+    """
+    複数の生徒の統合レポート用 context を、セクションごとに1回ずつの一括クエリで作る。
+    戻り値は {"student_id", "student_name", "context"} のリスト（student_ids の順）
+    """
+    return [
+        {
+            "student_id": data.student_id,
+            "student_name": data.student_name,
+            "context": integrated_context(data, sections),
+        }
+        for data in load_report_data(db, student_ids, sections).values()
+    ]
+
+
+# ==========================================
+# ジョブの実行
+# ==========================================
+def job_dir(job_id: int) -> str:
+    return os.path.join(settings.REPORT_JOB_DIR, str(job_id))
+
+
+def _pdf_filename(index: int, student_id: int, student_name: str) -> str:
+    # 並び順を保つ連番 + ファイル名に使えない文字を除いた名前
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", student_name or "").strip("_") or "student"
+    return f"{index:04d}_{safe_name}_{student_id}.pdf"
+
+
+def _stale_filter(now: datetime):
+    """実行中のまま heartbeat が REPORT_JOB_STALE_SECONDS 以上途切れている（ワーカーが落ちた）ジョブ"""
+    stale_before = now - timedelta(seconds=settings.REPORT_JOB_STALE_SECONDS)
+    return and_(ReportJob.status == "running", or_(ReportJob.heartbeat_at.is_(None), ReportJob.heartbeat_at < stale_before))
+
+
+def _claim_job(job_id: int) -> bool:
+    """
+    待ち（pending）か、止まった実行中のジョブを自分のものにする。
+    他のワーカーが先に取っていたら False
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        claimed = db.query(ReportJob).filter(
+            ReportJob.id == job_id,
+            or_(ReportJob.status == "pending", _stale_filter(now)),
+        ).update({"status": "running", "heartbeat_at": now}, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+    finally:
+        db.close()
+
+
+def _update_job(job_id: int, **values):
+    db = SessionLocal()
+    try:
+        db.query(ReportJob).filter(ReportJob.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _increment_job(job_id: int, column: str):
+    db = SessionLocal()
+    try:
+        col = getattr(ReportJob, column)
+        db.query(ReportJob).filter(ReportJob.id == job_id).update(
+            {col: col + 1, ReportJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_job_contexts(job_id: int, skip_student_ids: Set[int]) -> List[Dict[str, Any]]:
+    """
+    まだ PDF ができていない生徒の context を作る。連番（index）は投入時の student_ids の並びの位置なので、
+    再開しても前回の実行でできたファイルと同じ番号になる
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(ReportJob, job_id)
+        positions = {student_id: i for i, student_id in enumerate(job.student_ids, start=1)}
+        student_ids = [student_id for student_id in job.student_ids if student_id not in skip_student_ids]
+        items = load_integrated_contexts(db, student_ids, list(job.sections))
+        for item in items:
+            item["index"] = positions[item["student_id"]]
+        return items
+    finally:
+        db.close()
+
+
+def _rendered_student_ids(out_dir: str) -> Set[int]:
+    """前回の実行で PDF ができている生徒のID（ファイル名の末尾 _<student_id>.pdf から）"""
+    return {int(name[:-len(".pdf")].rsplit("_", 1)[1]) for name in _finished_pdfs(out_dir)}
+
+
+def _write_file(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def _keep_alive(job_id: int):
+    """実行中であることを heartbeat_at に書き続ける（データの読み込みや PDF 作成の待ちが長くても止まったと見なされない）"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            await run_in_threadpool(_update_job, job_id, heartbeat_at=datetime.utcnow())
+        except Exception as e:
+            logger.warning(f"⚠️ 一括レポート作成ジョブの heartbeat を記録できませんでした（job={job_id}）: {e}")
+
+
+async def run_report_job(job_id: int):
+    """ジョブを最後まで実行する（アプリのイベントループ上のタスクとして動かす）"""
+    if not await run_in_threadpool(_claim_job, job_id):
+        return
+    keep_alive = asyncio.create_task(_keep_alive(job_id))
+    try:
+        out_dir = job_dir(job_id)
+        os.makedirs(out_dir, exist_ok=True)
+
+        # 止まったジョブの再開なら、できている PDF の生徒は作り直さない（失敗した生徒はもう一度作る）
+        done = _rendered_student_ids(out_dir)
+        items = await run_in_threadpool(_load_job_contexts, job_id, done)
+        await run_in_threadpool(_update_job, job_id, total=len(done) + len(items), completed=len(done), failed=0)
+        if done:
+            logger.info(f"🔁 一括レポート作成を再開します（job={job_id}, 作成済み {len(done)}名 / 残り {len(items)}名）")
+
+        # PDF作成プロセスの数だけ同時に投げる（画面からの単体レポートの待ち行列を埋め尽くさない）
+        semaphore = asyncio.Semaphore(pdf_renderer.workers)
+
+        async def render_one(item: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    _, pdf_bytes = await report_cache.render_cached(INTEGRATED_TEMPLATE, item["context"], background=True)
+                    path = os.path.join(out_dir, _pdf_filename(item["index"], item["student_id"], item["student_name"]))
+                    await run_in_threadpool(_write_file, path, pdf_bytes)
+                    await run_in_threadpool(_increment_job, job_id, "completed")
+                except Exception as e:
+                    logger.error(f"❌ レポート作成に失敗しました（job={job_id}, student={item['student_id']}）: {e}")
+                    await run_in_threadpool(_increment_job, job_id, "failed")
+
+        await asyncio.gather(*(render_one(item) for item in items))
+        await run_in_threadpool(_update_job, job_id, status="completed", finished_at=datetime.utcnow())
+        logger.info(f"✅ 一括レポート作成が完了しました（job={job_id}, {len(done) + len(items)}名）")
+    except Exception as e:
+        logger.error(f"❌ 一括レポート作成ジョブが失敗しました（job={job_id}）: {e}")
+        await run_in_threadpool(_update_job, job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+    finally:
+        keep_alive.cancel()
+
+
+# 実行中のジョブのタスク（途中で GC されないよう参照を持っておく）
+_running_jobs = set()
+
+
+def start_report_job(job_id: int) -> asyncio.Task:
+    task = asyncio.create_task(run_report_job(job_id))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+
+def _resumable_job_ids() -> List[int]:
+    db = SessionLocal()
+    try:
+        return [job_id for (job_id,) in db.query(ReportJob.id).filter(
+            or_(ReportJob.status == "pending", _stale_filter(datetime.utcnow()))
+        ).order_by(ReportJob.id)]
+    finally:
+        db.close()
+
+
+async def resume_report_jobs():
+    """定期実行用: 待ちのまま・実行中のまま止まったジョブ（ワーカーが落ちた・再起動した）を拾って続きから実行する"""
+    for job_id in await run_in_threadpool(_resumable_job_ids):
+        # 投入したワーカーが直後に落ちた pending のジョブも拾う。二重に動かないのは _claim_job で防ぐ
+        start_report_job(job_id)
+
+
+# ==========================================
+# ZIP のストリーミング
+# ==========================================
+class _ZipStream:
+    """ZipFile の書き込み先。書かれたバイト列をためておき、取り出して流す（シーク不可として扱われる）"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _finished_pdfs(out_dir: str) -> List[str]:
+    if not os.path.isdir(out_dir):
+        return []
+    return sorted(name for name in os.listdir(out_dir) if name.endswith(".pdf"))
+
+
+def _job_status(job_id: int) -> Optional[str]:
+    """ジョブの状態。実行中でも heartbeat が途切れていれば "stale"（再開されるまでは待っても増えない）"""
+    db = SessionLocal()
+    try:
+        row = db.query(ReportJob.status, _stale_filter(datetime.utcnow())).filter(ReportJob.id == job_id).first()
+        if row is None:
+            return None
+        status, stale = row
+        return "stale" if stale else status
+    finally:
+        db.close()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def stream_job_zip(job_id: int) -> AsyncIterator[bytes]:
+    """
+    ジョブの PDF を ZIP にして流す。作成中のジョブなら、できた PDF から順に送り、終わるまで待つ。
+    作成していたワーカーが落ちて heartbeat が途切れたら、そこまでにできた分で打ち切る。
+    PDF はすでに圧縮されているので無圧縮（ZIP_STORED）で詰める。
+    """
+    out_dir = job_dir(job_id)
+    stream = _ZipStream()
+    sent = set()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        while True:
+            # 先に状態を見てからファイルを数える（終わった直後に出来たファイルも取りこぼさない）
+            status = await run_in_threadpool(_job_status, job_id)
+            names = [name for name in _finished_pdfs(out_dir) if name not in sent]
+            for name in names:
+                data = await run_in_threadpool(_read_file, os.path.join(out_dir, name))
+                # 先頭の連番はファイル名から外す
+                zf.writestr(name.split("_", 1)[1], data)
+                sent.add(name)
+                yield stream.pop()
+            if status not in ("pending", "running"):
+                break
+            if not names:
+                await asyncio.sleep(JOB_POLL_SECONDS)
+    yield stream.pop()
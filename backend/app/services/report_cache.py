@@ -0,0 +1,173 @@
+# backend/app/services/report_cache.py
+"""
+作成したレポートPDFのディスクキャッシュ（内容アドレス方式）。
+
+キーは「テンプレート名・テンプレートのバージョン・PDFに渡す context 全体」のハッシュ。
+context には生徒のデータ・セクション・グラフ画像・日付がすべて入っているので、
+生徒の行が1つでも変わればキーが変わり、古いPDFが返ることはない（古いものは LRU で消える）。
+同じキーは ETag としてもそのまま使い、If-None-Match が一致すれば作り直しも送り直しもしない。
+
+ファイルは REPORT_CACHE_DIR/<キーの先頭2文字>/<キー>.pdf に置き、
+合計が REPORT_CACHE_MAX_MB を超えたら最後に使われた（mtime が古い）ものから消す。
+ディレクトリを複数のワーカーで共有しても壊れないよう、書き込みは一時ファイル + rename。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.services.pdf_renderer import pdf_renderer
+from app.utils.pdf_generator import TEMPLATES_DIR
+
+logger = logging.getLogger(__name__)
+
+# 消す時は上限のこの割合まで減らす（1件ごとに消し続けないように）
+PRUNE_TARGET_RATIO = 0.9
+
+
+def _template_version() -> str:
+    """テンプレート一式のハッシュ（デプロイでテンプレートが変われば全キーが変わる）"""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(TEMPLATES_DIR)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, TEMPLATES_DIR).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def content_key(template_name: str, context: dict) -> str:
+    payload = json.dumps(
+        {"template": template_name, "version": TEMPLATE_VERSION, "context": context},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def json_etag(data) -> str:
+    """JSON のレスポンス用の ETag（同じ内容なら同じ値）"""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return f'"{hashlib.sha256(payload.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class ReportCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # このプロセスから見た合計サイズ（None ならまだ数えていない）。ずれても消す時に数え直す
+        self._size: Optional[int] = None
+        self._mutex = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 最後に使った時刻として mtime を更新（LRU の順番）
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ レポートキャッシュの読み込みに失敗しました: {e}")
+            return None
+
+    def put(self, key: str, data: bytes):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ レポートキャッシュの書き込みに失敗しました: {e}")
+            return
+
+        with self._mutex:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._prune()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue  # 他のワーカーが消した
+                yield os.path.join(root, name), st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _prune(self):
+        """古いものから消して、上限の PRUNE_TARGET_RATIO まで減らす"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * PRUNE_TARGET_RATIO)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+        if removed:
+            logger.info(f"🧹 レポートキャッシュを {removed} 件削除しました")
+
+
+report_cache = ReportCache(
+    directory=settings.REPORT_CACHE_DIR,
+    max_bytes=settings.REPORT_CACHE_MAX_MB * 1024 * 1024,
+)
+
+
+async def render_cached(template_name: str, context: dict, background: bool = False) -> Tuple[str, bytes]:
+    """
+    キャッシュにあればそれを、なければ PDF を作ってキャッシュに入れて返す（キー = ETag の中身も返す）。
+    作成が混み合っている時は PdfRendererBusy（キャッシュにあれば混んでいても返せる）。
+    """
+    key = content_key(template_name, context)
+    cached = await asyncio.to_thread(report_cache.get, key)
+    if cached is not None:
+        return key, cached
+    pdf_bytes = await pdf_renderer.render(template_name, context, background=background)
+    await asyncio.to_thread(report_cache.put, key, pdf_bytes)
+    return key, pdf_bytes
@@ -0,0 +1,130 @@
+# backend/app/services/report_data.py
+"""
+レポート用の生徒データの読み込み。
+
+統合レポートPDF・印刷用JSON・一括作成ジョブのどれも、生徒の人数に関係なく
+「生徒 + 必要なセクションごとに1回」の一括クエリ（IN 句）で全員分を読み込む。
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import Session
+
+from app.models.models import (
+    EikenResult, MockExamResult, PastExamResult, Progress, Student, UniversityAcceptance, User
+)
+from app.services import progress_aggregation
+
+# 統合レポートのセクション（dashboard には英検も含む）
+REPORT_SECTIONS = ("dashboard", "past_exams", "mock_exams", "calendar")
+
+
+@dataclass
+class StudentReportData:
+    """生徒1人分のレポートの元データ（読み込んでいないセクションは空のまま）"""
+    student_id: int
+    student_name: str
+    target_university: Optional[str] = None
+    progress_items: List[Progress] = field(default_factory=list)
+    totals: Optional[progress_aggregation.ProgressTotals] = None
+    latest_eiken: Optional[EikenResult] = None
+    past_exams: List[PastExamResult] = field(default_factory=list)
+    mock_exams: List[MockExamResult] = field(default_factory=list)
+    acceptances: List[UniversityAcceptance] = field(default_factory=list)
+
+
+def _group_by_student(rows) -> Dict[int, list]:
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.student_id].append(row)
+    return grouped
+
+
+def _latest_eiken(db: Session, ids: List[int]) -> Dict[int, EikenResult]:
+    """生徒ごとに最新の英検を1件"""
+    ranked = select(
+        EikenResult.id,
+        func.row_number().over(
+            partition_by=EikenResult.student_id,
+            order_by=(desc(EikenResult.exam_date), desc(EikenResult.id)),
+        ).label("rn"),
+    ).where(EikenResult.student_id.in_(ids)).subquery()
+    return {
+        e.student_id: e
+        for e in db.query(EikenResult).join(ranked, ranked.c.id == EikenResult.id).filter(ranked.c.rn == 1)
+    }
+
+
+def load_report_data(
+    db: Session,
+    student_ids: Iterable[int],
+    sections: Sequence[str] = REPORT_SECTIONS,
+    include_users: bool = False,
+) -> Dict[int, StudentReportData]:
+    """
+    複数の生徒のレポート用データを、セクションごとに1回ずつの一括クエリで読み込む。
+    戻り値は student_ids の順の dict（見つからない生徒は入らない）。
+    include_users=True なら students に無いIDを users からも探す（旧仕様との互換性）。
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return {}
+
+    names = {}
+    for s in db.query(Student).filter(Student.id.in_(student_ids)):
+        names[s.id] = (s.name, getattr(s, "target_university", None))
+    missing = [sid for sid in student_ids if sid not in names]
+    if include_users and missing:
+        for u in db.query(User).filter(User.id.in_(missing)):
+            names[u.id] = (u.username, None)
+
+    bundles = {
+        sid: StudentReportData(student_id=sid, student_name=names[sid][0], target_university=names[sid][1])
+        for sid in student_ids if sid in names
+    }
+    ids = list(bundles)
+    if not ids:
+        return {}
+
+    if "dashboard" in sections:
+        progress = _group_by_student(
+            db.query(Progress).filter(Progress.student_id.in_(ids)).order_by(Progress.student_id, Progress.id)
+        )
+        totals = {t.student_id: t for t in progress_aggregation.summarize_progress(db, ids)}
+        eiken = _latest_eiken(db, ids)
+        for sid, data in bundles.items():
+            data.progress_items = progress.get(sid, [])
+            data.totals = totals.get(sid, progress_aggregation.ProgressTotals(student_id=sid))
+            data.latest_eiken = eiken.get(sid)
+    if "past_exams" in sections:
+        past = _group_by_student(
+            db.query(PastExamResult).filter(PastExamResult.student_id.in_(ids))
+            .order_by(PastExamResult.student_id, desc(PastExamResult.date), desc(PastExamResult.id))
+        )
+        for sid, data in bundles.items():
+            data.past_exams = past.get(sid, [])
+    if "mock_exams" in sections:
+        mock = _group_by_student(
+            db.query(MockExamResult).filter(MockExamResult.student_id.in_(ids)).order_by(MockExamResult.student_id, MockExamResult.id)
+        )
+        for sid, data in bundles.items():
+            data.mock_exams = mock.get(sid, [])
+    if "calendar" in sections:
+        calendar = _group_by_student(
+            db.query(UniversityAcceptance).filter(UniversityAcceptance.student_id.in_(ids))
+            .order_by(UniversityAcceptance.student_id, UniversityAcceptance.id)
+        )
+        for sid, data in bundles.items():
+            data.acceptances = calendar.get(sid, [])
+
+    return bundles
+
+
+def load_student_report_data(
+    db: Session, student_id: int, sections: Sequence[str] = REPORT_SECTIONS
+) -> Optional[StudentReportData]:
+    """生徒1人分（students に無ければ users からも探す）。見つからなければ None"""
+    return load_report_data(db, [student_id], sections, include_users=True).get(student_id)
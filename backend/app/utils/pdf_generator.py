@@ -15,6 +15,12 @@ FONTS_DIR = os.path.join(BASE_DIR, "fonts")
 FONT_PATH = os.path.join(FONTS_DIR, "ipaexg.ttf")
 
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+# テンプレートはデプロイ時にしか変わらないので、一度コンパイルしたら更新チェックしない
+templates.env.auto_reload = False
+
+# このプロセスで確認済みのフォントのパス（毎回ファイルを確認・ダウンロードしない）
+_font_path = None
+_font_checked = False
 
 def ensure_japanese_font():
     """
@@ -54,11 +60,32 @@ def ensure_japanese_font():
         print(f"Failed to download font: {e}")
         return None
 
+def get_japanese_font_path():
+    """日本語フォントのパス（プロセスごとに最初の1回だけ確認する）"""
+    global _font_path, _font_checked
+    if not _font_checked:
+        _font_path = ensure_japanese_font()
+        _font_checked = True
+    return _font_path
+
+def init_pdf_worker():
+    """
+    PDF作成用のワーカープロセスの初期化。
+    フォントの確認と全テンプレートのコンパイルを先に済ませておく
+    """
+    get_japanese_font_path()
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.get_template(name)
+
+def render_pdf_bytes(template_name: str, context: dict) -> bytes:
+    """ワーカープロセスで実行する用（プロセス間で受け渡せるよう bytes で返す）"""
+    return create_pdf_from_template(template_name, context).getvalue()
+
 def create_pdf_from_template(template_name: str, context: dict) -> BytesIO:
     """
     Jinja2テンプレートとデータからPDFを生成する
     """
-    font_path = ensure_japanese_font()
+    font_path = get_japanese_font_path()
     if font_path:
         # ★修正2: xhtml2pdfが確実に読み込めるように file:/// 形式のURIに変換
         context["font_path"] = font_path
@@ -79,4 +106,4 @@ def create_pdf_from_template(template_name: str, context: dict) -> BytesIO:
         raise Exception("PDF generation failed")
 
     buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return buffer
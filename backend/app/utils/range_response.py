@@ -0,0 +1,119 @@
+# backend/app/utils/range_response.py
+"""
+ファイルのダウンロード用レスポンス（Range・ETag・304 に対応したストリーミング）。
+
+本体は open_range(start, end) で少しずつ読むので、ファイルの大きさに関係なくメモリは一定。
+"""
+
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Range ヘッダーを (start, end)（end を含む）にする。指定なし・読めない形式なら None（全体を返す）。
+    複数範囲（bytes=0-1,5-6）は扱わず全体を返す。範囲がファイルの外なら RangeNotSatisfiable
+    """
+    if not header:
+        return None
+    m = RANGE_PATTERN.match(header.strip())
+    if not m:
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 は最後の500バイト
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _to_utc(value: datetime) -> datetime:
+    """UTC の aware な datetime にする（DB の naive な日時は UTC として扱う）"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _not_modified_since(request: Request, last_modified: Optional[datetime]) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None or "if-none-match" in request.headers:
+        return False
+    try:
+        since = _to_utc(parsedate_to_datetime(header))
+    except (TypeError, ValueError):
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+def file_response(
+    request: Request,
+    size: int,
+    etag: str,
+    open_range: Callable[[int, int], Iterator[bytes]],
+    media_type: str = "application/octet-stream",
+    headers: Optional[Dict[str, str]] = None,
+    last_modified: Optional[datetime] = None,
+) -> Response:
+    """
+    ファイルを返すレスポンス。
+    - If-None-Match（If-Modified-Since）が一致すれば 304
+    - Range があれば 206（If-Range の ETag が違えば全体を 200 で）、範囲外なら 416
+    - それ以外は全体を 200 で、どれも Content-Length つきで少しずつ流す
+    """
+    base_headers = {"ETag": etag, "Accept-Ranges": "bytes", **(headers or {})}
+    if last_modified is not None:
+        # format_datetime(usegmt=True) は UTC 以外のタイムゾーンだと ValueError になる
+        last_modified = _to_utc(last_modified)
+        base_headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _etag_matches(request.headers.get("if-none-match"), etag) or _not_modified_since(request, last_modified):
+        return Response(status_code=304, headers=base_headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return StreamingResponse(
+            open_range(0, size - 1) if size else iter(()),
+            media_type=media_type,
+            headers={**base_headers, "Content-Length": str(size)},
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        open_range(start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={**base_headers, "Content-Length": str(end - start + 1), "Content-Range": f"bytes {start}-{end}/{size}"},
+    )
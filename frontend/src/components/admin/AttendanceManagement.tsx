@@ -76,45 +76,39 @@ export default function AttendanceManagement() {
     }, []);
 
     // ----------------------------------------------------
-    // 🚨 ここから追加：リアルタイム通知レーダー（30秒に1回チェック）
+    // 🚨 リアルタイム通知（サーバーから届いた時だけ受け取る SSE）
     // ----------------------------------------------------
     useEffect(() => {
-        const checkNotifications = async () => {
+        const token = localStorage.getItem('token');
+        if (!token) return;
+
+        // EventSource はヘッダーを付けられないので、トークンはクエリで渡す
+        // 切れてもブラウザが自動で再接続し、最後に受け取った通知の続きから届く
+        const source = new EventSource(`${api.defaults.baseURL}/attendance/notifications/stream?token=${encodeURIComponent(token)}`);
+
+        source.addEventListener('notification', async (event) => {
             try {
-                // 1. 未読の通知がないか聞きに行く
-                const res = await api.get('/attendance/notifications/unread');
-                const unreadNotifs = res.data;
+                const notif = JSON.parse((event as MessageEvent).data);
+
+                // 画面右下にカッコよくポップアップ（トースト）を出す！
+                toast.info(notif.title, {
+                    description: notif.message,
+                    duration: 8000, // 8秒間表示する
+                    icon: notif.title.includes('振替') ? <Clock className="w-5 h-5 text-indigo-500" /> : <UserMinus className="w-5 h-5 text-rose-500" />,
+                });
 
-                // 2. もし未読の通知があったら！
-                if (unreadNotifs && unreadNotifs.length > 0) {
-                    for (const notif of unreadNotifs) {
-                        // 画面右下にカッコよくポップアップ（トースト）を出す！
-                        toast.info(notif.title, {
-                            description: notif.message,
-                            duration: 8000, // 8秒間表示する
-                            icon: notif.title.includes('振替') ? <Clock className="w-5 h-5 text-indigo-500" /> : <UserMinus className="w-5 h-5 text-rose-500" />,
-                        });
+                // 表示したらすぐにバックエンドへ「既読にしたよ！」と伝える
+                await api.post(`/attendance/notifications/${notif.id}/read`);
 
-                        // 表示したらすぐにバックエンドへ「既読にしたよ！」と伝える
-                        await api.post(`/attendance/notifications/${notif.id}/read`);
-                    }
-                    
-                    // 🌟 ついでに、表のデータも自動で最新に更新（リフレッシュ）する！
-                    fetchData(true);
-                }
+                // 🌟 ついでに、表のデータも自動で最新に更新（リフレッシュ）する！
+                fetchData(true);
             } catch (e) {
-                console.error("通知の取得に失敗しました", e);
+                console.error("通知の処理に失敗しました", e);
             }
-        };
-
-        // 画面を開いた瞬間に1回チェック
-        checkNotifications();
-
-        // その後、30秒ごと（30000ミリ秒）にずっとチェックし続ける
-        const interval = setInterval(checkNotifications, 30000);
+        });
 
-        // 画面を閉じた時はレーダーを止める
-        return () => clearInterval(interval);
+        // 画面を閉じた時は接続を切る
+        return () => source.close();
     }, []);
     // ----------------------------------------------------
     
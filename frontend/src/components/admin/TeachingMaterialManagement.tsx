@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import api from '../../lib/api';
-import { Tag, TeachingMaterial } from '../../types';
+import { Tag, TeachingMaterial, TeachingMaterialList } from '../../types';
 import { Button } from '../ui/button';
 import { Input } from '../ui/input';
 import { Label } from '../ui/label';
@@ -14,6 +14,8 @@ export default function TeachingMaterialManagement() {
     const confirm = useConfirm();
     
     const [materials, setMaterials] = useState<TeachingMaterial[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [totalMaterials, setTotalMaterials] = useState<number | null>(null);
     const [subjects, setSubjects] = useState<Tag[]>([]);
     const [details, setDetails] = useState<Tag[]>([]);
     
@@ -31,11 +33,13 @@ export default function TeachingMaterialManagement() {
     const fetchData = async () => {
         try {
             const [matRes, subRes, detRes] = await Promise.all([
-                api.get('/materials/'),
+                api.get<TeachingMaterialList>('/materials/'),
                 api.get('/materials/tags/subjects'),
                 api.get('/materials/tags/details')
             ]);
-            setMaterials(matRes.data);
+            setMaterials(matRes.data.items);
+            setNextCursor(matRes.data.next_cursor);
+            setTotalMaterials(matRes.data.total);
             setSubjects(subRes.data);
             setDetails(detRes.data);
         } catch (error) {
@@ -43,6 +47,18 @@ export default function TeachingMaterialManagement() {
         }
     };
 
+    // 教材一覧の続き（新しい順にページごと）
+    const handleLoadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            const res = await api.get<TeachingMaterialList>('/materials/', { params: { cursor: nextCursor } });
+            setMaterials(prev => [...prev, ...res.data.items]);
+            setNextCursor(res.data.next_cursor);
+        } catch (error) {
+            console.error("データの取得に失敗しました", error);
+        }
+    };
+
     useEffect(() => {
         fetchData();
     }, []);
@@ -256,7 +272,9 @@ export default function TeachingMaterialManagement() {
 
                     {/* 教材一覧テーブル */}
                     <div>
-                        <h3 className="font-bold text-lg mb-2">登録済み教材一覧</h3>
+                        <h3 className="font-bold text-lg mb-2">
+                            登録済み教材一覧{totalMaterials !== null && <span className="text-sm font-normal text-gray-500 ml-2">({totalMaterials}件)</span>}
+                        </h3>
                         <div className="border rounded-lg overflow-hidden">
                             <Table>
                                 <TableHeader className="bg-gray-50">
@@ -293,6 +311,11 @@ export default function TeachingMaterialManagement() {
                                 </TableBody>
                             </Table>
                         </div>
+                        {nextCursor && (
+                            <div className="text-center mt-3">
+                                <Button variant="outline" onClick={handleLoadMore}>もっと見る</Button>
+                            </div>
+                        )}
                     </div>
                 </TabsContent>
 
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { Activity, Clock, User, MapPin, AlertCircle, RefreshCw, Filter } from 'lucide-react';
+import { Activity, Clock, User, MapPin, AlertCircle, RefreshCw, Filter, Download } from 'lucide-react';
 import api from '../../lib/api';
 
 // バックエンドのスキーマに合わせた型定義
@@ -13,19 +13,32 @@ interface AuditLog {
   timestamp: string;
 }
 
+interface AuditLogPage {
+  items: AuditLog[];
+  next_cursor: string | null;
+}
+
+const PAGE_SIZE = 100;
+
 const AuditLogViewer: React.FC = () => {
   const [logs, setLogs] = useState<AuditLog[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // 続きを読み込むためのカーソル（null なら最後まで読み込み済み）
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   
-  // ★追加: 進捗更新のみをフィルタリングするState
+  // ★追加: 進捗更新のみをフィルタリングするState（絞り込みはサーバー側で行う）
   const [filterProgressOnly, setFilterProgressOnly] = useState(false);
 
+  const filterParams = () => (filterProgressOnly ? { action_category: 'PROGRESS' } : {});
+
   const fetchLogs = async () => {
     setLoading(true);
     try {
-      const response = await api.get('/audit/logs');
-      setLogs(response.data);
+      const response = await api.get<AuditLogPage>('/audit/logs', { params: { limit: PAGE_SIZE, ...filterParams() } });
+      setLogs(response.data.items);
+      setNextCursor(response.data.next_cursor);
       setError(null);
     } catch (err: any) {
       console.error(err);
@@ -35,9 +48,42 @@ const AuditLogViewer: React.FC = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get<AuditLogPage>('/audit/logs', { params: { limit: PAGE_SIZE, cursor: nextCursor, ...filterParams() } });
+      setLogs(prev => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (err: any) {
+      console.error(err);
+      setError('監査ログの取得に失敗しました。');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // NDJSON（1行1ログ）で全件ダウンロード
+  const exportLogs = async () => {
+    try {
+      const response = await api.get('/audit/logs/export', { params: filterParams(), responseType: 'blob' });
+      const url = window.URL.createObjectURL(new Blob([response.data]));
+      const link = document.createElement('a');
+      link.href = url;
+      link.setAttribute('download', 'audit_logs.ndjson');
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+    } catch (err: any) {
+      console.error(err);
+      setError('監査ログのエクスポートに失敗しました。');
+    }
+  };
+
   useEffect(() => {
     fetchLogs();
-  }, []);
+  }, [filterProgressOnly]);
 
   // 日時を日本時間にフォーマットする関数
   const formatDate = (dateString: string) => {
@@ -103,11 +149,6 @@ const AuditLogViewer: React.FC = () => {
     }
   };
 
-  // ★追加: フィルタリング適用
-  const filteredLogs = filterProgressOnly 
-    ? logs.filter(log => log.action.toUpperCase().includes('PROGRESS')) 
-    : logs;
-
   if (loading) {
     return (
       <div className="flex justify-center items-center p-8 text-gray-400">
@@ -137,6 +178,13 @@ const AuditLogViewer: React.FC = () => {
                 />
             </label>
 
+            <button 
+            onClick={exportLogs}
+            className="text-sm flex items-center gap-1 text-gray-500 hover:text-indigo-600 transition-colors"
+            >
+            <Download className="w-4 h-4" /> エクスポート
+            </button>
+
             <button 
             onClick={fetchLogs}
             className="text-sm flex items-center gap-1 text-gray-500 hover:text-indigo-600 transition-colors"
@@ -167,7 +215,7 @@ const AuditLogViewer: React.FC = () => {
               </tr>
             </thead>
             <tbody className="divide-y divide-gray-100">
-              {filteredLogs.length === 0 ? (
+              {logs.length === 0 ? (
                 <tr>
                   <td colSpan={5} className="px-4 py-12 text-center text-gray-400">
                     <Filter className="w-8 h-8 mx-auto mb-2 text-gray-300" />
@@ -175,7 +223,7 @@ const AuditLogViewer: React.FC = () => {
                   </td>
                 </tr>
               ) : (
-                filteredLogs.map((log) => (
+                logs.map((log) => (
                   <tr key={log.id} className="hover:bg-gray-50 transition-colors">
                     <td className="px-4 py-3 whitespace-nowrap font-mono text-xs">{formatDate(log.timestamp)}</td>
                     <td className="px-4 py-3 whitespace-nowrap">{getActionBadge(log.action)}</td>
@@ -192,6 +240,17 @@ const AuditLogViewer: React.FC = () => {
               )}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="p-3 text-center border-t">
+              <button
+                onClick={fetchMore}
+                disabled={loadingMore}
+                className="text-sm text-indigo-600 hover:text-indigo-800 disabled:text-gray-400"
+              >
+                {loadingMore ? '読み込み中...' : 'さらに読み込む'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
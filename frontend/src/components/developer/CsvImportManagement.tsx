@@ -56,13 +56,20 @@ const FORMAT_GUIDES = {
     },
     user: {
         label: "講師(ユーザー)データ",
-        headers: "username, name, role, branch_id",
-        example: "suzuki_t, 鈴木一郎, admin, 1"
+        headers: "username, role, school",
+        example: "suzuki_t, admin, 鷺沼校"
     }
 } as const;
 
 type ImportType = keyof typeof FORMAT_GUIDES;
 
+// これより大きいファイルはバックグラウンドのジョブとして取り込み、進み具合をポーリングする
+// （リクエスト内で処理するとプロキシのタイムアウトに当たるため）
+const BACKGROUND_IMPORT_BYTES = 1024 * 1024;
+const JOB_POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
 export default function CsvImportManagement() {
     const [importType, setImportType] = useState<ImportType>("textbook");
     const [file, setFile] = useState<File | null>(null);
@@ -142,6 +149,25 @@ export default function CsvImportManagement() {
         resetMessages();
     };
 
+    // バックグラウンドのインポートが終わるまで進み具合を表示しながら待つ
+    const waitForImportJob = async (jobId: number): Promise<string> => {
+        while (true) {
+            await sleep(JOB_POLL_INTERVAL_MS);
+            const res = await api.get(`/csv_import/jobs/${jobId}`) as any;
+            const job = res.data;
+            if (job.status === "completed") {
+                const lines = ["インポート完了！", `新規: ${job.inserted}件`, `更新: ${job.updated}件`, `変更なし: ${job.unchanged}件`];
+                if (job.error_count) lines.push(`エラー: ${job.error_count}件（取り込んでいません）`);
+                return lines.join("\n");
+            }
+            if (job.status === "failed") {
+                throw { response: { data: { detail: job.error || "インポートに失敗しました" } } };
+            }
+            const eta = job.eta_seconds != null ? ` / 残り約${Math.ceil(job.eta_seconds)}秒` : "";
+            setSuccessMsg(`取り込み中... ${Math.round(job.progress * 100)}%（${job.rows_processed}行${eta}）`);
+        }
+    };
+
     // アップロード実行
     const handleUpload = async () => {
         if (!file) {
@@ -155,6 +181,8 @@ export default function CsvImportManagement() {
         const formData = new FormData();
         formData.append("import_type", importType);
         formData.append("file", file);
+        const background = file.size > BACKGROUND_IMPORT_BYTES;
+        if (background) formData.append("background", "true");
 
         try {
             const response = await api.post('/csv_import/upload', formData, {
@@ -162,7 +190,10 @@ export default function CsvImportManagement() {
             }) as any;
 
             // response.data が直接返る場合と axios の response オブジェクトの場合があるので調整
-            const msg = response.data?.message || "インポートが完了しました！";
+            let msg = response.data?.message || "インポートが完了しました！";
+            if (background && response.data?.job_id) {
+                msg = await waitForImportJob(response.data.job_id);
+            }
             setSuccessMsg(msg);
             toast.success("インポート成功");
             setFile(null);
@@ -1,68 +1,116 @@
 import React, { useState, useEffect } from 'react';
 import api from '../lib/api';
-import { Tag, TeachingMaterial } from '../types';
+import { Tag, TeachingMaterial, TeachingMaterialList } from '../types';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Card, CardContent } from '../components/ui/card';
 import { Search, Printer, Files, Info } from 'lucide-react';
 
+const PAGE_SIZE = 60;
+
+// 1ページ目のサムネイル（認証ヘッダーが必要なので Blob として取得する）
+function MaterialThumbnail({ materialId }: { materialId: number }) {
+    const [url, setUrl] = useState<string | null>(null);
+
+    useEffect(() => {
+        let objectUrl: string | null = null;
+        api.get(`/materials/${materialId}/thumbnail`, { responseType: 'blob' })
+            .then(res => {
+                objectUrl = URL.createObjectURL(res.data);
+                setUrl(objectUrl);
+            })
+            .catch(() => setUrl(null));
+        return () => {
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+        };
+    }, [materialId]);
+
+    if (!url) return null;
+    return <img src={url} alt="" className="w-full h-40 object-contain bg-gray-50 rounded border" />;
+}
+
 export default function MaterialSearch() {
-    const [allMaterials, setAllMaterials] = useState<TeachingMaterial[]>([]);
-    const [filteredMaterials, setFilteredMaterials] = useState<TeachingMaterial[]>([]);
+    const [materials, setMaterials] = useState<TeachingMaterial[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [total, setTotal] = useState<number | null>(null);
+    const [facets, setFacets] = useState<TeachingMaterialList['facets']>(null);
     const [subjects, setSubjects] = useState<Tag[]>([]);
     const [details, setDetails] = useState<Tag[]>([]);
 
     // 検索・フィルター用ステート
     const [searchQuery, setSearchQuery] = useState('');
+    const [debouncedQuery, setDebouncedQuery] = useState('');
     const [selectedSubjectId, setSelectedSubjectId] = useState<number | null>(null);
     const [selectedDetailId, setSelectedDetailId] = useState<number | null>(null);
     const [isLoading, setIsLoading] = useState(false);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
 
-    // 初期データの取得
+    // タグ一覧の取得
     useEffect(() => {
-        const fetchData = async () => {
+        const fetchTags = async () => {
             try {
-                const [matRes, subRes, detRes] = await Promise.all([
-                    api.get('/materials/'),
+                const [subRes, detRes] = await Promise.all([
                     api.get('/materials/tags/subjects'),
                     api.get('/materials/tags/details')
                 ]);
-                setAllMaterials(matRes.data);
-                setFilteredMaterials(matRes.data); // 初期表示は全件
                 setSubjects(subRes.data);
                 setDetails(detRes.data);
             } catch (error) {
                 console.error("データ取得エラー", error);
             }
         };
-        fetchData();
+        fetchTags();
     }, []);
 
-    // 爆速検索のためのフロントエンド・フィルタリング処理
+    // 入力のたびにAPIを呼ばないよう、少し待ってから検索する
     useEffect(() => {
-        let result = allMaterials;
-
-        // キーワード検索
-        if (searchQuery) {
-            const lowerQuery = searchQuery.toLowerCase();
-            result = result.filter(m => 
-                m.title.toLowerCase().includes(lowerQuery) || 
-                (m.internal_memo && m.internal_memo.toLowerCase().includes(lowerQuery))
-            );
-        }
-
-        // 科目タグでの絞り込み
-        if (selectedSubjectId) {
-            result = result.filter(m => m.subjects?.some(s => s.id === selectedSubjectId));
-        }
+        const timer = setTimeout(() => setDebouncedQuery(searchQuery.trim()), 300);
+        return () => clearTimeout(timer);
+    }, [searchQuery]);
+
+    // 絞り込みはサーバー側（全文検索・タグ）で行い、ページごとに取得する
+    const fetchMaterials = async (cursor: string | null) => {
+        const params: Record<string, string | number> = { limit: PAGE_SIZE };
+        if (debouncedQuery) params.search_query = debouncedQuery;
+        if (selectedSubjectId) params.subject_id = selectedSubjectId;
+        if (selectedDetailId) params.detail_tag_id = selectedDetailId;
+        if (cursor) params.cursor = cursor;
+        const res = await api.get<TeachingMaterialList>('/materials/', { params });
+        return res.data;
+    };
 
-        // 詳細タグでの絞り込み
-        if (selectedDetailId) {
-            result = result.filter(m => m.detail_tags?.some(d => d.id === selectedDetailId));
+    useEffect(() => {
+        let cancelled = false;
+        fetchMaterials(null)
+            .then(data => {
+                if (cancelled) return;
+                setMaterials(data.items);
+                setNextCursor(data.next_cursor);
+                setTotal(data.total);
+                setFacets(data.facets);
+            })
+            .catch(error => console.error("データ取得エラー", error));
+        return () => { cancelled = true; };
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [debouncedQuery, selectedSubjectId, selectedDetailId]);
+
+    const handleLoadMore = async () => {
+        if (!nextCursor) return;
+        setIsLoadingMore(true);
+        try {
+            const data = await fetchMaterials(nextCursor);
+            setMaterials(prev => [...prev, ...data.items]);
+            setNextCursor(data.next_cursor);
+        } catch (error) {
+            console.error("データ取得エラー", error);
+        } finally {
+            setIsLoadingMore(false);
         }
+    };
 
-        setFilteredMaterials(result);
-    }, [searchQuery, selectedSubjectId, selectedDetailId, allMaterials]);
+    // 今の絞り込み結果の中で、そのタグが付いた教材の数
+    const facetCount = (kind: 'subjects' | 'detail_tags', tagId: number) =>
+        facets?.[kind].find(f => f.id === tagId)?.count ?? 0;
 
     // ★PDFを別タブで開く（認証ヘッダーを付与しつつBlobとして取得する安全な方法）
     const handlePreviewAndPrint = async (materialId: number) => {
@@ -96,7 +144,7 @@ export default function MaterialSearch() {
                     <Search className="absolute left-3 top-3 text-gray-400 w-5 h-5" />
                     <Input 
                         className="pl-10 text-lg py-6" 
-                        placeholder="教材名やメモの内容で検索..." 
+                        placeholder="教材名・タグ・メモ・PDFの本文で検索..." 
                         value={searchQuery}
                         onChange={(e) => setSearchQuery(e.target.value)}
                     />
@@ -115,7 +163,7 @@ export default function MaterialSearch() {
                                 <button
                                     key={s.id} onClick={() => setSelectedSubjectId(s.id)}
                                     className={`px-4 py-1.5 text-sm rounded-full transition-colors ${selectedSubjectId === s.id ? 'bg-blue-600 text-white' : 'bg-blue-50 text-blue-700 hover:bg-blue-100'}`}
-                                >{s.name}</button>
+                                >{s.name} <span className="opacity-70">({facetCount('subjects', s.id)})</span></button>
                             ))}
                         </div>
                     </div>
@@ -132,7 +180,7 @@ export default function MaterialSearch() {
                                 <button
                                     key={d.id} onClick={() => setSelectedDetailId(d.id)}
                                     className={`px-4 py-1.5 text-sm rounded-full transition-colors ${selectedDetailId === d.id ? 'bg-green-600 text-white' : 'bg-green-50 text-green-700 hover:bg-green-100'}`}
-                                >{d.name}</button>
+                                >{d.name} <span className="opacity-70">({facetCount('detail_tags', d.id)})</span></button>
                             ))}
                         </div>
                     </div>
@@ -140,12 +188,19 @@ export default function MaterialSearch() {
             </div>
 
             {/* --- 検索結果一覧部 --- */}
+            {total !== null && (
+                <p className="text-sm text-gray-500">{total}件の教材</p>
+            )}
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
-                {filteredMaterials.map(m => (
+                {materials.map(m => (
                     <Card key={m.id} className="hover:border-blue-300 transition-colors flex flex-col h-full">
                         <CardContent className="p-5 flex flex-col h-full">
                             <div className="flex-1 space-y-3">
+                                {m.has_thumbnail && <MaterialThumbnail materialId={m.id} />}
                                 <h3 className="font-bold text-lg text-gray-900 leading-tight">{m.title}</h3>
+                                {m.page_count != null && (
+                                    <p className="text-xs text-gray-500">{m.page_count}ページ</p>
+                                )}
                                 
                                 <div className="flex flex-wrap gap-1">
                                     {m.subjects?.map(s => <span key={s.id} className="bg-blue-100 text-blue-700 text-xs px-2 py-0.5 rounded">{s.name}</span>)}
@@ -176,12 +231,20 @@ export default function MaterialSearch() {
                     </Card>
                 ))}
 
-                {filteredMaterials.length === 0 && (
+                {materials.length === 0 && (
                     <div className="col-span-full py-12 text-center text-gray-500 bg-white rounded-lg border border-dashed">
                         該当する教材が見つかりませんでした。
                     </div>
                 )}
             </div>
+
+            {nextCursor && (
+                <div className="text-center">
+                    <Button variant="outline" onClick={handleLoadMore} disabled={isLoadingMore}>
+                        {isLoadingMore ? "読み込み中..." : "もっと見る"}
+                    </Button>
+                </div>
+            )}
         </div>
     );
 }
\ No newline at end of file
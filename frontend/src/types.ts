@@ -32,11 +32,30 @@ export interface Tag {
 export interface TeachingMaterial {
   id: number;
   title: string;
-  file_path: string;
+  file_path?: string | null;
+  original_filename?: string | null;
+  file_size?: number | null;
+  page_count?: number | null;
+  has_thumbnail?: boolean;
   internal_memo?: string;
   // ↓ここを複数形（配列）に変更しました
   subjects?: Tag[];     
   detail_tags?: Tag[];  
   created_at?: string;
   updated_at?: string;
+}
+
+export interface TagFacetCount extends Tag {
+  count: number;
+}
+
+// GET /materials/ のレスポンス（total / facets は最初のページだけ）
+export interface TeachingMaterialList {
+  items: TeachingMaterial[];
+  next_cursor: string | null;
+  total: number | null;
+  facets: {
+    subjects: TagFacetCount[];
+    detail_tags: TagFacetCount[];
+  } | null;
 }
\ No newline at end of file